@@ -0,0 +1,111 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", text.lower())).strip()
+
+
+def results_key(state, certainty_bucket=10):
+    """(cancerType, detection, riskLevel, certainty bucket) that the system prompt is built from"""
+    bucket = int(state["certainty"] // certainty_bucket) * certainty_bucket
+    return (state["cancerType"], state["detection"], state["riskLevel"], bucket)
+
+
+def char_ngrams(text, n=3):
+    padded = f" {text} "
+    return frozenset(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+
+
+def ngram_similarity(a, b):
+    """Jaccard similarity of two n-gram sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class AnswerCache:
+    """
+    Cache of first-turn chat answers keyed on the normalized question and the
+    bucketed analysis results. With `fuzzy_threshold` > 0, a miss falls back
+    to the most similar cached question (character n-gram Jaccard) for the
+    same results, so near-identical phrasings also hit.
+    """
+
+    def __init__(self, max_entries=1000, ttl_seconds=24 * 3600, fuzzy_threshold=0.0, ngram_size=3):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.fuzzy_threshold = fuzzy_threshold
+        self.ngram_size = ngram_size
+        self._entries = OrderedDict()  # (results_key, question) -> (expires_at, answer, ngrams)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _fuzzy_lookup(self, key, ngrams, now):
+        best_score, best_entry_key = 0.0, None
+        for entry_key, (expires_at, _, entry_ngrams) in self._entries.items():
+            if entry_key[0] != key or expires_at < now:
+                continue
+            score = ngram_similarity(ngrams, entry_ngrams)
+            if score > best_score:
+                best_score, best_entry_key = score, entry_key
+        if best_entry_key is not None and best_score >= self.fuzzy_threshold:
+            return best_entry_key
+        return None
+
+    def get(self, question, key):
+        question = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            entry_key = (key, question)
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[0] < now:
+                del self._entries[entry_key]
+                entry = None
+            if entry is None and self.fuzzy_threshold > 0:
+                entry_key = self._fuzzy_lookup(key, char_ngrams(question, self.ngram_size), now)
+                if entry_key is not None:
+                    entry = self._entries[entry_key]
+                    self.fuzzy_hits += 1
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, question, key, answer):
+        question = normalize_question(question)
+        with self._lock:
+            self._entries[(key, question)] = (
+                time.time() + self.ttl_seconds,
+                answer,
+                char_ngrams(question, self.ngram_size),
+            )
+            self._entries.move_to_end((key, question))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "ttl_seconds": self.ttl_seconds,
+            "fuzzy_threshold": self.fuzzy_threshold,
+        }
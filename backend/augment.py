@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+class ToUint8Tensor:
+    """HWC uint8 ndarray -> CHW uint8 tensor, leaving augmentation to BatchAugment."""
+    def __call__(self, img):
+        return torch.from_numpy(np.array(img, dtype=np.uint8, copy=True)).permute(2, 0, 1)
+
+
+class BatchAugment(nn.Module):
+    """
+    Batched, tensor-level version of train_model's PIL augmentation.
+
+    Takes a (N, 3, H, W) uint8 batch (on any device) and applies, per sample,
+    one affine warp combining random resized crop, horizontal/vertical flip,
+    rotation, translation and scale, then brightness/contrast/saturation/hue
+    jitter and ImageNet normalisation. Randomness comes from `generator` (or
+    the global torch RNG) so seeded runs stay reproducible.
+    """
+    def __init__(self, crop_scale=(0.7, 1.0), degrees=30.0, translate=0.1, scale=(0.9, 1.1),
+                 brightness=0.3, contrast=0.3, saturation=0.3, hue=0.1, generator=None):
+        super().__init__()
+        self.crop_scale = crop_scale
+        self.degrees = degrees
+        self.translate = translate
+        self.scale = scale
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.hue = hue
+        self.generator = generator
+        self.register_buffer("mean", torch.tensor(IMAGENET_MEAN).view(1, 3, 1, 1))
+        self.register_buffer("std", torch.tensor(IMAGENET_STD).view(1, 3, 1, 1))
+
+    def _uniform(self, n, low, high, device):
+        return torch.rand(n, generator=self.generator).to(device) * (high - low) + low
+
+    def _affine(self, x):
+        n, device = x.shape[0], x.device
+        # Zoom < 1 samples a smaller window of the input, i.e. a crop
+        zoom = self._uniform(n, *self.crop_scale, device).sqrt() / self._uniform(n, *self.scale, device)
+        max_offset = 1 - zoom
+        tx = self._uniform(n, -1, 1, device) * max_offset + self._uniform(n, -2 * self.translate, 2 * self.translate, device)
+        ty = self._uniform(n, -1, 1, device) * max_offset + self._uniform(n, -2 * self.translate, 2 * self.translate, device)
+        angle = self._uniform(n, -self.degrees, self.degrees, device) * math.pi / 180
+        flip_x = torch.where(self._uniform(n, 0, 1, device) < 0.5, -1.0, 1.0)
+        flip_y = torch.where(self._uniform(n, 0, 1, device) < 0.5, -1.0, 1.0)
+
+        cos, sin = angle.cos(), angle.sin()
+        theta = torch.stack([
+            torch.stack([cos * zoom * flip_x, -sin * zoom * flip_y, tx], dim=1),
+            torch.stack([sin * zoom * flip_x, cos * zoom * flip_y, ty], dim=1),
+        ], dim=1)
+        grid = F.affine_grid(theta, x.shape, align_corners=False)
+        return F.grid_sample(x, grid, mode="bilinear", padding_mode="zeros", align_corners=False)
+
+    def _jitter(self, x):
+        n, device = x.shape[0], x.device
+        view = (n, 1, 1, 1)
+        b = self._uniform(n, 1 - self.brightness, 1 + self.brightness, device).view(view)
+        x = (x * b).clamp_(0, 1)
+
+        gray = (0.299 * x[:, 0:1] + 0.587 * x[:, 1:2] + 0.114 * x[:, 2:3])
+        c = self._uniform(n, 1 - self.contrast, 1 + self.contrast, device).view(view)
+        x = ((x - gray.mean(dim=(2, 3), keepdim=True)) * c + gray.mean(dim=(2, 3), keepdim=True)).clamp_(0, 1)
+
+        gray = (0.299 * x[:, 0:1] + 0.587 * x[:, 1:2] + 0.114 * x[:, 2:3])
+        s = self._uniform(n, 1 - self.saturation, 1 + self.saturation, device).view(view)
+        x = ((x - gray) * s + gray).clamp_(0, 1)
+
+        if self.hue > 0:
+            # Hue shift as a rotation of the chroma plane in YIQ space
+            h = self._uniform(n, -self.hue, self.hue, device) * 2 * math.pi
+            y = 0.299 * x[:, 0] + 0.587 * x[:, 1] + 0.114 * x[:, 2]
+            i = 0.596 * x[:, 0] - 0.274 * x[:, 1] - 0.322 * x[:, 2]
+            q = 0.211 * x[:, 0] - 0.523 * x[:, 1] + 0.312 * x[:, 2]
+            cos, sin = h.cos().view(n, 1, 1), h.sin().view(n, 1, 1)
+            i, q = i * cos - q * sin, i * sin + q * cos
+            x = torch.stack([
+                y + 0.956 * i + 0.621 * q,
+                y - 0.272 * i - 0.647 * q,
+                y - 1.106 * i + 1.703 * q,
+            ], dim=1).clamp_(0, 1)
+        return x
+
+    @torch.no_grad()
+    def forward(self, x):
+        x = x.float().div_(255)
+        x = self._affine(x)
+        x = self._jitter(x)
+        return (x - self.mean) / self.std
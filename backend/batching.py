@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+
+
+class QueueFullError(RuntimeError):
+    """Raised by MicroBatcher.submit when the pending queue is at capacity."""
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent requests into one batch before calling `batch_fn`.
+
+    A batch is flushed once it holds `max_batch_size` items or `max_wait_ms`
+    has passed since its first item arrived. `batch_fn` takes a list of items
+    and returns a list of results in the same order; a result that is an
+    Exception is raised to that item's caller only, and a result list of the
+    wrong length fails every caller in the batch.
+
+    `batch_fn` runs on `executor` (the loop's default executor if None) so the
+    event loop stays free. At most `max_queue_size` items may wait; beyond
+    that `submit` raises QueueFullError instead of queueing.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=10.0, executor=None, max_queue_size=0):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self.max_queue_size = max_queue_size
+        self._queue = None
+        self._worker = None
+        self.batches_run = 0
+        self.items_run = 0
+        self.rejected = 0
+        self.batch_size_counts = {}
+
+    async def start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, item):
+        """Queue one item and wait for its result."""
+        if self._worker is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((item, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f"Inference queue is full ({self.max_queue_size} pending)")
+        return await future
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _collect(self):
+        """Wait for the first item, then fill the batch until full or the window closes."""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.batch_fn, items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"batch_fn returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                results = [e] * len(items)
+
+            self.batches_run += 1
+            self.items_run += len(items)
+            self.batch_size_counts[len(items)] = self.batch_size_counts.get(len(items), 0) + 1
+
+            for (_, future), result in zip(batch, results):
+                if future.done():  # caller went away
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches_run,
+            "items": self.items_run,
+            "mean_batch_size": self.items_run / self.batches_run if self.batches_run else 0.0,
+            "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+            "queue_depth": self.queue_depth(),
+            "max_queue_size": self.max_queue_size,
+            "rejected": self.rejected,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
+
+
+class InFlightLimit:
+    """
+    Caps how many requests may be in flight on a path that skips the
+    MicroBatcher, e.g. tiled slides that batch their own tiles. Entering it
+    with `max_in_flight` requests already inside raises QueueFullError
+    (0 = no cap). Only used from the event loop, so the count needs no lock.
+    """
+
+    def __init__(self, max_in_flight=0):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.rejected = 0
+
+    def __enter__(self):
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            raise QueueFullError(f"Inference queue is full ({self.max_in_flight} in flight)")
+        self.in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+
+    def stats(self):
+        return {"in_flight": self.in_flight, "max_in_flight": self.max_in_flight, "rejected": self.rejected}
+
+
+class ViewBudget:
+    """
+    Chooses how many test-time augmentation views a batch gets.
+
+    Keeps a moving average of the model cost per image-view and picks the
+    most views (between min_views and max_views) whose estimated cost for
+    the batch plus the uploads still queued behind it fits in `budget_ms`.
+    Under load the view count drops so the queue drains; with budget_ms=0
+    every batch gets max_views.
+    """
+
+    def __init__(self, max_views, budget_ms=0.0, min_views=1, smoothing=0.2):
+        self.max_views = max_views
+        self.min_views = min(min_views, max_views)
+        self.budget_ms = budget_ms
+        self.smoothing = smoothing
+        self.ms_per_view = None
+        self.view_counts = {}
+        self._lock = threading.Lock()
+
+    def choose(self, batch_size, queue_depth=0):
+        views = self.max_views
+        if self.budget_ms and self.ms_per_view:
+            affordable = int(self.budget_ms / (self.ms_per_view * (batch_size + queue_depth)))
+            views = max(self.min_views, min(self.max_views, affordable))
+        with self._lock:
+            self.view_counts[views] = self.view_counts.get(views, 0) + 1
+        return views
+
+    def record(self, images, views, seconds):
+        """Feed back the measured time of a batch of `images` x `views`."""
+        cost = seconds * 1000.0 / (images * views)
+        with self._lock:
+            if self.ms_per_view is None:
+                self.ms_per_view = cost
+            else:
+                self.ms_per_view += self.smoothing * (cost - self.ms_per_view)
+
+    def stats(self):
+        return {
+            "budget_ms": self.budget_ms,
+            "min_views": self.min_views,
+            "max_views": self.max_views,
+            "ms_per_view": self.ms_per_view,
+            "view_counts": dict(sorted(self.view_counts.items())),
+        }
@@ -0,0 +1,70 @@
+"""
+Answer-cache lookup latency and hit rate on a mix of common first-turn questions.
+
+Replays paraphrased questions against a warmed cache for a few results tuples
+and reports exact/fuzzy hit rates and lookup latency (vs an LLM round trip).
+
+    python -m benchmarks.answer_cache --fuzzy 0.6
+"""
+import argparse
+import random
+import time
+
+from answer_cache import AnswerCache, results_key
+from benchmarks.common import dump_json, summarize
+
+SEED_QUESTIONS = [
+    "What does malignant mean?",
+    "What should I do next?",
+    "How accurate is this result?",
+    "What does the heatmap show?",
+    "Should I be worried?",
+]
+PARAPHRASES = [
+    "what does malignant mean",
+    "What does 'malignant' mean??",
+    "what should i do next?",
+    "What should I do now?",
+    "how accurate is this result",
+    "How accurate are these results?",
+    "What does the heat map show?",
+    "should i be worried",
+    "Is this something to worry about?",
+]
+RESULTS = [
+    {"cancerType": "breast cancer", "detection": "malignant", "riskLevel": "high", "certainty": 91.3},
+    {"cancerType": "breast cancer", "detection": "benign", "riskLevel": "low", "certainty": 84.0},
+    {"cancerType": "breast cancer", "detection": "malignant", "riskLevel": "medium", "certainty": 55.2},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fuzzy", type=float, default=0.6)
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    cache = AnswerCache(fuzzy_threshold=args.fuzzy)
+    for state in RESULTS:
+        for q in SEED_QUESTIONS:
+            cache.put(q, results_key(state), f"Cached answer to '{q}'")
+
+    rng = random.Random(0)
+    latencies = []
+    for _ in range(args.lookups):
+        q = rng.choice(PARAPHRASES)
+        key = results_key(rng.choice(RESULTS))
+        start = time.perf_counter()
+        cache.get(q, key)
+        latencies.append(time.perf_counter() - start)
+
+    stats = cache.stats()
+    lookup = summarize(latencies)
+    print(f"hit rate {stats['hit_rate'] * 100:.1f}% (fuzzy hits {stats['fuzzy_hits']}) | "
+          f"lookup p50 {lookup['p50_ms'] * 1000:.1f} us, p99 {lookup['p99_ms'] * 1000:.1f} us")
+    dump_json({"fuzzy_threshold": args.fuzzy, "cache": stats, "lookup": lookup}, args.json)
+
+
+if __name__ == "__main__":
+    main()
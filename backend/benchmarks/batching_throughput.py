@@ -0,0 +1,77 @@
+"""
+Throughput and p50/p99 latency of the /predict micro-batcher per batch size.
+
+Each run keeps `2 * batch_size` concurrent clients submitting synthetic
+uploads through a MicroBatcher wrapping the real decode/predict/Grad-CAM
+pipeline on a randomly initialised ResNet18.
+
+    python -m benchmarks.batching_throughput --sizes 1 2 4 8 16 32
+"""
+import argparse
+import asyncio
+import time
+
+import torch
+
+from batching import MicroBatcher
+from benchmarks.common import build_resnet18, dump_json, summarize, synthetic_image_bytes
+from explainability import GradCAM
+from inference import predict_bytes_batch
+
+
+async def _client(batcher, image_bytes, requests, latencies):
+    for _ in range(requests):
+        start = time.perf_counter()
+        await batcher.submit(image_bytes)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_one(explainer, image_bytes, batch_size, window_ms, requests_per_client):
+    batcher = MicroBatcher(lambda items: predict_bytes_batch(explainer, items),
+                           max_batch_size=batch_size, max_wait_ms=window_ms)
+    await batcher.start()
+    clients = 2 * batch_size
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[_client(batcher, image_bytes, requests_per_client, latencies)
+                           for _ in range(clients)])
+    elapsed = time.perf_counter() - start
+    await batcher.stop()
+
+    result = summarize(latencies)
+    result.update({
+        "batch_size": batch_size,
+        "clients": clients,
+        "throughput_img_s": len(latencies) / elapsed,
+        "mean_batch_size": batcher.stats()["mean_batch_size"],
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--window-ms", type=float, default=10.0)
+    parser.add_argument("--requests-per-client", type=int, default=8)
+    parser.add_argument("--width", type=int, default=700)
+    parser.add_argument("--height", type=int, default=460)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = build_resnet18()
+    explainer = GradCAM(model, model.layer4[-1])
+    image_bytes = synthetic_image_bytes(args.width, args.height)
+
+    rows = []
+    print(f"{'batch':>5} {'clients':>7} {'img/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'avg batch':>9}")
+    for size in args.sizes:
+        r = asyncio.run(run_one(explainer, image_bytes, size, args.window_ms, args.requests_per_client))
+        rows.append(r)
+        print(f"{size:>5} {r['clients']:>7} {r['throughput_img_s']:>8.1f} {r['p50_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['mean_batch_size']:>9.2f}")
+    dump_json({"window_ms": args.window_ms, "results": rows}, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Time-to-first-token vs total time for /chat and /chat/stream.
+
+Run the server against the local fake model so the numbers are repeatable:
+
+    LIFELENS_CHAT_MODEL=fake LIFELENS_FAKE_FIRST_TOKEN_DELAY=0.5 \\
+        LIFELENS_FAKE_TOKEN_DELAY=0.02 uvicorn main:app --port 8080
+    python -m benchmarks.chat_streaming --url http://127.0.0.1:8080 --requests 20
+"""
+import argparse
+import json
+import time
+
+import httpx
+
+from benchmarks.common import dump_json, summarize
+
+
+def time_blocking(client, message):
+    start = time.perf_counter()
+    r = client.post("/chat", json={"message": message})
+    r.raise_for_status()
+    total = time.perf_counter() - start
+    # The whole reply arrives at once: first token == total
+    return total, total
+
+
+def time_streaming(client, message):
+    start = time.perf_counter()
+    first = None
+    server_timings = None
+    with client.stream("POST", "/chat/stream", json={"message": message}) as r:
+        r.raise_for_status()
+        event = None
+        for line in r.iter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: "):
+                data = json.loads(line[6:])
+                if first is None and "token" in data:
+                    first = time.perf_counter() - start
+                if event == "done":
+                    server_timings = data.get("timings")
+                event = None
+    total = time.perf_counter() - start
+    return (first if first is not None else total), total, server_timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--message", default="What does this result mean?")
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    results = {}
+    with httpx.Client(base_url=args.url, timeout=120.0) as client:
+        ttft, total = zip(*[time_blocking(client, args.message) for _ in range(args.requests)])
+        results["chat"] = {"ttft": summarize(ttft), "total": summarize(total)}
+
+        runs = [time_streaming(client, args.message) for _ in range(args.requests)]
+        ttft, total, server = zip(*runs)
+        results["chat_stream"] = {"ttft": summarize(ttft), "total": summarize(total),
+                                  "server_timings": [t for t in server if t]}
+
+    for name in ("chat", "chat_stream"):
+        r = results[name]
+        print(f"/{name.replace('_', '/'):<12} ttft p50 {r['ttft']['p50_ms']:8.1f} ms | "
+              f"total p50 {r['total']['p50_ms']:8.1f} ms")
+    dump_json(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
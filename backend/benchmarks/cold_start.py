@@ -0,0 +1,85 @@
+"""
+Server cold start: import time, model load time and time to first prediction.
+
+For each warmup setting this starts a fresh `uvicorn main:app` process and
+records:
+  import_s       `import main` on its own, in a separate interpreter
+  health_s       process start until /health answers (server accepting traffic)
+  ready_s        process start until /ready turns 200
+  timings        the server's own breakdown (chat_model_s, model_load_s, warmup_s)
+  first_predict  latency of the first /predict after /ready
+  second_predict latency of the next (different) upload, i.e. steady state
+
+Without --weights a randomly initialised checkpoint is used, and the chat
+model defaults to the local fake so no API key is needed.
+
+    python -m benchmarks.cold_start --warmups "1,16" ""
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import dump_json, random_weights_file, running_server, synthetic_image_bytes, wait_for
+
+
+def measure_import(env):
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def run_once(env, port, timeout):
+    start = time.perf_counter()
+    with running_server(env, port) as url, httpx.Client(base_url=url, timeout=120.0) as client:
+        deadline = start + timeout
+        wait_for(client, "/health", 200, deadline)
+        health_s = time.perf_counter() - start
+        ready = wait_for(client, "/ready", 200, deadline).json()
+        ready_s = time.perf_counter() - start
+
+        latencies = []
+        for seed in (1, 2):
+            files = {"file": ("slide.png", synthetic_image_bytes(seed=seed), "image/png")}
+            t = time.perf_counter()
+            client.post("/predict", files=files).raise_for_status()
+            latencies.append(time.perf_counter() - t)
+    return {"health_s": health_s, "ready_s": ready_s, "timings": ready["timings"],
+            "first_predict_ms": latencies[0] * 1000, "second_predict_ms": latencies[1] * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--weights", default=None, help="served checkpoint (default: random weights)")
+    parser.add_argument("--warmups", nargs="+", default=["1,16", ""],
+                        help="LIFELENS_WARMUP_BATCH_SIZES values to compare ('' disables warmup)")
+    parser.add_argument("--chat-model", default="fake", help="LIFELENS_CHAT_MODEL for the server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    weights = args.weights or random_weights_file()
+    base_env = {**os.environ, "LIFELENS_WEIGHTS_PATH": os.path.abspath(weights),
+                "LIFELENS_CHAT_MODEL": args.chat_model}
+
+    import_s = measure_import(base_env)
+    print(f"import main: {import_s * 1000:.0f} ms")
+    results = []
+    for warmup in args.warmups:
+        env = {**base_env, "LIFELENS_WARMUP_BATCH_SIZES": warmup}
+        r = {"warmup_batch_sizes": warmup, **run_once(env, args.port, args.timeout)}
+        results.append(r)
+        t = r["timings"]
+        print(f"warmup [{warmup or 'none'}]: /health {r['health_s']:.2f}s | /ready {r['ready_s']:.2f}s "
+              f"(chat {t.get('chat_model_s', 0):.2f}s, load {t.get('model_load_s', 0):.2f}s, "
+              f"warmup {t.get('warmup_s', 0):.2f}s) | first predict {r['first_predict_ms']:.0f} ms, "
+              f"second {r['second_predict_ms']:.0f} ms")
+    dump_json({"import_s": import_s, "results": results}, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Shared helpers for the backend benchmarks (run from backend/: python -m benchmarks.<name>)."""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def build_resnet18(num_classes=2):
+    """Randomly initialised ResNet18 with the serving head; no checkpoint needed."""
+    import torch
+    from torchvision.models import resnet18
+
+    model = resnet18(weights=None)
+    model.fc = torch.nn.Linear(model.fc.in_features, num_classes)
+    return model.eval()
+
+
+def summarize(latencies_s):
+    """p50/p90/p99/mean in milliseconds for a list of durations in seconds."""
+    ms = np.asarray(latencies_s, dtype=np.float64) * 1000.0
+    return {
+        "count": int(ms.size),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def dump_json(results, path):
+    if path:
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {path}")
+
+
+def synthetic_image(width=700, height=460, seed=0):
+    """Random RGB uint8 image shaped like a BreaKHis slide."""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+
+def synthetic_image_bytes(width=700, height=460, seed=0, ext=".png"):
+    """Encoded synthetic image, as it would arrive in an upload."""
+    import cv2
+
+    ok, buf = cv2.imencode(ext, synthetic_image(width, height, seed))
+    assert ok
+    return buf.tobytes()
+
+
+def make_synthetic_breakhis(root, images_per_folder=50, width=700, height=460, ext=".png"):
+    """
+    Write a BreaKHis-shaped tree (<root>/<benign|malignant>/<train|val|test>/)
+    of random images; filenames carry a magnification like the real dataset.
+    """
+    import os
+
+    import cv2
+
+    magnifications = (40, 100, 200, 400)
+    for class_name, tag in (("benign", "B"), ("malignant", "M")):
+        for split in ("train", "val", "test"):
+            folder = os.path.join(root, class_name, split)
+            os.makedirs(folder, exist_ok=True)
+            for i in range(images_per_folder):
+                mag = magnifications[i % len(magnifications)]
+                path = os.path.join(folder, f"SOB_{tag}_X-14-{i:05d}-{mag}-{i % 30 + 1:03d}{ext}")
+                if not os.path.exists(path):
+                    cv2.imwrite(path, cv2.cvtColor(synthetic_image(width, height, seed=i), cv2.COLOR_RGB2BGR))
+    return root
+
+
+def random_weights_file(directory=None):
+    """Save a randomly initialised ResNet18 checkpoint (the served architecture) and return its path."""
+    import torch
+
+    path = os.path.join(directory or tempfile.mkdtemp(), "random_resnet18.pth")
+    torch.save(build_resnet18().state_dict(), path)
+    return path
+
+
+def wait_for(client, path, status, deadline):
+    """Poll an httpx.Client until `path` returns `status`; TimeoutError after `deadline` (perf_counter)."""
+    import httpx
+
+    while time.perf_counter() < deadline:
+        try:
+            r = client.get(path)
+            if r.status_code == status:
+                return r
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    raise TimeoutError(f"{path} did not return {status}")
+
+
+@contextmanager
+def running_server(env, port):
+    """`uvicorn main:app` in a subprocess on 127.0.0.1:`port`; yields its base URL and stops it on exit."""
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.terminate()
+        server.wait()
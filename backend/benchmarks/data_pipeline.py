@@ -0,0 +1,101 @@
+"""
+Training input-pipeline throughput (images/sec) across DataLoader worker counts.
+
+pil     : train_model's per-sample PIL augmentation inside the workers
+batched : workers only hand over uint8 tensors; BatchAugment runs on the batch
+
+"load" times iterating the loader alone (plus BatchAugment for batched);
+"step" also runs a ResNet18 forward/backward so you can see when the
+pipeline stops being the bottleneck. Without --root a synthetic tree is
+generated under --synthetic-dir.
+
+    python -m benchmarks.data_pipeline --workers 0 2 4 8 --batches 20
+"""
+import argparse
+import time
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+from benchmarks.common import build_resnet18, dump_json, make_synthetic_breakhis
+from process_data import CancerDataset
+from train_model import get_device, loader_kwargs, make_batch_augment, make_transforms
+
+
+def make_loader(mode, root, batch_size, num_workers, device, cache_dir):
+    if mode == "batched":
+        transform, augment = make_batch_augment(device)
+    else:
+        transform, augment = make_transforms()[0], None
+    dataset = CancerDataset("train", transform=transform, root=root, cache_dir=cache_dir)
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, drop_last=True,
+                        **loader_kwargs(num_workers, device))
+    return loader, augment
+
+
+def run(mode, root, batch_size, num_workers, batches, device, cache_dir, model=None):
+    loader, augment = make_loader(mode, root, batch_size, num_workers, device, cache_dir)
+    if model is not None:
+        criterion = nn.CrossEntropyLoss()
+        optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+        model.train()
+
+    it = iter(loader)
+    next(it)  # exclude worker start-up from the steady-state number
+    seen, start = 0, time.perf_counter()
+    for _ in range(batches):
+        try:
+            x, y = next(it)
+        except StopIteration:
+            break
+        x, y = x.to(device, non_blocking=True), y.to(device, non_blocking=True)
+        if augment is not None:
+            x = augment(x)
+        if model is not None:
+            optimizer.zero_grad()
+            criterion(model(x), y).backward()
+            optimizer.step()
+        seen += x.shape[0]
+    elapsed = time.perf_counter() - start
+    return {"images": seen, "seconds": elapsed, "images_per_s": seen / elapsed if elapsed else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--root", default=None, help="real dataset_split folder (default: synthetic)")
+    parser.add_argument("--synthetic-dir", default="bench_data/breakhis")
+    parser.add_argument("--images-per-folder", type=int, default=400)
+    parser.add_argument("--cache-dir", default=None, help="read from tensor_cache memmaps instead of decoding")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4, 8])
+    parser.add_argument("--modes", nargs="+", default=["pil", "batched"], choices=["pil", "batched"])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--no-step", action="store_true", help="skip the end-to-end training-step runs")
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    root = args.root or args.synthetic_dir
+    if not args.root:
+        make_synthetic_breakhis(root, args.images_per_folder)
+    device = get_device()
+    print(f"device={device} batch_size={args.batch_size} batches={args.batches}")
+
+    results = []
+    for mode in args.modes:
+        for workers in args.workers:
+            load = run(mode, root, args.batch_size, workers, args.batches, device, args.cache_dir)
+            row = {"mode": mode, "workers": workers, "load": load}
+            line = f"{mode:>7} workers={workers}: load {load['images_per_s']:7.1f} img/s"
+            if not args.no_step:
+                model = build_resnet18().to(device)
+                step = run(mode, root, args.batch_size, workers, args.batches, device, args.cache_dir, model)
+                row["step"] = step
+                line += f" | step {step['images_per_s']:7.1f} img/s"
+            results.append(row)
+            print(line)
+    dump_json({"root": root, "device": str(device), "batch_size": args.batch_size, "results": results}, args.json)
+
+
+if __name__ == "__main__":
+    main()
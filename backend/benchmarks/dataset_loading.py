@@ -0,0 +1,93 @@
+"""
+Peak RSS and time-to-first-batch: eager import-time loading vs lazy CancerDataset.
+
+eager : the previous process_data behaviour - decode and resize all six
+        BreaKHis folders into Python lists before the test loader exists
+lazy  : CancerDataset("test") indexes paths and decodes in __getitem__
+
+Each mode runs in a fresh subprocess so peak RSS is measured independently.
+Without --root a synthetic tree is generated under --synthetic-dir.
+
+    python -m benchmarks.dataset_loading --images-per-folder 200
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.common import dump_json, make_synthetic_breakhis
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_child(mode, root, batch_size):
+    from torch.utils.data import DataLoader
+    from process_data import CancerDataset, list_split, load_image, val_test_transform
+
+    start = time.perf_counter()
+    if mode == "eager":
+        data = {}
+        for split in ("train", "val", "test"):
+            paths, labels = list_split(split, root)
+            data[split] = [[load_image(p), y] for p, y in zip(paths, labels)]
+
+        class ListDataset:
+            def __init__(self, items):
+                self.items = items
+
+            def __len__(self):
+                return len(self.items)
+
+            def __getitem__(self, idx):
+                img, label = self.items[idx]
+                return val_test_transform(img), label
+
+        dataset = ListDataset(data["test"])
+    else:
+        dataset = CancerDataset("test", transform=val_test_transform, root=root)
+
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False)
+    next(iter(loader))
+    first_batch_s = time.perf_counter() - start
+    print(json.dumps({"mode": mode, "time_to_first_batch_s": first_batch_s, "peak_rss_mb": peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--root", default=None, help="real dataset_split folder (default: synthetic)")
+    parser.add_argument("--synthetic-dir", default="bench_data/breakhis")
+    parser.add_argument("--images-per-folder", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--child", choices=["eager", "lazy"], default=None)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    root = args.root or args.synthetic_dir
+    if args.child:
+        run_child(args.child, root, args.batch_size)
+        return
+    if not args.root:
+        make_synthetic_breakhis(root, args.images_per_folder)
+
+    results = []
+    for mode in ("eager", "lazy"):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.dataset_loading", "--child", mode,
+             "--root", root, "--batch-size", str(args.batch_size)],
+            check=True, capture_output=True, text=True, cwd=os.getcwd(),
+        ).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        results.append(r)
+        print(f"{mode:>5}: time to first batch {r['time_to_first_batch_s']:.2f} s | peak RSS {r['peak_rss_mb']:.0f} MB")
+    dump_json({"root": root, "results": results}, args.json)
+
+
+if __name__ == "__main__":
+    main()
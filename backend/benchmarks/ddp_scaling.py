@@ -0,0 +1,99 @@
+"""
+Data-parallel training scaling on one machine: 1/2/4/8 gloo processes.
+
+Each run launches torchrun --standalone with N processes; every process
+trains one epoch of the same train split (so each rank handles 1/N of it,
+i.e. strong scaling) through train_model's DDP path with the host's cores
+divided between ranks. Rank 0 prints images/sec as JSON. Without --root a
+synthetic tree is generated under --synthetic-dir.
+
+    python -m benchmarks.ddp_scaling --procs 1 2 4 8 --images-per-folder 128
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import dump_json, make_synthetic_breakhis
+
+
+def run_child(root, batch_size, workers, epochs):
+    import torch
+    import torch.nn as nn
+
+    from benchmarks.common import build_resnet18
+    from distributed import cleanup_distributed, init_distributed, is_main_process
+    from train_model import SEED, make_dataloaders, make_transforms, seed_everything, train_one_epoch
+
+    rank, world_size, _ = init_distributed("gloo")
+    try:
+        seed_everything(SEED + rank)
+        train_tf, val_tf = make_transforms()
+        train_loader, _, dataset = make_dataloaders(train_tf, val_tf, batch_size=batch_size, num_workers=workers,
+                                                    root=root, rank=rank, world_size=world_size)
+        model = build_resnet18()
+        if world_size > 1:
+            model = nn.parallel.DistributedDataParallel(model)
+        criterion = nn.CrossEntropyLoss()
+        optimizer = torch.optim.AdamW(model.parameters(), lr=1e-4)
+
+        seconds = 0.0
+        for epoch in range(epochs):
+            if world_size > 1:
+                train_loader.sampler.set_epoch(epoch)
+                torch.distributed.barrier()
+            start = time.perf_counter()
+            train_one_epoch(model, train_loader, criterion, optimizer, "cpu")
+            seconds += time.perf_counter() - start
+        if is_main_process():
+            images = len(dataset) * epochs
+            print(json.dumps({"processes": world_size, "threads_per_process": torch.get_num_threads(),
+                              "images": images, "seconds": seconds, "images_per_s": images / seconds}))
+    finally:
+        cleanup_distributed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--root", default=None, help="real dataset_split folder (default: synthetic)")
+    parser.add_argument("--synthetic-dir", default="bench_data/breakhis")
+    parser.add_argument("--images-per-folder", type=int, default=128)
+    parser.add_argument("--procs", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--batch-size", type=int, default=16, help="per process")
+    parser.add_argument("--workers", type=int, default=1, help="DataLoader workers per process")
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--child", action="store_true")
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    root = args.root or args.synthetic_dir
+    if args.child:
+        run_child(root, args.batch_size, args.workers, args.epochs)
+        return
+    if not args.root:
+        make_synthetic_breakhis(root, args.images_per_folder)
+
+    results = []
+    for procs in args.procs:
+        out = subprocess.run(
+            [sys.executable, "-m", "torch.distributed.run", "--standalone", f"--nproc_per_node={procs}",
+             "-m", "benchmarks.ddp_scaling", "--child", "--root", root, "--batch-size", str(args.batch_size),
+             "--workers", str(args.workers), "--epochs", str(args.epochs)],
+            check=True, capture_output=True, text=True, cwd=os.getcwd(),
+            # torchrun defaults to OMP_NUM_THREADS=1 for multi-process runs; give each rank its share instead
+            env={**os.environ, "OMP_NUM_THREADS": str(max(1, (os.cpu_count() or 1) // procs))},
+        ).stdout
+        r = json.loads([line for line in out.splitlines() if line.startswith("{")][-1])
+        r["speedup"] = r["images_per_s"] / results[0]["images_per_s"] if results else 1.0
+        r["efficiency"] = r["speedup"] / (procs / args.procs[0])
+        results.append(r)
+        print(f"{procs} process(es) x {r['threads_per_process']} threads: {r['images_per_s']:7.1f} img/s | "
+              f"speedup {r['speedup']:.2f}x | efficiency {r['efficiency'] * 100:.0f}%")
+    dump_json({"root": root, "cpu_count": os.cpu_count(), "batch_size_per_process": args.batch_size,
+               "results": results}, args.json)
+
+
+if __name__ == "__main__":
+    main()
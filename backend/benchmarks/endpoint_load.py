@@ -0,0 +1,132 @@
+"""
+End-to-end load test of /predict and /chat at several concurrency levels.
+
+Starts `uvicorn main:app` with a randomly initialised checkpoint (unless
+--weights is given), the local fake chat model and the prediction cache
+disabled, so every upload runs the model. At each concurrency level, that
+many clients send --requests-per-client requests back to back, and each
+client uses its own session. Results have requests/sec, latency
+percentiles and status counts per endpoint. They also include the server's
+mean time per stage, taken from the /metrics histograms for that level.
+
+    python -m benchmarks.endpoint_load --concurrency 1 4 16 64 --endpoints predict chat
+"""
+import argparse
+import asyncio
+import os
+import re
+import secrets
+import time
+
+import httpx
+
+from benchmarks.common import (dump_json, random_weights_file, running_server, summarize,
+                               synthetic_image_bytes, wait_for)
+
+_STAGE_LINE = re.compile(r'^lifelens_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$')
+
+
+def stage_totals(metrics_text):
+    """{stage: [seconds, count]} from a /metrics scrape."""
+    totals = {}
+    for line in metrics_text.splitlines():
+        match = _STAGE_LINE.match(line)
+        if match:
+            kind, stage, value = match.groups()
+            totals.setdefault(stage, [0.0, 0])[kind == "count"] = float(value)
+    return totals
+
+
+def stage_means_ms(before, after):
+    means = {}
+    for stage, (seconds, count) in after.items():
+        prev_seconds, prev_count = before.get(stage, (0.0, 0))
+        if count > prev_count:
+            means[stage] = (seconds - prev_seconds) / (count - prev_count) * 1000
+    return means
+
+
+async def predict_client(client, uploads, offset, requests, latencies, statuses):
+    headers = {"X-Session-Id": secrets.token_urlsafe(24)}
+    for i in range(requests):
+        image_bytes = uploads[(offset + i) % len(uploads)]
+        start = time.perf_counter()
+        r = await client.post("/predict", files={"file": ("slide.png", image_bytes, "image/png")}, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+
+async def chat_client(client, offset, requests, latencies, statuses):
+    headers = {"X-Session-Id": secrets.token_urlsafe(24)}
+    for i in range(requests):
+        start = time.perf_counter()
+        r = await client.post("/chat", json={"message": f"What does result {offset}-{i} mean?"}, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+
+async def run_level(url, endpoint, concurrency, requests_per_client, uploads):
+    latencies, statuses = [], {}
+    limits = httpx.Limits(max_connections=concurrency + 2)
+    async with httpx.AsyncClient(base_url=url, timeout=300.0, limits=limits) as client:
+        before = stage_totals((await client.get("/metrics")).text)
+        start = time.perf_counter()
+        if endpoint == "predict":
+            clients = [predict_client(client, uploads, c * requests_per_client, requests_per_client, latencies, statuses)
+                       for c in range(concurrency)]
+        else:
+            clients = [chat_client(client, c, requests_per_client, latencies, statuses) for c in range(concurrency)]
+        await asyncio.gather(*clients)
+        elapsed = time.perf_counter() - start
+        after = stage_totals((await client.get("/metrics")).text)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests_per_s": len(latencies) / elapsed,
+        "latency": summarize(latencies),
+        "status_counts": {str(k): v for k, v in sorted(statuses.items())},
+        "server_stage_mean_ms": stage_means_ms(before, after),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--weights", default=None, help="served checkpoint (default: random weights)")
+    parser.add_argument("--endpoints", nargs="+", default=["predict", "chat"], choices=["predict", "chat"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests-per-client", type=int, default=4)
+    parser.add_argument("--distinct-uploads", type=int, default=32)
+    parser.add_argument("--fake-first-token-delay", type=float, default=0.05)
+    parser.add_argument("--fake-token-delay", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    env = {
+        **os.environ,
+        "LIFELENS_WEIGHTS_PATH": os.path.abspath(args.weights or random_weights_file()),
+        "LIFELENS_CHAT_MODEL": "fake",
+        "LIFELENS_FAKE_FIRST_TOKEN_DELAY": str(args.fake_first_token_delay),
+        "LIFELENS_FAKE_TOKEN_DELAY": str(args.fake_token_delay),
+        "LIFELENS_CACHE_MAX_MB": "0",
+        "LIFELENS_TELEMETRY": "1",
+    }
+    uploads = [synthetic_image_bytes(seed=seed) for seed in range(args.distinct_uploads)]
+
+    results = []
+    with running_server(env, args.port) as url:
+        with httpx.Client(base_url=url, timeout=60.0) as client:
+            wait_for(client, "/ready", 200, time.perf_counter() + args.timeout)
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                r = asyncio.run(run_level(url, endpoint, concurrency, args.requests_per_client, uploads))
+                results.append(r)
+                print(f"/{endpoint:<7} x{concurrency:>3}: {r['requests_per_s']:7.1f} req/s | "
+                      f"p50 {r['latency']['p50_ms']:7.1f} ms | p99 {r['latency']['p99_ms']:7.1f} ms | "
+                      f"status {r['status_counts']}")
+    dump_json({"requests_per_client": args.requests_per_client, "results": results}, args.json)
+
+
+if __name__ == "__main__":
+    main()
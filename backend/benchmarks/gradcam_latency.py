@@ -0,0 +1,70 @@
+"""
+Regression benchmark: per-request Grad-CAM latency must stay flat.
+
+Runs N single-image explain calls against one long-lived GradCAM and compares
+the first and last windows. `--legacy` rebuilds the explainer on every call
+without removing its hooks (the old /predict behaviour) to show the drift.
+
+    python -m benchmarks.gradcam_latency --calls 10000
+"""
+import argparse
+import sys
+
+import torch
+
+from benchmarks.common import build_resnet18, dump_json, summarize, timed
+from explainability import GradCAM
+
+
+def run(calls=10000, window=1000, legacy=False, max_drift=0.15):
+    torch.manual_seed(0)
+    model = build_resnet18()
+    x = torch.randn(1, 3, 224, 224)
+    explainer = None if legacy else GradCAM(model, model.layer4[-1])
+
+    latencies = []
+    for i in range(calls):
+        if legacy:
+            cam_fn = GradCAM(model, model.layer4[-1]).explain
+        else:
+            cam_fn = explainer.explain
+        _, elapsed = timed(cam_fn, x)
+        latencies.append(elapsed)
+        if (i + 1) % window == 0:
+            print(f"{i + 1:>6} calls | last window p50 {summarize(latencies[-window:])['p50_ms']:.2f} ms")
+
+    first = summarize(latencies[:window])
+    last = summarize(latencies[-window:])
+    drift = (last["p50_ms"] - first["p50_ms"]) / first["p50_ms"]
+    return {
+        "calls": calls,
+        "legacy": legacy,
+        "first_window": first,
+        "last_window": last,
+        "p50_drift": drift,
+        "hooks_on_layer": len(model.layer4[-1]._forward_hooks),
+        "passed": drift <= max_drift,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=10000)
+    parser.add_argument("--window", type=int, default=1000)
+    parser.add_argument("--legacy", action="store_true")
+    parser.add_argument("--max-drift", type=float, default=0.15,
+                        help="allowed relative p50 growth between first and last window")
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    results = run(args.calls, min(args.window, args.calls), args.legacy, args.max_drift)
+    print(f"First window p50: {results['first_window']['p50_ms']:.2f} ms | "
+          f"Last window p50: {results['last_window']['p50_ms']:.2f} ms | "
+          f"drift {results['p50_drift'] * 100:+.1f}% | hooks on layer4[-1]: {results['hooks_on_layer']}")
+    dump_json(results, args.json)
+    if not results["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Load test: /health latency while /predict is saturated.
+
+Start the server first (uvicorn main:app --port 8080), then:
+
+    python -m benchmarks.health_under_load --url http://127.0.0.1:8080 --clients 64
+
+`--clients` upload loops hammer /predict while one probe polls /health every
+`--probe-interval-ms`. Passes if /health p99 stays under `--budget-ms`.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import dump_json, summarize, synthetic_image_bytes
+
+
+async def _uploader(client, image_bytes, stop, status_counts):
+    while not stop.is_set():
+        files = {"file": ("slide.png", image_bytes, "image/png")}
+        try:
+            r = await client.post("/predict", files=files)
+            status_counts[r.status_code] = status_counts.get(r.status_code, 0) + 1
+        except httpx.HTTPError:
+            status_counts["error"] = status_counts.get("error", 0) + 1
+
+
+async def _prober(client, duration, interval, latencies):
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        await client.get("/health")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+
+async def run(url, clients, duration, interval_ms, image_bytes):
+    stop = asyncio.Event()
+    status_counts, latencies = {}, []
+    limits = httpx.Limits(max_connections=clients + 4)
+    async with httpx.AsyncClient(base_url=url, timeout=60.0, limits=limits) as upload_client, \
+            httpx.AsyncClient(base_url=url, timeout=10.0) as probe_client:
+        uploaders = [asyncio.create_task(_uploader(upload_client, image_bytes, stop, status_counts))
+                     for _ in range(clients)]
+        await asyncio.sleep(1.0)  # let the queue fill up
+        await _prober(probe_client, duration, interval_ms / 1000.0, latencies)
+        stop.set()
+        await asyncio.gather(*uploaders, return_exceptions=True)
+    return latencies, status_counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--probe-interval-ms", type=float, default=50.0)
+    parser.add_argument("--budget-ms", type=float, default=5.0)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    latencies, status_counts = asyncio.run(
+        run(args.url, args.clients, args.duration, args.probe_interval_ms, synthetic_image_bytes()))
+    health = summarize(latencies)
+    passed = health["p99_ms"] < args.budget_ms
+    print(f"/health under load: p50 {health['p50_ms']:.2f} ms | p99 {health['p99_ms']:.2f} ms "
+          f"(budget {args.budget_ms} ms) -> {'PASS' if passed else 'FAIL'}")
+    print(f"/predict status codes: {status_counts}")
+    dump_json({"health": health, "predict_status_counts": {str(k): v for k, v in status_counts.items()},
+               "clients": args.clients, "passed": passed}, args.json)
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
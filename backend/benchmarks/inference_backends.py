@@ -0,0 +1,98 @@
+"""
+CPU latency, throughput and load time for each inference backend.
+
+For every backend: load time (ResNet18 construction + checkpoint load +
+backend build/export/calibration + drift check), drift against eager fp32,
+forward-only latency at batch 1, forward throughput at --batch-size, and
+the full Grad-CAM explain latency (accelerated trunk + eager head backward).
+Without --weights a randomly initialised checkpoint is written to a temp
+file; without --root calibration uses a synthetic validation split.
+
+    python -m benchmarks.inference_backends --backends eager torchscript onnx int8-dynamic int8-static
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import torch
+from torchvision.models import resnet18
+
+from benchmarks.common import build_resnet18, dump_json, make_synthetic_breakhis, summarize
+from explainability import GradCAM
+from inference import transform
+from inference_backends import BACKENDS, calibration_batches, load_backend
+
+
+def load_model(weights_path):
+    model = resnet18(weights=None)
+    model.fc = torch.nn.Linear(model.fc.in_features, 2)
+    model.load_state_dict(torch.load(weights_path, map_location="cpu"))
+    return model.eval()
+
+
+def time_calls(fn, iters, warmup=3):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--weights", default=None, help="served checkpoint (default: random weights)")
+    parser.add_argument("--root", default=None, help="real dataset_split folder for calibration")
+    parser.add_argument("--synthetic-dir", default="bench_data/breakhis")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--calibration-images", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--iters", type=int, default=30)
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    weights = args.weights
+    if weights is None:
+        weights = os.path.join(tempfile.mkdtemp(), "random_resnet18.pth")
+        torch.save(build_resnet18().state_dict(), weights)
+    root = args.root or make_synthetic_breakhis(args.synthetic_dir, max(1, args.calibration_images // 2))
+    calibration = calibration_batches(root, "val", args.calibration_images, transform=transform)
+    single = calibration[0][:1]
+    batch = torch.cat(calibration)[:args.batch_size]
+    print(f"threads={torch.get_num_threads()} calibration images={sum(len(b) for b in calibration)}")
+
+    results = []
+    for name in args.backends:
+        start = time.perf_counter()
+        model = load_model(weights)
+        features, head, report = load_backend(model, name, calibration, args.tolerance)
+        load_s = time.perf_counter() - start
+
+        def forward(x):
+            with torch.no_grad():
+                return head(features(x).float())
+
+        explainer = GradCAM(model, model.layer4[-1], features=features, head=head)
+        latency = summarize(time_calls(lambda: forward(single), args.iters))
+        batch_times = time_calls(lambda: forward(batch), max(3, args.iters // 4))
+        gradcam = summarize(time_calls(lambda: explainer.explain(batch, upsample=False), max(3, args.iters // 4)))
+        explainer.remove_hooks()
+        throughput = batch.shape[0] * len(batch_times) / sum(batch_times)
+
+        r = {"backend": name, "active": report["backend"], "rejected": report["rejected"], "drift": report["drift"],
+             "load_s": load_s, "build_s": report["build_s"], "latency_b1": latency,
+             "throughput_images_per_s": throughput, "gradcam_batch": gradcam}
+        results.append(r)
+        status = "" if report["backend"] == name else f" (fell back to {report['backend']})"
+        print(f"{name:>13}{status}: load {load_s:6.2f}s | b1 p50 {latency['p50_ms']:6.1f} ms | "
+              f"b{batch.shape[0]} {throughput:7.1f} img/s | grad-cam b{batch.shape[0]} p50 {gradcam['p50_ms']:7.1f} ms")
+    dump_json({"weights": args.weights, "threads": torch.get_num_threads(), "batch_size": batch.shape[0],
+               "results": results}, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Model registry: lazy loads, LRU eviction and hot reload under load.
+
+  loads     cold ModelRegistry.get per cancer type (build, warmup, RSS
+            growth) and the cost of a get() once the model is resident
+  eviction  cycles through --types models under a budget that fits only
+            --resident of them, reporting evictions, evict times and
+            process RSS, which should stay flat
+  reload    --clients threads predict on one type back to back while its
+            checkpoint is replaced and hot-reloaded --reloads times; reports
+            failed requests (expected 0), the latencies of requests that
+            overlapped a reload vs the rest, and the versions served
+
+Randomly initialised ResNet18 checkpoints, eager backend.
+
+    python -m benchmarks.model_registry --types 3 --resident 2 --reloads 5 --clients 4
+"""
+import argparse
+import os
+import threading
+import time
+
+from benchmarks.common import dump_json, random_weights_file, summarize, synthetic_image, timed
+from model_registry import ModelRegistry, default_spec, process_rss_bytes
+
+
+def make_specs(num_types):
+    return {f"type-{i}": {**default_spec(), "weights": random_weights_file(), "backend": "eager"}
+            for i in range(num_types)}
+
+
+def replace_weights(path):
+    """Swap in a fresh random checkpoint atomically, as a deploy would."""
+    fresh = random_weights_file()
+    os.replace(fresh, path)
+    os.rmdir(os.path.dirname(fresh))
+
+
+def rss_mb():
+    rss = process_rss_bytes()
+    return rss / 2 ** 20 if rss else None
+
+
+def bench_loads(specs, get_calls):
+    registry = ModelRegistry(specs, memory_budget_bytes=2 ** 40)
+    loads = []
+    for name in specs:
+        served, seconds = timed(registry.get, name)
+        stats = registry.stats()["models"][name]
+        loads.append({"name": name, "get_s": seconds, "load_s": stats["lastLoadS"], "warmup_s": stats["lastWarmupS"],
+                      "rss_delta_mb": stats["lastLoadRssMb"], "mb": served.info()["mb"]})
+        print(f"cold get {name}: {seconds * 1000:7.1f} ms (build {stats['lastLoadS'] * 1000:.1f} ms, "
+              f"warmup {stats['lastWarmupS'] * 1000:.1f} ms, RSS +{stats['lastLoadRssMb']} MB)")
+    name = next(iter(specs))
+    hits = summarize([timed(registry.get, name)[1] for _ in range(get_calls)])
+    print(f"resident get: p50 {hits['p50_ms'] * 1000:.1f} us")
+    return {"loads": loads, "resident_get": hits}
+
+
+def bench_eviction(specs, resident, cycles):
+    probe = ModelRegistry(specs)
+    model_bytes = probe.get(next(iter(specs))).nbytes
+    del probe
+    registry = ModelRegistry(specs, memory_budget_bytes=int(model_bytes * (resident + 0.5)))
+    names = list(specs)
+    rss, get_s = [], []
+    for _ in range(cycles):
+        for name in names:
+            get_s.append(timed(registry.get, name)[1])
+        rss.append(rss_mb())
+    stats = registry.stats()
+    evict_s = [m["lastEvictS"] for m in stats["models"].values() if m["lastEvictS"] is not None]
+    results = {
+        "types": len(names), "resident": resident, "budget_mb": stats["memoryBudgetMb"],
+        "resident_mb": stats["residentMb"], "evictions": sum(m["evictions"] for m in stats["models"].values()),
+        "loads": sum(m["loads"] for m in stats["models"].values()), "get": summarize(get_s),
+        "last_evict_ms": max(evict_s) * 1000 if evict_s else None,
+        "rss_per_cycle_mb": rss, "rss_growth_mb": rss[-1] - rss[0] if rss[0] is not None else None,
+    }
+    print(f"eviction: {results['loads']} loads, {results['evictions']} evictions over {cycles} cycles | "
+          f"resident {results['resident_mb']} MB of {results['budget_mb']} MB | RSS per cycle {rss}")
+    return results
+
+
+def bench_reload(specs, clients, reloads, interval):
+    name = next(iter(specs))
+    registry = ModelRegistry(specs)
+    registry.get(name)
+    img = synthetic_image()
+    stop = threading.Event()
+    reloading = []  # (start, end) perf_counter windows
+    requests, errors, versions, lock = [], [], {}, threading.Lock()
+
+    def client():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                served = registry.get(name)
+                served.predict_images([img])
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+                continue
+            end = time.perf_counter()
+            with lock:
+                requests.append((start, end))
+                versions[served.version] = versions.get(served.version, 0) + 1
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    time.sleep(interval)
+    reload_s = []
+    for _ in range(reloads):
+        replace_weights(specs[name]["weights"])
+        start = time.perf_counter()
+        registry.reload(name)
+        reloading.append((start, time.perf_counter()))
+        reload_s.append(reloading[-1][1] - start)
+        time.sleep(interval)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    def overlaps(start, end):
+        return any(start < r_end and end > r_start for r_start, r_end in reloading)
+
+    during = [end - start for start, end in requests if overlaps(start, end)]
+    steady = [end - start for start, end in requests if not overlaps(start, end)]
+    results = {
+        "clients": clients, "reloads": reloads, "requests": len(requests), "failed_requests": len(errors),
+        "errors": sorted(set(errors))[:5], "versions_served": len(versions), "reload": summarize(reload_s),
+        "latency_steady": summarize(steady), "latency_during_reload": summarize(during) if during else None,
+    }
+    print(f"reload x{reloads} with {clients} clients: {len(requests)} requests, {len(errors)} failed, "
+          f"{len(versions)} versions served | reload p50 {results['reload']['p50_ms']:.0f} ms | "
+          f"request p50 {results['latency_steady']['p50_ms']:.1f} ms steady, "
+          f"{results['latency_during_reload']['p50_ms'] if during else float('nan'):.1f} ms during reload")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--types", type=int, default=3)
+    parser.add_argument("--resident", type=int, default=2, help="models the eviction budget fits")
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--get-calls", type=int, default=10000)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--reloads", type=int, default=5)
+    parser.add_argument("--reload-interval", type=float, default=1.0, help="seconds of steady traffic between reloads")
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    specs = make_specs(args.types)
+    results = {
+        "loads": bench_loads(specs, args.get_calls),
+        "eviction": bench_eviction(specs, args.resident, args.cycles),
+        "reload": bench_reload(specs, args.clients, args.reloads, args.reload_interval),
+    }
+    dump_json(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Bytes-on-wire and encode time of the Grad-CAM overlay per encoder setting.
+
+Compares the legacy inline delivery (PNG -> base64 data URI in JSON) with
+binary delivery for PNG compress levels, WebP and JPEG qualities.
+
+    python -m benchmarks.overlay_encoding --sizes 700x460 2048x1536
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.common import dump_json, synthetic_image
+from explainability import overlay_heatmap
+from overlay_encoding import encode_overlay, to_data_uri
+
+SETTINGS = [
+    ("png", {"compress_level": 1}),
+    ("png", {"compress_level": 6}),
+    ("png", {"compress_level": 9}),
+    ("webp", {"quality": 80}),
+    ("webp", {"quality": 90}),
+    ("jpeg", {"quality": 80}),
+    ("jpeg", {"quality": 90}),
+]
+
+
+def realistic_overlay(width, height):
+    """Overlay of a smooth CAM on a noisy slide, closer to real output than pure noise."""
+    img = synthetic_image(width, height)
+    img = (img // 4 + 96).astype(np.uint8)
+    cam = torch.nn.functional.interpolate(torch.rand(1, 1, 7, 7), size=(224, 224), mode="bilinear")
+    return overlay_heatmap(img, cam[0, 0].numpy())
+
+
+def bench(overlay, fmt, kwargs, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        data = encode_overlay(overlay, fmt, **kwargs)
+        times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    inline = to_data_uri(data, fmt)
+    inline_time = time.perf_counter() - start
+    return {
+        "format": fmt,
+        **kwargs,
+        "binary_bytes": len(data),
+        "inline_bytes": len(inline),
+        "encode_ms": 1000.0 * float(np.median(times)),
+        "inline_extra_ms": 1000.0 * inline_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", nargs="+", default=["700x460", "1400x920", "2048x1536"])
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split("x"))
+        overlay = realistic_overlay(width, height)
+        print(f"\n{size}: {'setting':<18} {'binary KB':>10} {'inline KB':>10} {'encode ms':>10}")
+        for fmt, kwargs in SETTINGS:
+            r = bench(overlay, fmt, kwargs, args.repeats)
+            r["size"] = size
+            rows.append(r)
+            label = f"{fmt} " + " ".join(f"{k}={v}" for k, v in kwargs.items())
+            print(f"{'':>{len(size) + 1}} {label:<18} {r['binary_bytes'] / 1024:>10.1f} "
+                  f"{r['inline_bytes'] / 1024:>10.1f} {r['encode_ms']:>10.2f}")
+    dump_json({"results": rows}, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Overlay pipeline benchmark across image sizes.
+
+legacy : CAM upsampled to 224x224 by Grad-CAM, resized again to full size in
+         float, scaled, colour-mapped and blended (the previous hash.overlay_heatmap)
+fused  : raw 7x7 CAM upsampled once as uint8, LUT colormap into a reused buffer
+capped : fused, with the output capped to --max-side for display
+
+    python -m benchmarks.overlay_heatmap --sizes 700x460 2048x1536 4096x4096
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from benchmarks.common import dump_json, synthetic_image
+from explainability import overlay_heatmap
+
+
+def legacy_overlay_heatmap(img, cam, alpha=0.5, colormap=cv2.COLORMAP_JET):
+    cam_resized = cv2.resize(cam, (img.shape[1], img.shape[0]))
+    heatmap = np.uint8(255 * cam_resized)
+    heatmap = cv2.applyColorMap(heatmap, colormap)
+    return cv2.addWeighted(heatmap, alpha, img, 1 - alpha, 0)
+
+
+def median_ms(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return 1000.0 * float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", nargs="+", default=["700x460", "1400x920", "2048x1536", "4096x4096"])
+    parser.add_argument("--max-side", type=int, default=1024)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    cam_small = torch.rand(1, 1, 7, 7)
+    cam_224 = F.interpolate(cam_small, size=(224, 224), mode="bilinear", align_corners=False)[0, 0].numpy()
+    cam_7 = cam_small[0, 0].numpy()
+
+    rows = []
+    print(f"{'size':>10} {'legacy ms':>10} {'fused ms':>10} {'capped ms':>10} {'max |diff|':>10}")
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split("x"))
+        img = synthetic_image(width, height)
+        out = np.empty_like(img)
+
+        legacy = median_ms(lambda: legacy_overlay_heatmap(img, cam_224), args.repeats)
+        fused = median_ms(lambda: overlay_heatmap(img, cam_7, out=out), args.repeats)
+        capped = median_ms(lambda: overlay_heatmap(img, cam_7, max_side=args.max_side), args.repeats)
+        diff = np.abs(legacy_overlay_heatmap(img, cam_224).astype(np.int16)
+                      - overlay_heatmap(img, cam_7).astype(np.int16)).max()
+
+        rows.append({"size": size, "legacy_ms": legacy, "fused_ms": fused,
+                     "capped_ms": capped, "max_side": args.max_side, "max_abs_diff": int(diff)})
+        print(f"{size:>10} {legacy:>10.2f} {fused:>10.2f} {capped:>10.2f} {diff:>10d}")
+    dump_json({"results": rows}, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Benchmark suite runner with merged JSON results and regression checks.
+
+Runs the offline benchmarks one after another, each as a subprocess that
+writes JSON. They use synthetic images, random weights and the fake chat
+model, so no dataset, checkpoint or API key is needed. Results are merged
+into one file together with the environment they ran in:
+
+    python -m benchmarks.run --output bench_results/baseline.json
+    python -m benchmarks.run --quick --groups micro e2e
+    python -m benchmarks.run --only stages endpoint_load --repeats 3
+
+--compare checks the results against a stored baseline. A metric is
+compared when its name says which direction is better:
+  - lower is better: ..._ms, ..._s, ..._mb, seconds
+  - higher is better: ...per_s, ..._rps, throughput..., speedup
+Metrics are matched by their path in the JSON. A change of more than
+--threshold in the wrong direction is a regression, and the exit status is
+then 1. With --repeats, the best value of each metric across runs is used.
+
+    python -m benchmarks.run --quick --output new.json --compare bench_results/baseline.json
+    python -m benchmarks.run --results new.json --compare bench_results/baseline.json  # compare only
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import dump_json
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (name, group, extra args, extra args with --quick). Benchmarks that build a
+# synthetic dataset get their own --synthetic-dir so runs never share images.
+SUITE = [
+    ("stages", "micro", [], ["--repeats", "5"]),
+    ("gradcam_latency", "micro", ["--calls", "2000", "--window", "200"], ["--calls", "200", "--window", "50"]),
+    ("overlay_heatmap", "micro", [], ["--repeats", "5"]),
+    ("overlay_encoding", "micro", [], ["--repeats", "3"]),
+    ("answer_cache", "micro", [], ["--lookups", "1000"]),
+    ("telemetry_overhead", "micro", [], ["--iterations", "100000", "--requests", "300"]),
+    ("tta", "micro", [], ["--views", "1", "4", "--batch-sizes", "1", "--models", "2", "--repeats", "3"]),
+    ("model_registry", "micro", [], ["--types", "2", "--resident", "1", "--cycles", "2", "--get-calls", "1000",
+                                     "--reloads", "2", "--reload-interval", "0.3"]),
+    ("inference_backends", "micro", ["--backends", "eager", "torchscript"],
+     ["--backends", "eager", "torchscript", "--iters", "5", "--calibration-images", "16"]),
+    ("batching_throughput", "e2e", [], ["--sizes", "1", "4", "--requests-per-client", "2"]),
+    ("tiled_inference", "e2e", ["--sizes", "1024", "2048", "4096"], ["--sizes", "1024"]),
+    ("endpoint_load", "e2e", [], ["--concurrency", "1", "8", "--requests-per-client", "2"]),
+    ("cold_start", "e2e", [], ["--warmups", "1"]),
+    ("dataset_loading", "training", [], ["--images-per-folder", "20"]),
+    ("sampler_startup", "training", [], ["--images-per-folder", "50"]),
+    ("tensor_cache", "training", [], ["--images-per-folder", "20"]),
+    ("data_pipeline", "training", [], ["--images-per-folder", "40", "--workers", "0", "2", "--batches", "5"]),
+    ("training_precision", "training", [], ["--images-per-folder", "16", "--modes", "fp32", "bf16-cl"]),
+    ("ddp_scaling", "training", ["--procs", "1", "2"], ["--procs", "1", "2", "--images-per-folder", "32"]),
+]
+GROUPS = sorted({group for _, group, _, _ in SUITE})
+USES_SYNTHETIC_DATA = {"inference_backends", "dataset_loading", "sampler_startup", "tensor_cache",
+                       "data_pipeline", "training_precision", "ddp_scaling"}
+
+HIGHER_IS_BETTER = re.compile(r"(per_s|_rps|speedup)$|throughput")
+LOWER_IS_BETTER = re.compile(r"(_ms|_s|_us|_ns|_mb|seconds|slowdown)$")
+# Fields that identify an entry of a results list, e.g. {"batch_size": 8, ...}
+ID_KEYS = ("name", "endpoint", "mode", "backend", "format", "size", "batch_size", "views", "models",
+           "concurrency", "workers", "procs", "warmup_batch_sizes", "clients", "split")
+
+
+# ---------- RUNNING ----------
+
+def environment():
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    try:
+        import torch
+        torch_version, threads = torch.__version__, torch.get_num_threads()
+    except ImportError:
+        torch_version, threads = None, None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git("rev-parse", "HEAD"),
+        "git_dirty": bool(git("status", "--porcelain", "--", ".")),
+        "python": platform.python_version(),
+        "torch": torch_version,
+        "torch_threads": threads,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_benchmark(name, args, timeout):
+    """Run one benchmark module; returns (returncode, seconds, parsed JSON or None)."""
+    fd, json_path = tempfile.mkstemp(suffix=f"-{name}.json")
+    os.close(fd)
+    start = time.perf_counter()
+    try:
+        returncode = subprocess.run([sys.executable, "-m", f"benchmarks.{name}", *args, "--json", json_path],
+                                    cwd=BACKEND_DIR, timeout=timeout).returncode
+    except subprocess.TimeoutExpired:
+        returncode = "timeout"
+    seconds = time.perf_counter() - start
+    try:
+        with open(json_path) as f:
+            results = json.load(f) if os.path.getsize(json_path) else None
+    finally:
+        os.remove(json_path)
+    return returncode, seconds, results
+
+
+def run_suite(selected, quick, repeats, work_dir, timeout):
+    benchmarks = {}
+    for name, _, full_args, quick_args in selected:
+        args = list(quick_args if quick else full_args)
+        if name in USES_SYNTHETIC_DATA:
+            args += ["--synthetic-dir", os.path.join(work_dir, f"{name}-{'quick' if quick else 'full'}")]
+        runs, returncodes, seconds = [], [], 0.0
+        for i in range(repeats):
+            print(f"\n=== {name} ({i + 1}/{repeats}): {' '.join(args)}", flush=True)
+            returncode, elapsed, results = run_benchmark(name, args, timeout)
+            returncodes.append(returncode)
+            seconds += elapsed
+            if results is not None:
+                runs.append(results)
+        benchmarks[name] = {"args": args, "returncodes": returncodes, "seconds": seconds, "runs": runs}
+        if any(code != 0 for code in returncodes):
+            print(f"!!! {name} exited with {returncodes}", flush=True)
+    return benchmarks
+
+
+# ---------- COMPARISON ----------
+
+def direction(path):
+    """+1 if higher is better, -1 if lower is better, 0 if the metric isn't compared."""
+    leaf = path.rsplit(".", 1)[-1]
+    if HIGHER_IS_BETTER.search(leaf):
+        return 1
+    if LOWER_IS_BETTER.search(leaf):
+        return -1
+    return 0
+
+
+def _item_key(item, index):
+    if isinstance(item, dict):
+        ids = [f"{k}={item[k]}" for k in ID_KEYS if k in item and not isinstance(item[k], (dict, list))]
+        if ids:
+            return "[" + ",".join(ids) + "]"
+    return f"[{index}]"
+
+
+def flatten(obj, prefix=""):
+    """{path: value} for every numeric leaf; list entries are keyed by their identifying fields."""
+    out = {}
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            out.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(obj, list):
+        for i, item in enumerate(obj):
+            out.update(flatten(item, prefix + _item_key(item, i)))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        out[prefix] = float(obj)
+    return out
+
+
+def best_metrics(benchmarks, ignore=None):
+    """{benchmark.path: best value across runs} for every directional metric."""
+    best = {}
+    for name, entry in benchmarks.items():
+        for run in entry["runs"]:
+            for path, value in flatten(run, name).items():
+                sign = direction(path)
+                if not sign or (ignore and ignore.search(path)):
+                    continue
+                if path not in best or (value - best[path]) * sign > 0:
+                    best[path] = value
+    return best
+
+
+def compare(baseline, current, threshold, ignore=None):
+    """Relative change of every metric present in both result sets, split into regressions and improvements."""
+    base = best_metrics(baseline["benchmarks"], ignore)
+    new = best_metrics(current["benchmarks"], ignore)
+    regressions, improvements = [], []
+    for path in sorted(base.keys() & new.keys()):
+        if base[path] == 0:
+            continue
+        change = (new[path] - base[path]) / abs(base[path])
+        row = {"metric": path, "baseline": base[path], "current": new[path], "change": change}
+        if change * direction(path) < -threshold:
+            regressions.append(row)
+        elif change * direction(path) > threshold:
+            improvements.append(row)
+    return {
+        "threshold": threshold,
+        "compared": len(base.keys() & new.keys()),
+        "missing": sorted(base.keys() - new.keys()),
+        "new": sorted(new.keys() - base.keys()),
+        "regressions": regressions,
+        "improvements": improvements,
+    }
+
+
+def print_comparison(report):
+    print(f"\nCompared {report['compared']} metrics against the baseline (threshold {report['threshold'] * 100:.0f}%)")
+    for title, rows in (("Regressions", report["regressions"]), ("Improvements", report["improvements"])):
+        print(f"{title}: {len(rows)}")
+        for row in sorted(rows, key=lambda r: -abs(r["change"])):
+            print(f"  {row['change'] * 100:+7.1f}%  {row['metric']}  ({row['baseline']:.4g} -> {row['current']:.4g})")
+    if report["missing"]:
+        print(f"Missing from current results: {len(report['missing'])} metrics")
+
+
+# ---------- CLI ----------
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", nargs="+", default=GROUPS, choices=GROUPS)
+    parser.add_argument("--only", nargs="+", default=None, choices=[name for name, _, _, _ in SUITE])
+    parser.add_argument("--quick", action="store_true", help="small sizes and few repeats (smoke test / CI)")
+    parser.add_argument("--repeats", type=int, default=1, help="run each benchmark N times, keep the best")
+    parser.add_argument("--work-dir", default="bench_data/suite", help="synthetic datasets, reused between runs")
+    parser.add_argument("--timeout", type=float, default=3600.0, help="seconds per benchmark run")
+    parser.add_argument("--output", default="bench_results/latest.json")
+    parser.add_argument("--results", default=None, help="compare these stored results instead of running")
+    parser.add_argument("--compare", default=None, help="baseline results file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change that counts as a regression")
+    parser.add_argument("--ignore", default=r"p9\d_ms$", help="regex of metric paths not to compare")
+    parser.add_argument("--list", action="store_true")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, group, full_args, quick_args in SUITE:
+            print(f"{name:<20} {group:<9} {' '.join(full_args) or '-'}  | quick: {' '.join(quick_args) or '-'}")
+        return
+
+    if args.results:
+        with open(args.results) as f:
+            current = json.load(f)
+    else:
+        selected = [entry for entry in SUITE if (entry[0] in args.only if args.only else entry[1] in args.groups)]
+        current = {
+            "environment": environment(),
+            "quick": args.quick,
+            "repeats": args.repeats,
+            "benchmarks": run_suite(selected, args.quick, args.repeats, os.path.abspath(args.work_dir), args.timeout),
+        }
+        if os.path.dirname(args.output):
+            os.makedirs(os.path.dirname(args.output), exist_ok=True)
+        dump_json(current, args.output)
+        failed = [name for name, entry in current["benchmarks"].items() if not entry["runs"]]
+        if failed:
+            print(f"No results from: {', '.join(failed)}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("quick") != current.get("quick"):
+            print("Warning: comparing a --quick run with a full run; sizes differ")
+        report = compare(baseline, current, args.threshold, re.compile(args.ignore) if args.ignore else None)
+        print_comparison(report)
+        if report["regressions"]:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
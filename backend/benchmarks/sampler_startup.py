@@ -0,0 +1,65 @@
+"""
+Balanced-sampler startup time on the training split.
+
+iterate : the previous make_dataloaders behaviour - `[y for _, y in train_dataset]`,
+          which decodes and augments every image just to read its label
+labels  : balanced_sample_weights(dataset.labels, dataset.class_counts)
+
+Without --root a synthetic tree is generated under --synthetic-dir.
+
+    python -m benchmarks.sampler_startup --images-per-folder 500
+"""
+import argparse
+
+import numpy as np
+from torch.utils.data import WeightedRandomSampler
+
+from benchmarks.common import dump_json, make_synthetic_breakhis, timed
+from process_data import CancerDataset
+from train_model import balanced_sample_weights, make_transforms
+
+
+def weights_by_iteration(dataset):
+    labels = [y for _, y in dataset]
+    weights = 1. / np.bincount(labels)
+    return [weights[y] for y in labels]
+
+
+def weights_from_labels(dataset):
+    return balanced_sample_weights(dataset.labels, dataset.class_counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--root", default=None, help="real dataset_split folder (default: synthetic)")
+    parser.add_argument("--synthetic-dir", default="bench_data/breakhis")
+    parser.add_argument("--images-per-folder", type=int, default=500)
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--skip-iterate", action="store_true", help="only time the label-array path")
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    root = args.root or args.synthetic_dir
+    if not args.root:
+        make_synthetic_breakhis(root, args.images_per_folder)
+    dataset, index_s = timed(CancerDataset, "train", transform=make_transforms()[0],
+                             root=root, cache_dir=args.cache_dir)
+    print(f"indexed {len(dataset)} images in {index_s * 1000:.1f} ms")
+
+    results = {"root": root, "images": len(dataset), "index_s": index_s}
+    modes = [("labels", weights_from_labels)]
+    if not args.skip_iterate:
+        modes.insert(0, ("iterate", weights_by_iteration))
+    for name, fn in modes:
+        weights, seconds = timed(fn, dataset)
+        _, sampler_s = timed(WeightedRandomSampler, weights, num_samples=len(weights), replacement=True)
+        results[name] = {"weights_s": seconds, "sampler_s": sampler_s}
+        print(f"{name:>7}: weights {seconds * 1000:10.1f} ms | sampler {sampler_s * 1000:.2f} ms")
+    if "iterate" in results:
+        results["speedup"] = results["iterate"]["weights_s"] / max(results["labels"]["weights_s"], 1e-9)
+        print(f"speedup: {results['speedup']:.0f}x")
+    dump_json(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
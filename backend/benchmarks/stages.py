@@ -0,0 +1,92 @@
+"""
+Per-stage micro-benchmarks of the /predict hot path.
+
+Times each stage in isolation on synthetic slide-sized images, per batch size:
+  decode            inference.decode_image on PNG upload bytes
+  transform         serving transform + stack
+  forward           model forward, no grad
+  gradcam           GradCAM.explain (forward + backward, feature-resolution CAMs)
+  gradcam_generate  GradCAM.generate on one image (upsampled CAM)
+  overlay           overlay_heatmap at full image size
+  encode            overlay PNG encoding
+  base64            data URI of the encoded overlay
+  end_to_end        demo_model.predict_cancer_with_gradcam (bytes in, overlay out)
+
+Without --weights a randomly initialised checkpoint is served.
+
+    python -m benchmarks.stages --batch-sizes 1 8 --repeats 20
+"""
+import argparse
+import os
+
+import torch
+
+from benchmarks.common import dump_json, random_weights_file, summarize, synthetic_image_bytes, timed
+
+
+def time_stage(fn, repeats, warmup=2):
+    for _ in range(warmup):
+        fn()
+    return summarize([timed(fn)[1] for _ in range(repeats)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--weights", default=None, help="served checkpoint (default: random weights)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--width", type=int, default=700)
+    parser.add_argument("--height", type=int, default=460)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    # demo_model loads its checkpoint at import
+    os.environ["LIFELENS_WEIGHTS_PATH"] = os.path.abspath(args.weights or random_weights_file())
+    import demo_model
+    from inference import decode_image, transform
+    from explainability import overlay_heatmap
+    from overlay_encoding import encode_overlay, to_data_uri
+
+    explainer = demo_model.explainer
+    upload = synthetic_image_bytes(args.width, args.height)
+    img = decode_image(upload)
+    single = transform(img).unsqueeze(0)
+
+    results = []
+    for batch_size in args.batch_sizes:
+        images = [img] * batch_size
+        batch = torch.stack([transform(im) for im in images])
+        _, _, _, cams = explainer.explain(batch, upsample=False)
+        overlay = overlay_heatmap(img, cams[0])
+        encoded = encode_overlay(overlay, "png")
+
+        def forward():
+            with torch.inference_mode():
+                demo_model.model(batch)
+
+        stages = {
+            "decode": lambda: [decode_image(upload) for _ in range(batch_size)],
+            "transform": lambda: torch.stack([transform(im) for im in images]),
+            "forward": forward,
+            "gradcam": lambda: explainer.explain(batch, upsample=False),
+            "overlay": lambda: [overlay_heatmap(img, cam) for cam in cams],
+            "encode": lambda: [encode_overlay(overlay, "png") for _ in range(batch_size)],
+            "base64": lambda: [to_data_uri(encoded, "png") for _ in range(batch_size)],
+        }
+        if batch_size == 1:
+            stages["gradcam_generate"] = lambda: explainer.generate(single)
+            stages["end_to_end"] = lambda: demo_model.predict_cancer_with_gradcam(upload)
+
+        row = {"batch_size": batch_size, "stages": {}}
+        for name, fn in stages.items():
+            row["stages"][name] = time_stage(fn, args.repeats)
+            print(f"batch {batch_size:>2} | {name:<16} p50 {row['stages'][name]['p50_ms']:8.2f} ms "
+                  f"({row['stages'][name]['p50_ms'] / batch_size:7.2f} ms/image)")
+        results.append(row)
+
+    dump_json({"image_size": [args.width, args.height], "threads": torch.get_num_threads(),
+               "results": results}, args.json)
+
+
+if __name__ == "__main__":
+    main()
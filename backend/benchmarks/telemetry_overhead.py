@@ -0,0 +1,143 @@
+"""
+Telemetry overhead: spans, the request middleware and the sampling profiler.
+
+  spans       ns per `with span(...)` with telemetry off, on, and for an empty
+              loop body as the baseline
+  middleware  in-process requests/sec for a small FastAPI app whose endpoint
+              opens as many spans as /predict does (about 10), with no
+              middleware, with the middleware and telemetry off, and with it on
+  profiler    slowdown of a CPU-bound Python loop while SamplingProfiler
+              samples every --profile-interval-ms
+
+    python -m benchmarks.telemetry_overhead --iterations 1000000 --requests 2000
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+import telemetry
+from benchmarks.common import dump_json
+from telemetry import SamplingProfiler, TelemetryMiddleware, span
+
+PREDICT_STAGES = ("read", "cache_lookup", "decode", "cache_lookup", "transform", "forward",
+                  "gradcam_backward", "overlay", "inference_center", "encode", "base64", "session_save")
+
+
+class _Empty:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+def ns_per_call(fn, iterations):
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        with fn("forward"):
+            pass
+    return (time.perf_counter_ns() - start) / iterations
+
+
+def bench_spans(iterations):
+    empty = _Empty()
+    results = {"baseline_ns": ns_per_call(lambda stage: empty, iterations)}
+    for enabled in (False, True):
+        telemetry.set_enabled(enabled)
+        results["on_ns" if enabled else "off_ns"] = ns_per_call(span, iterations)
+    telemetry.set_enabled(True)
+    print(f"span: baseline {results['baseline_ns']:.0f} ns | off {results['off_ns']:.0f} ns | "
+          f"on {results['on_ns']:.0f} ns per call")
+    return results
+
+
+def make_app(middleware):
+    app = FastAPI()
+
+    @app.get("/work")
+    async def work():
+        for stage in PREDICT_STAGES:
+            with span(stage):
+                pass
+        return {"ok": True}
+
+    if middleware:
+        app.add_middleware(TelemetryMiddleware)
+    return app
+
+
+async def requests_per_s(app, requests):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(50):
+            await client.get("/work")
+        start = time.perf_counter()
+        for _ in range(requests):
+            (await client.get("/work")).raise_for_status()
+        return requests / (time.perf_counter() - start)
+
+
+def bench_middleware(requests):
+    results = {}
+    for name, middleware, enabled in (("none", False, False), ("off", True, False), ("on", True, True)):
+        telemetry.set_enabled(enabled)
+        results[f"{name}_rps"] = asyncio.run(requests_per_s(make_app(middleware), requests))
+    telemetry.set_enabled(True)
+    results["on_overhead_us"] = (1 / results["on_rps"] - 1 / results["none_rps"]) * 1e6
+    results["off_overhead_us"] = (1 / results["off_rps"] - 1 / results["none_rps"]) * 1e6
+    print(f"middleware: none {results['none_rps']:.0f} req/s | off {results['off_rps']:.0f} req/s | "
+          f"on {results['on_rps']:.0f} req/s ({results['on_overhead_us']:.1f} us/request)")
+    return results
+
+
+def cpu_work(n=2_000_000):
+    total = 0
+    for i in range(n):
+        total += i * i % 7
+    return total
+
+
+def bench_profiler(interval_ms, repeats):
+    def best(profiled):
+        times = []
+        for _ in range(repeats):
+            profiler = SamplingProfiler(interval_ms).start() if profiled else None
+            start = time.perf_counter()
+            cpu_work()
+            times.append(time.perf_counter() - start)
+            if profiler is not None:
+                profiler.stop()
+        return min(times), profiler
+
+    plain_s, _ = best(False)
+    profiled_s, profiler = best(True)
+    results = {"interval_ms": interval_ms, "plain_s": plain_s, "profiled_s": profiled_s,
+               "slowdown": profiled_s / plain_s - 1, "samples": sum(profiler.samples.values()),
+               "distinct_stacks": len(profiler.samples)}
+    print(f"profiler @ {interval_ms} ms: {plain_s * 1000:.0f} ms -> {profiled_s * 1000:.0f} ms "
+          f"({results['slowdown'] * 100:+.1f}%), {results['samples']} samples")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--profile-interval-ms", type=float, default=5.0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    results = {
+        "spans": bench_spans(args.iterations),
+        "middleware": bench_middleware(args.requests),
+        "profiler": bench_profiler(args.profile_interval_ms, args.repeats),
+    }
+    dump_json(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Raw-image loading vs the memory-mapped tensor cache.
+
+Reports cache build time (cold, no-op and after modifying one file), dataset
+startup time (construct + first batch) and one full epoch over the split with
+the validation transform, for raw decoding and for the cache.
+
+    python -m benchmarks.tensor_cache --images-per-folder 200 --split train
+"""
+import argparse
+import os
+import shutil
+import time
+
+import cv2
+from torch.utils.data import DataLoader
+
+from benchmarks.common import dump_json, make_synthetic_breakhis, synthetic_image
+from process_data import CancerDataset, list_split, val_test_transform
+from tensor_cache import build_split_cache, ensure_split_cache
+
+
+def epoch_time(dataset, batch_size, num_workers):
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    start = time.perf_counter()
+    it = iter(loader)
+    next(it)
+    first = time.perf_counter() - start
+    for _ in it:
+        pass
+    return first, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--root", default=None, help="real dataset_split folder (default: synthetic)")
+    parser.add_argument("--synthetic-dir", default="bench_data/breakhis")
+    parser.add_argument("--cache-dir", default="bench_data/cache")
+    parser.add_argument("--images-per-folder", type=int, default=200)
+    parser.add_argument("--split", default="train")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--num-workers", type=int, default=0)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    root = args.root or args.synthetic_dir
+    if not args.root:
+        make_synthetic_breakhis(root, args.images_per_folder)
+    shutil.rmtree(args.cache_dir, ignore_errors=True)
+
+    results = {"split": args.split}
+    results["build_cold"] = build_split_cache(args.split, root, args.cache_dir, verbose=False)
+    start = time.perf_counter()
+    ensure_split_cache(args.split, root, args.cache_dir)
+    results["build_noop_s"] = time.perf_counter() - start
+    if not args.root:
+        # Touch one source image so exactly one row has to be re-decoded
+        path = list_split(args.split, root)[0][0]
+        cv2.imwrite(path, synthetic_image(seed=12345))
+        results["build_incremental"] = build_split_cache(args.split, root, args.cache_dir, verbose=False)
+
+    for mode, cache_dir in (("raw", None), ("cached", args.cache_dir)):
+        start = time.perf_counter()
+        dataset = CancerDataset(args.split, transform=val_test_transform, root=root, cache_dir=cache_dir)
+        construct = time.perf_counter() - start
+        first, epoch = epoch_time(dataset, args.batch_size, args.num_workers)
+        results[mode] = {"startup_s": construct + first, "epoch_s": epoch,
+                         "images_per_s": len(dataset) / epoch, "images": len(dataset)}
+
+    print(f"cache build: cold {results['build_cold']['seconds']:.2f}s | no-op {results['build_noop_s']:.3f}s"
+          + (f" | incremental {results['build_incremental']['seconds']:.2f}s "
+             f"({results['build_incremental']['decoded']} decoded)" if "build_incremental" in results else ""))
+    for mode in ("raw", "cached"):
+        r = results[mode]
+        print(f"{mode:>6}: startup {r['startup_s']:.3f}s | epoch {r['epoch_s']:.2f}s ({r['images_per_s']:.0f} img/s)")
+    print(f"cache size: {os.path.getsize(os.path.join(args.cache_dir, f'{args.split}_images.npy')) / 2**20:.0f} MB")
+    dump_json(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
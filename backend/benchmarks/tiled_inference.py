@@ -0,0 +1,96 @@
+"""
+Tiled whole-slide inference: throughput and peak memory vs image size.
+
+Each size runs in a fresh subprocess with a randomly initialised ResNet18
+(eager backend). The child reports tiles/sec, end-to-end seconds (tiling,
+model, stitching, overlay) and peak RSS. It also reports the peak RSS on top
+of the decoded image, which should stay roughly flat as images grow because
+only one tile batch exists at a time.
+
+    python -m benchmarks.tiled_inference --sizes 1024 2048 4096 8192 --tile-batch-size 16
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.common import dump_json
+
+
+def rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_child(size, tile_batch_size, overlap, repeats):
+    import numpy as np
+    import torch
+
+    from benchmarks.common import build_resnet18
+    from explainability import GradCAM
+    from inference import predict_tiled
+    from inference_backends import load_backend
+
+    model = build_resnet18()
+    features, head, _ = load_backend(model, "eager")
+    explainer = GradCAM(model, model.layer4[-1], features=features, head=head)
+    # Warm up on a small image so allocator/kernel setup doesn't count
+    predict_tiled(explainer, np.full((448, 448, 3), 128, np.uint8), tile_batch_size=tile_batch_size)
+
+    baseline_mb = rss_mb()
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 200, size=(size, size, 3), dtype=np.uint8)  # below the white-background threshold
+    image_mb = img.nbytes / (1024 * 1024)
+    after_image_mb = rss_mb()
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _, _, overlay, info = predict_tiled(explainer, img, overlay_max_side=2048,
+                                            tile_batch_size=tile_batch_size, overlap=overlap)
+        times.append(time.perf_counter() - start)
+    seconds = min(times)
+    peak_mb = rss_mb()
+    print(json.dumps({
+        "size": size, "tiles": info["tiles"], "seconds": seconds, "tiles_per_s": info["tiles"] / seconds,
+        "megapixels_per_s": size * size / 1e6 / seconds, "image_mb": image_mb,
+        "peak_rss_mb": peak_mb, "peak_over_image_mb": peak_mb - max(after_image_mb, baseline_mb + image_mb),
+        "threads": torch.get_num_threads(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048, 4096, 8192])
+    parser.add_argument("--tile-batch-size", type=int, default=16)
+    parser.add_argument("--overlap", type=float, default=0.25)
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--child", type=int, default=None)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.tile_batch_size, args.overlap, args.repeats)
+        return
+
+    results = []
+    for size in args.sizes:
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.tiled_inference", "--child", str(size),
+             "--tile-batch-size", str(args.tile_batch_size), "--overlap", str(args.overlap),
+             "--repeats", str(args.repeats)],
+            check=True, capture_output=True, text=True, cwd=os.getcwd(),
+        ).stdout
+        r = json.loads([line for line in out.splitlines() if line.startswith("{")][-1])
+        results.append(r)
+        print(f"{size:>5}px: {r['tiles']:5d} tiles in {r['seconds']:6.2f}s ({r['tiles_per_s']:6.1f} tiles/s, "
+              f"{r['megapixels_per_s']:5.2f} MP/s) | image {r['image_mb']:6.0f} MB | "
+              f"peak RSS {r['peak_rss_mb']:6.0f} MB (+{r['peak_over_image_mb']:.0f} MB over image)")
+    dump_json({"tile_batch_size": args.tile_batch_size, "overlap": args.overlap, "results": results}, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Training throughput and validation parity for train_model's precision modes.
+
+Every mode starts from the same weights and the same sampler seed and
+trains for --epochs, then reports train images/sec, validation accuracy and
+how often its validation predictions agree with the fp32 baseline. Accuracy
+only means something on the real dataset (--root); on the synthetic tree
+the agreement rate and throughput are the useful numbers.
+
+    python -m benchmarks.training_precision --modes fp32 bf16 bf16-cl bf16-cl-accum4
+"""
+import argparse
+import copy
+import time
+
+import torch
+import torch.nn as nn
+
+from benchmarks.common import build_resnet18, dump_json, make_synthetic_breakhis
+from train_model import (
+    autocast, evaluate, get_device, make_dataloaders, make_grad_scaler, make_transforms,
+    resolve_precision, seed_everything, train_one_epoch,
+)
+
+# name -> (precision, channels_last, accumulation steps)
+MODES = {
+    "fp32": ("fp32", False, 1),
+    "fp32-cl": ("fp32", True, 1),
+    "bf16": ("bf16", False, 1),
+    "bf16-cl": ("bf16", True, 1),
+    "bf16-cl-accum4": ("bf16", True, 4),
+    "fp16": ("fp16", False, 1),
+    "fp16-cl": ("fp16", True, 1),
+    "auto-cl": ("auto", True, 1),
+}
+
+
+def predictions(model, loader, device, precision, channels_last):
+    model.eval()
+    preds = []
+    with torch.no_grad():
+        for x, _ in loader:
+            x = x.to(device)
+            if channels_last:
+                x = x.contiguous(memory_format=torch.channels_last)
+            with autocast(device, precision):
+                preds.append(model(x).argmax(1).cpu())
+    return torch.cat(preds)
+
+
+def run_mode(name, initial_state, root, batch_size, epochs, workers, device):
+    precision, channels_last, accum_steps = MODES[name]
+    precision = resolve_precision(precision, device)
+    seed_everything()
+    train_tf, val_tf = make_transforms()
+    train_loader, val_loader, _ = make_dataloaders(train_tf, val_tf, batch_size=max(1, batch_size // accum_steps),
+                                                   num_workers=workers, device=device, root=root)
+    model = build_resnet18().to(device)
+    model.load_state_dict(initial_state)
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    criterion = nn.CrossEntropyLoss(label_smoothing=0.1)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-4)
+    scaler = make_grad_scaler(precision)
+
+    images, seconds = 0, 0.0
+    for _ in range(epochs):
+        start = time.perf_counter()
+        train_one_epoch(model, train_loader, criterion, optimizer, device, None,
+                        precision, scaler, accum_steps, channels_last)
+        seconds += time.perf_counter() - start
+        images += len(train_loader.sampler)
+    val_loss, val_acc = evaluate(model, val_loader, criterion, device, precision, channels_last)
+    return {
+        "mode": name, "precision": precision, "channels_last": channels_last, "accum_steps": accum_steps,
+        "train_images_per_s": images / seconds, "val_loss": val_loss, "val_acc": val_acc,
+    }, predictions(model, val_loader, device, precision, channels_last)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--root", default=None, help="real dataset_split folder (default: synthetic)")
+    parser.add_argument("--synthetic-dir", default="bench_data/breakhis")
+    parser.add_argument("--images-per-folder", type=int, default=64)
+    parser.add_argument("--modes", nargs="+", default=["fp32", "fp32-cl", "bf16", "bf16-cl", "bf16-cl-accum4"],
+                        choices=sorted(MODES))
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    root = args.root or args.synthetic_dir
+    if not args.root:
+        make_synthetic_breakhis(root, args.images_per_folder)
+    device = get_device()
+    torch.manual_seed(0)
+    initial_state = copy.deepcopy(build_resnet18().state_dict())
+    modes = ["fp32"] + [m for m in args.modes if m != "fp32"]
+
+    results, baseline_preds = [], None
+    for name in modes:
+        r, preds = run_mode(name, initial_state, root, args.batch_size, args.epochs, args.workers, device)
+        if baseline_preds is None:
+            baseline_preds, baseline = preds, r
+        r["val_acc_delta"] = r["val_acc"] - baseline["val_acc"]
+        r["agreement_with_fp32"] = float((preds == baseline_preds).float().mean())
+        r["speedup"] = r["train_images_per_s"] / baseline["train_images_per_s"]
+        results.append(r)
+        print(f"{name:>15}: {r['train_images_per_s']:7.1f} img/s ({r['speedup']:.2f}x) | "
+              f"val acc {r['val_acc']:.2f}% ({r['val_acc_delta']:+.2f}) | "
+              f"agreement {r['agreement_with_fp32'] * 100:.1f}%")
+    dump_json({"root": root, "device": str(device), "batch_size": args.batch_size,
+               "epochs": args.epochs, "results": results}, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Fit temperature scaling for the served predictions on the validation split.
+
+Runs the served model (plus any --ensemble checkpoints) over every TTA view
+of every validation image with the serving preprocessing. It then fits one
+temperature per view count in --views, so certainties stay calibrated when
+the latency budget lowers the number of views. Temperatures are fitted for
+the served model alone ("single", used by the centre and tiled paths and by
+TTA without an ensemble) and, with --ensemble, for the ensemble too, so each
+is looked up by (model set, views). demo_model.py reads the output from
+LIFELENS_TEMPERATURE_PATH (default temperature.json).
+
+    python calibrate.py --views 1 2 4 8 --ensemble fold2.pth fold3.pth
+"""
+import argparse
+import json
+
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+
+from evaluation import expected_calibration_error, run_inference
+from process_data import DATA_ROOT
+from test_model import BEST_MODEL_PATH, DEVICE, NUM_WORKERS, load_model, make_dataset
+from tta import MAX_VIEWS, ModelEnsemble, average_probs, expand_views, fit_temperature
+
+NUM_CLASSES = 2
+BATCH_SIZE = 16  # images per batch; the model sees BATCH_SIZE x views rows
+TEMPERATURE_PATH = "temperature.json"
+
+def view_logits_fn(model, ensemble, num_views, device=DEVICE):
+    """Logits of every model and view of each sample, flattened to (N, M*V*C) for run_inference."""
+    def logits_fn(x):
+        views = expand_views(x.to(device, non_blocking=True), num_views)
+        logits = model(views).unsqueeze(0)
+        if ensemble is not None:
+            logits = torch.cat([logits, ensemble(views)])
+        n = x.shape[0]
+        return logits.reshape(logits.shape[0], num_views, n, -1).permute(2, 0, 1, 3).reshape(n, -1)
+    return logits_fn
+
+def unflatten(logits, num_models, num_views, num_classes=NUM_CLASSES):
+    """(N, M*V*C) -> view-major (M, V*N, C), as tta.average_probs expects."""
+    n = logits.shape[0]
+    logits = logits.reshape(n, num_models, num_views, num_classes).permute(1, 2, 0, 3)
+    return logits.reshape(num_models, num_views * n, num_classes)
+
+def calibration_metrics(logits, labels, num_views, temperature):
+    mean, _ = average_probs(logits, num_views, temperature)
+    confidences, preds = mean.max(dim=1)
+    correct = preds == labels
+    ece, _ = expected_calibration_error(confidences.double().numpy(), correct.numpy())
+    return {
+        "nll": float(F.nll_loss(mean.clamp_min(1e-12).log(), labels)),
+        "ece": ece,
+        "accuracy": float(correct.float().mean() * 100),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit per-model-set, per-view-count temperatures on the validation split")
+    parser.add_argument("--weights", default=BEST_MODEL_PATH)
+    parser.add_argument("--ensemble", nargs="*", default=[], help="extra checkpoints, as LIFELENS_ENSEMBLE_WEIGHTS")
+    parser.add_argument("--root", default=DATA_ROOT)
+    parser.add_argument("--split", default="val")
+    parser.add_argument("--views", type=int, nargs="+", default=[1, 2, 4, 8], choices=range(1, MAX_VIEWS + 1))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--output", default=TEMPERATURE_PATH)
+    args = parser.parse_args()
+
+    dataset = make_dataset("serving", args.root, split=args.split)
+    loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=False, num_workers=args.workers,
+                        pin_memory=DEVICE.type == "cuda")
+    model = load_model(args.weights, DEVICE)
+    ensemble = ModelEnsemble([load_model(path, DEVICE) for path in args.ensemble]) if args.ensemble else None
+    num_models = 1 + len(args.ensemble)
+    max_views = max(args.views)
+
+    flat, labels, timings = run_inference(view_logits_fn(model, ensemble, max_views), loader, len(dataset),
+                                          num_classes=num_models * max_views * NUM_CLASSES)
+    logits = unflatten(flat, num_models, max_views)
+    print(f"{len(dataset)} {args.split} images x {max_views} views x {num_models} models "
+          f"in {timings['total_s']:.1f}s ({timings['images_per_s']:.1f} images/s)")
+
+    temperatures, metrics = {}, {}
+    n = len(labels)
+    model_sets = {"single": logits[:1], **({"ensemble": logits} if ensemble is not None else {})}
+    for kind, set_logits in model_sets.items():
+        temperatures[kind], metrics[kind] = {}, {}
+        for views in sorted(set(args.views)):
+            subset = set_logits[:, :views * n]  # view-major, so the first views * n rows are the first `views` views
+            temperature = fit_temperature(subset, labels, views)
+            before = calibration_metrics(subset, labels, views, 1.0)
+            after = calibration_metrics(subset, labels, views, temperature)
+            temperatures[kind][str(views)] = temperature
+            metrics[kind][str(views)] = {"temperature": temperature, "before": before, "after": after}
+            print(f"{kind}, {views} views: T={temperature:.3f} | NLL {before['nll']:.4f} -> {after['nll']:.4f} | "
+                  f"ECE {before['ece']:.4f} -> {after['ece']:.4f} | acc {before['accuracy']:.2f}%")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "temperatures": temperatures,
+            "weights": args.weights,
+            "ensemble": args.ensemble,
+            "split": args.split,
+            "metrics": metrics,
+        }, f, indent=2)
+    print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
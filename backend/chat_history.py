@@ -0,0 +1,142 @@
+import threading
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and LifeLens, "
+    "an AI assistant that explains cancer detection results. Merge the previous summary "
+    "and the new messages into one concise summary (under 150 words) that keeps the "
+    "user's questions, concerns and anything LifeLens already explained."
+)
+
+
+# Budgeted size of a summary that hasn't been written yet (the instructions ask for < 150 words)
+SUMMARY_TOKENS_ESTIMATE = 250
+
+
+def get_encoding():
+    """
+    tiktoken's cl100k_base, loaded on first use rather than at import (it may
+    download its BPE file); None if tiktoken or the file is unavailable
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception:  # tiktoken missing or its BPE file unavailable offline
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+
+def _message_tokens(msg, encoding):
+    text = msg.content if isinstance(msg.content, str) else str(msg.content)
+    return 4 + (len(encoding.encode(text)) if encoding else len(text) // 4 + 1)
+
+
+def count_tokens(messages):
+    """Approximate prompt tokens for a list of messages (tiktoken if available, else ~4 chars/token)"""
+    encoding = get_encoding()
+    return sum(_message_tokens(msg, encoding) for msg in messages) + 2
+
+
+def format_transcript(messages):
+    role = {"human": "User", "ai": "LifeLens"}
+    return "\n".join(f"{role.get(m.type, m.type)}: {m.content}" for m in messages)
+
+
+class ChatHistoryManager:
+    """
+    Keeps each chat prompt inside a token budget.
+
+    The last `keep_last_turns` exchanges are sent verbatim; older messages are
+    folded once into a rolling summary stored on the session ("summary" /
+    "summarized_messages") and removed from its history, so every turn after
+    that reuses the cached summary instead of resending the whole transcript.
+    """
+
+    def __init__(self, model, max_prompt_tokens=3000, keep_last_turns=6):
+        self.model = model
+        self.max_prompt_tokens = max_prompt_tokens
+        self.keep_last_turns = keep_last_turns
+
+    async def _fold(self, summary, messages):
+        prompt = f"Previous summary:\n{summary or '(none)'}\n\nNew messages:\n{format_transcript(messages)}"
+        result = await self.model.ainvoke([SystemMessage(content=SUMMARY_INSTRUCTIONS), HumanMessage(content=prompt)])
+        return result.content
+
+    @staticmethod
+    def _assemble(system_message, summary, history, user_message):
+        messages = [system_message]
+        if summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+        messages.extend(history)
+        messages.append(HumanMessage(content=user_message))
+        return messages
+
+    def _verbatim_count(self, state, system_message, history, user_message):
+        """
+        How many of the newest history messages fit the budget verbatim (whole
+        exchanges, at most keep_last_turns), with the summary that will precede
+        them. Counted up front so the overflow is folded in one call.
+        """
+        encoding = get_encoding()
+        fixed = count_tokens([system_message, HumanMessage(content=user_message)])
+        sizes = [_message_tokens(m, encoding) for m in history]
+        keep = min(len(history), 2 * self.keep_last_turns)
+        summary = state.get("summary")
+        while keep > 0:
+            needs_summary = summary or keep < len(history)
+            summary_tokens = 0
+            if needs_summary:
+                summary_tokens = max(SUMMARY_TOKENS_ESTIMATE,
+                                     _message_tokens(SystemMessage(content=summary), encoding) if summary else 0)
+            if fixed + summary_tokens + sum(sizes[len(history) - keep:]) <= self.max_prompt_tokens:
+                break
+            keep = max(0, keep - 2)
+        return keep
+
+    async def build_messages(self, state, system_message, user_message):
+        """
+        Return (messages, usage) for the next turn, folding old turns into the
+        session's summary (at most one summarization call) as needed.
+        Mutates `state`; save it after the reply.
+        """
+        head = [m for m in state["history"] if isinstance(m, SystemMessage)][:1]
+        history = [m for m in state["history"] if not isinstance(m, SystemMessage)]
+
+        keep = self._verbatim_count(state, system_message, history, user_message)
+        if len(history) > keep:
+            overflow = history[:len(history) - keep]
+            state["summary"] = await self._fold(state.get("summary"), overflow)
+            state["summarized_messages"] = state.get("summarized_messages", 0) + len(overflow)
+            history = history[len(overflow):]
+            state["history"] = head + history
+
+        messages = self._assemble(system_message, state.get("summary"), history, user_message)
+        prompt_tokens = count_tokens(messages)
+
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            # What the prompt would cost if every past message were resent verbatim
+            "unbounded_prompt_tokens": count_tokens([system_message, HumanMessage(content=user_message)])
+            + state.get("transcript_tokens", 0),
+            "verbatim_messages": len(history),
+            "summarized_messages": state.get("summarized_messages", 0),
+            "max_prompt_tokens": self.max_prompt_tokens,
+        }
+        return messages, usage
+
+    @staticmethod
+    def record_turn(state, user_message, reply):
+        """Append a completed exchange to the session history"""
+        exchange = [HumanMessage(content=user_message), AIMessage(content=reply)]
+        state["history"].extend(exchange)
+        state["transcript_tokens"] = state.get("transcript_tokens", 0) + count_tokens(exchange) - 2
@@ -0,0 +1,171 @@
+"""
+Full training-state checkpoints for train_model.py.
+
+A checkpoint holds the model, optimizer, scheduler and grad-scaler state
+dicts, the epoch and early-stopping counters, and every RNG that shapes the
+next epoch: python, numpy, torch (CPU and CUDA), and the generators driving
+the sampler, the DataLoader worker seeds and BatchAugment. Everything is
+stored as tensors or plain Python values, so checkpoints load with
+torch.load(weights_only=True) and never unpickle arbitrary objects. State is copied
+to CPU on the training thread; serialisation and the atomic rename happen on
+a background thread, and only the newest `keep` checkpoints are retained.
+"""
+import os
+import queue
+import random
+import re
+import threading
+
+import numpy as np
+import torch
+
+CHECKPOINT_PATTERN = re.compile(r"^checkpoint_epoch(\d+)\.pt$")
+
+
+def checkpoint_path(directory, epoch):
+    return os.path.join(directory, f"checkpoint_epoch{epoch:04d}.pt")
+
+
+def list_checkpoints(directory):
+    """Checkpoint paths in `directory`, oldest epoch first."""
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        match = CHECKPOINT_PATTERN.match(name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(directory, name)))
+    return [path for _, path in sorted(found)]
+
+
+def latest_checkpoint(directory):
+    checkpoints = list_checkpoints(directory)
+    return checkpoints[-1] if checkpoints else None
+
+
+def numpy_rng_state():
+    """np.random's global state as plain Python values (the key array becomes a list)."""
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return {"name": name, "keys": keys.tolist(), "pos": int(pos),
+            "has_gauss": int(has_gauss), "cached_gaussian": float(cached_gaussian)}
+
+
+def set_numpy_rng_state(state):
+    np.random.set_state((state["name"], np.asarray(state["keys"], dtype=np.uint32), state["pos"],
+                         state["has_gauss"], state["cached_gaussian"]))
+
+
+def capture_rng_state(generators=None):
+    """Global RNG states plus the states of named torch.Generator objects."""
+    state = {
+        "python": random.getstate(),
+        "numpy": numpy_rng_state(),
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+        "generators": {},
+    }
+    for name, generator in (generators or {}).items():
+        if generator is not None:
+            state["generators"][name] = generator.get_state()
+    return state
+
+
+def restore_rng_state(state, generators=None):
+    random.setstate(state["python"])
+    set_numpy_rng_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if state["cuda"] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+    for name, generator in (generators or {}).items():
+        if generator is not None and name in state["generators"]:
+            generator.set_state(state["generators"][name])
+
+
+def to_cpu(obj):
+    """Deep copy of a (nested) state dict with every tensor cloned to CPU."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(v) for v in obj)
+    return obj
+
+
+def atomic_save(obj, path):
+    """torch.save to a temp file in the same directory, then rename over `path`."""
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "wb") as f:
+        torch.save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path, map_location="cpu"):
+    return torch.load(path, map_location=map_location, weights_only=True)
+
+
+class AsyncCheckpointer:
+    """
+    Writes checkpoints on a background thread.
+
+    `save` snapshots the state to CPU and returns; at most one write is in
+    flight, so a second `save` waits for the first instead of queueing
+    unbounded copies. Errors from the writer are raised on the next call.
+    """
+
+    def __init__(self, directory, keep=3):
+        self.directory = str(directory)
+        self.keep = keep
+        os.makedirs(self.directory, exist_ok=True)
+        self._queue = queue.Queue(maxsize=1)
+        self._error = None
+        self._thread = threading.Thread(target=self._worker, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                obj, path, rotate = item
+                atomic_save(obj, path)
+                if rotate:
+                    self._rotate()
+            except Exception as exc:
+                self._error = exc
+            finally:
+                self._queue.task_done()
+
+    def _rotate(self):
+        if self.keep <= 0:
+            return
+        for path in list_checkpoints(self.directory)[:-self.keep]:
+            os.remove(path)
+
+    def _raise_pending(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("checkpoint write failed") from error
+
+    def save(self, state, epoch):
+        """Queue a rotated checkpoint for `epoch`; returns its path."""
+        path = checkpoint_path(self.directory, epoch)
+        self.save_file(state, path, rotate=True)
+        return path
+
+    def save_file(self, obj, path, rotate=False):
+        """Queue an atomic write of `obj` to an arbitrary path (e.g. the best-model weights)."""
+        self._raise_pending()
+        self._queue.put((to_cpu(obj), str(path), rotate))
+
+    def wait(self):
+        self._queue.join()
+        self._raise_pending()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_pending()
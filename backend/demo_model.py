@@ -1,50 +1,39 @@
-import cv2
-import numpy as np
-import torch
-from torchvision import transforms
-from torchvision.models import resnet18, ResNet18_Weights
-from explainability import GradCAM, overlay_heatmap
-
-from PIL import Image
-# --- Load model (ResNet18, matching training) ---
-model = resnet18(weights=ResNet18_Weights.IMAGENET1K_V1)
-num_features = model.fc.in_features
-model.fc = torch.nn.Linear(num_features, 2)  # 2 classes: benign, malignant
-
-# Load trained weights
-model.load_state_dict(torch.load("breast_cancer.pth", map_location=torch.device("cpu")))
-model.eval()
-
-# --- Transform for single image ---
-transform = transforms.Compose([
-    transforms.ToPILImage(),
-    transforms.Resize(224),                     # Resize shorter side to 224
-    transforms.CenterCrop(224),                 # Crop to 224x224 from center
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406],
-                         [0.229, 0.224, 0.225])
-])
+"""
+The default cancer type's model, loaded at import, for scripts and
+benchmarks that want one model without a registry. The server goes
+through model_registry.ModelRegistry instead.
+"""
+from model_registry import DEFAULT_CANCER_TYPE, ServedModel, load_specs
+from tta import MAX_VIEWS
+
+_specs = load_specs()
+served = ServedModel(DEFAULT_CANCER_TYPE, _specs.get(DEFAULT_CANCER_TYPE) or next(iter(_specs.values())))
+
+model = served.model
+ensemble = served.ensemble
+TEMPERATURES = served.temperatures
+features, head, BACKEND_REPORT = served.features, served.head, served.backend_report
+MODEL_FINGERPRINT = served.fingerprint
+explainer = served.explainer
+
+def predict_batch_with_gradcam(image_bytes_list):
+    """Batched variant over raw upload bytes."""
+    return served.predict_bytes(image_bytes_list)
+
+def predict_images_with_gradcam(images, overlay_max_side=None):
+    """Batched variant over decoded RGB images."""
+    return served.predict_images(images, overlay_max_side)
+
+def predict_images_tta_with_gradcam(images, overlay_max_side=None, views=MAX_VIEWS):
+    """Test-time augmented (and ensembled, if configured) variant of predict_images_with_gradcam."""
+    return served.predict_images_tta(images, overlay_max_side, views)
+
+def predict_slide_with_gradcam(img, overlay_max_side=None, **tile_options):
+    """Tiled whole-slide prediction for one decoded RGB image."""
+    return served.predict_slide(img, overlay_max_side, **tile_options)
 
 def predict_cancer_with_gradcam(image_bytes):
-    # --- Preprocessing ---
-    img_array = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img_tensor = transform(img).unsqueeze(0)
-
-    # --- Prediction ---
-    with torch.no_grad():
-        outputs = model(img_tensor)
-        pred_class = torch.argmax(outputs, dim=1).item()
-        confidence = torch.softmax(outputs, dim=1)[0][pred_class].item()
-
-    diagnosis = "benign" if pred_class == 0 else "malignant"
-    certainty_percent = round(confidence * 100, 2)
-
-    # --- Grad-CAM ---
-    target_layer = model.layer4[-1]  # last conv layer in ResNet18
-    gradcam = GradCAM(model, target_layer)
-    cam = gradcam.generate(img_tensor, class_idx=pred_class)
-    overlay_img = overlay_heatmap(img, cam)
-
-    return certainty_percent, diagnosis, overlay_img
\ No newline at end of file
+    result = predict_batch_with_gradcam([image_bytes])[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
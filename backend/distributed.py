@@ -0,0 +1,137 @@
+"""
+DistributedDataParallel helpers for train_model.py.
+
+Launch with torchrun; the gloo backend works on CPU-only hosts:
+
+    torchrun --standalone --nproc_per_node=4 train_model.py
+    torchrun --nnodes=2 --node_rank=0 --nproc_per_node=8 \\
+             --master_addr=<host0> --master_port=29500 train_model.py
+
+torchrun sets OMP_NUM_THREADS=1 for multi-process launches; export it as
+cores / processes-per-host to give each rank its share of intra-op threads.
+Without torchrun's environment everything degrades to a single process.
+"""
+import math
+import os
+
+import torch
+import torch.distributed as dist
+from torch.utils.data import Sampler
+
+
+def init_distributed(backend="gloo"):
+    """Join the process group if launched by torchrun. Returns (rank, world_size, local_rank)."""
+    world_size = int(os.environ.get("WORLD_SIZE", "1"))
+    if world_size <= 1:
+        return 0, 1, 0
+    if not dist.is_initialized():
+        dist.init_process_group(backend=backend)
+    local_rank = int(os.environ.get("LOCAL_RANK", "0"))
+    local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", "1"))
+    if "OMP_NUM_THREADS" not in os.environ:
+        # Split the host's cores between its processes instead of oversubscribing them
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_world_size))
+    return dist.get_rank(), dist.get_world_size(), local_rank
+
+
+def cleanup_distributed():
+    if dist.is_initialized():
+        dist.destroy_process_group()
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized() and dist.get_world_size() > 1
+
+
+def is_main_process():
+    return not is_distributed() or dist.get_rank() == 0
+
+
+def barrier():
+    """Wait for every rank (no-op when not distributed)."""
+    if is_distributed():
+        dist.barrier()
+
+
+def print_main(*args, **kwargs):
+    """print() on rank 0 only."""
+    if is_main_process():
+        print(*args, **kwargs)
+
+
+def all_reduce_sum(*values):
+    """Sum python numbers across ranks (identity when not distributed)."""
+    if not is_distributed():
+        return values
+    t = torch.tensor(values, dtype=torch.float64)
+    dist.all_reduce(t, op=dist.ReduceOp.SUM)
+    return tuple(t.tolist())
+
+
+def all_gather_objects(obj):
+    """[obj from rank 0, obj from rank 1, ...]; [obj] when not distributed."""
+    if not is_distributed():
+        return [obj]
+    gathered = [None] * dist.get_world_size()
+    dist.all_gather_object(gathered, obj)
+    return gathered
+
+
+def broadcast_object(obj, src=0):
+    """`obj` as passed on rank `src`, on every rank; `obj` itself when not distributed."""
+    if not is_distributed():
+        return obj
+    holder = [obj]
+    dist.broadcast_object_list(holder, src=src)
+    return holder[0]
+
+
+def unwrap_model(model):
+    return model.module if isinstance(model, torch.nn.parallel.DistributedDataParallel) else model
+
+
+class DistributedWeightedSampler(Sampler):
+    """
+    WeightedRandomSampler split across ranks.
+
+    Every rank draws the same `num_samples` indices (with replacement) from a
+    generator seeded with seed + epoch, then keeps every world_size-th one, so
+    the union over ranks has the same class-balanced distribution as the
+    single-process sampler. Call set_epoch() before each epoch.
+    """
+
+    def __init__(self, weights, num_samples=None, rank=0, world_size=1, seed=0):
+        self.weights = torch.as_tensor(weights, dtype=torch.double)
+        self.num_samples = num_samples or len(self.weights)
+        self.rank = rank
+        self.world_size = world_size
+        self.seed = seed
+        self.epoch = 0
+        self.generator = None  # epoch-seeded, nothing to checkpoint
+        self.samples_per_rank = math.ceil(self.num_samples / world_size)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.epoch)
+        total = self.samples_per_rank * self.world_size
+        indices = torch.multinomial(self.weights, total, replacement=True, generator=g)
+        return iter(indices[self.rank::self.world_size].tolist())
+
+    def __len__(self):
+        return self.samples_per_rank
+
+
+class ShardSampler(Sampler):
+    """Deterministic rank-strided shard of range(n) without padding, so all-reduced metrics count each item once."""
+
+    def __init__(self, n, rank=0, world_size=1):
+        self.indices = range(rank, n, world_size)
+
+    def __iter__(self):
+        return iter(self.indices)
+
+    def __len__(self):
+        return len(self.indices)
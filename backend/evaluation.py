@@ -0,0 +1,118 @@
+"""
+Batched test-set evaluation and vectorized classification metrics.
+
+`run_inference` streams a DataLoader through a logits function under
+torch.inference_mode and writes into preallocated (N, C) tensors.
+`compute_metrics` reports accuracy, the confusion matrix, ROC-AUC, expected
+calibration error and a per-magnification breakdown using NumPy array ops
+only. BreaKHis filenames carry the magnification, e.g.
+SOB_B_A-14-22549AB-40-001.png is 40x.
+"""
+import os
+import re
+import time
+
+import numpy as np
+import torch
+
+_MAGNIFICATION = re.compile(r"-(\d+)-\d+\.[^.]+$")
+
+
+def magnification_of(path):
+    """Magnification from a BreaKHis filename (40, 100, 200, 400), or 0 if it can't be parsed."""
+    match = _MAGNIFICATION.search(os.path.basename(path))
+    return int(match.group(1)) if match else 0
+
+
+def run_inference(logits_fn, loader, num_samples, num_classes=2):
+    """
+    (logits, labels, timings) for every sample of a non-shuffled loader.
+    Outputs are written into preallocated tensors, with one host sync per batch.
+    """
+    logits = torch.empty((num_samples, num_classes), dtype=torch.float32)
+    labels = torch.empty(num_samples, dtype=torch.int64)
+    offset, model_s = 0, 0.0
+    start = time.perf_counter()
+    with torch.inference_mode():
+        for x, y in loader:
+            n = x.shape[0]
+            t = time.perf_counter()
+            logits[offset:offset + n] = logits_fn(x).float().cpu()
+            model_s += time.perf_counter() - t
+            labels[offset:offset + n] = y
+            offset += n
+    total_s = time.perf_counter() - start
+    timings = {
+        "total_s": total_s,
+        "model_s": model_s,
+        "images_per_s": offset / total_s if total_s else 0.0,
+        "model_images_per_s": offset / model_s if model_s else 0.0,
+    }
+    return logits[:offset], labels[:offset], timings
+
+
+def confusion(labels, preds, num_classes=2):
+    """(C, C) matrix with true classes as rows, as sklearn's confusion_matrix."""
+    return np.bincount(labels * num_classes + preds, minlength=num_classes ** 2).reshape(num_classes, num_classes)
+
+
+def roc_auc(labels, scores):
+    """Binary ROC-AUC via the rank-sum statistic (ties get average ranks); None if only one class is present."""
+    positives = labels == 1
+    n_pos, n_neg = int(positives.sum()), int((~positives).sum())
+    if n_pos == 0 or n_neg == 0:
+        return None
+    order = np.argsort(scores, kind="mergesort")
+    sorted_scores = scores[order]
+    # 1-based ranks, averaged within each group of tied scores
+    _, first, counts = np.unique(sorted_scores, return_index=True, return_counts=True)
+    ranks = np.empty(len(scores), dtype=np.float64)
+    ranks[order] = np.repeat(first + (counts + 1) / 2.0, counts)
+    return float((ranks[positives].sum() - n_pos * (n_pos + 1) / 2.0) / (n_pos * n_neg))
+
+
+def expected_calibration_error(confidences, correct, num_bins=15):
+    """ECE over equal-width confidence bins, plus the per-bin table."""
+    bins = np.minimum((confidences * num_bins).astype(np.int64), num_bins - 1)
+    counts = np.bincount(bins, minlength=num_bins)
+    conf_sum = np.bincount(bins, weights=confidences, minlength=num_bins)
+    acc_sum = np.bincount(bins, weights=correct.astype(np.float64), minlength=num_bins)
+    nonzero = counts > 0
+    avg_conf = np.divide(conf_sum, counts, out=np.zeros(num_bins), where=nonzero)
+    avg_acc = np.divide(acc_sum, counts, out=np.zeros(num_bins), where=nonzero)
+    ece = float((counts / max(len(confidences), 1) * np.abs(avg_acc - avg_conf)).sum())
+    table = [{"bin": i, "count": int(counts[i]), "confidence": float(avg_conf[i]), "accuracy": float(avg_acc[i])}
+             for i in np.flatnonzero(nonzero)]
+    return ece, table
+
+
+def _summary(labels, probs, num_classes):
+    preds = probs.argmax(axis=1)
+    correct = preds == labels
+    cm = confusion(labels, preds, num_classes)
+    ece, _ = expected_calibration_error(probs.max(axis=1), correct)
+    recall = np.divide(np.diag(cm), cm.sum(axis=1), out=np.zeros(num_classes), where=cm.sum(axis=1) > 0)
+    return {
+        "count": int(len(labels)),
+        "accuracy": float(correct.mean() * 100) if len(labels) else 0.0,
+        "roc_auc": roc_auc(labels, probs[:, 1]) if num_classes == 2 else None,
+        "ece": ece,
+        "recall_per_class": recall.tolist(),
+        "confusion_matrix": cm.tolist(),
+    }
+
+
+def compute_metrics(logits, labels, magnifications=None):
+    """Full metrics report from (N, C) logits and (N,) labels."""
+    probs = torch.softmax(torch.as_tensor(logits, dtype=torch.float32), dim=1).numpy()
+    labels = np.asarray(labels, dtype=np.int64)
+    num_classes = probs.shape[1]
+    report = _summary(labels, probs, num_classes)
+    _, report["calibration_bins"] = expected_calibration_error(probs.max(axis=1), probs.argmax(axis=1) == labels)
+    if magnifications is not None:
+        magnifications = np.asarray(magnifications)
+        report["per_magnification"] = {
+            str(mag): _summary(labels[magnifications == mag], probs[magnifications == mag], num_classes)
+            for mag in np.unique(magnifications)
+        }
+    return report
@@ -1,62 +1,204 @@
+import threading
+
 import torch
 import torch.nn.functional as F
 import cv2
 import numpy as np
 
+from telemetry import span
+
 class GradCAM:
-    def __init__(self, model, target_layer):
+    """
+    Grad-CAM explainer that owns its hooks on `target_layer`.
+
+    Build it once and reuse it: every call to `explain` gets the logits, the
+    softmax probabilities and the CAM from a single forward/backward pass.
+    Call `remove_hooks()` (or use it as a context manager) to detach it.
+
+    With `features` and `head` set (see inference_backends.py), the forward
+    up to `target_layer` runs through `features` without autograd and only
+    `head` is differentiated; if `features` fails, the explainer falls back
+    to the eager model for good. The forward hook on `target_layer` is only
+    registered for the eager path, and it hands activations back through
+    thread-local storage, so concurrent explain calls never see each other's.
+    """
+    def __init__(self, model, target_layer, features=None, head=None):
         self.model = model
         self.target_layer = target_layer
-        self.gradients = None
-        self.activations = None
-        self._register_hooks()
+        self.features = features
+        self.head = head
+        self._captured = threading.local()
+        self._handles = []
+        self._hook_lock = threading.Lock()
+        if features is None:
+            self._register_hooks()
 
     def _register_hooks(self):
         def forward_hook(module, input, output):
-            self.activations = output.detach()
-        def backward_hook(module, grad_in, grad_out):
-            self.gradients = grad_out[0].detach()
-        self.target_layer.register_forward_hook(forward_hook)
-        self.target_layer.register_backward_hook(backward_hook)
+            # Keep the graph-attached output so explain() can differentiate
+            # w.r.t. it directly instead of back-propagating into every weight.
+            self._captured.activations = output
+        with self._hook_lock:
+            if not self._handles:
+                self._handles.append(self.target_layer.register_forward_hook(forward_hook))
 
-    def generate(self, input_tensor, class_idx=None):
-        output = self.model(input_tensor)
-        if class_idx is None:
-            class_idx = output.argmax(dim=1).item()
+    def remove_hooks(self):
+        with self._hook_lock:
+            for handle in self._handles:
+                handle.remove()
+            self._handles.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.remove_hooks()
+
+    def _forward(self, input_tensor):
+        """Graph-attached (logits, target-layer activations); call under torch.enable_grad()."""
+        features = self.features
+        if features is not None:
+            try:
+                with torch.no_grad():
+                    activations = features(input_tensor).float()
+            except Exception as e:
+                print(f"Grad-CAM: feature backend failed ({e!r}), falling back to the eager model")
+                self.features = None
+                self._register_hooks()
+            else:
+                activations.requires_grad_(True)
+                return self.head(activations), activations
+
+        self._captured.activations = None
+        logits = self.model(input_tensor)
+        activations = self._captured.activations
+        self._captured.activations = None
+        return logits, activations
+
+    def explain(self, input_tensor, class_idx=None, upsample=True):
+        """
+        Run one forward/backward pass over a (N, 3, H, W) batch.
+        Returns (logits, probs, class_idx, cams) where cams is (N, H, W) in [0, 1].
+        With upsample=False the cams stay at the target layer's resolution
+        (7x7 for ResNet18) so the caller can resize them once to display size.
+        """
+        with torch.enable_grad():
+            with span("forward"):
+                logits, activations = self._forward(input_tensor)
 
-        self.model.zero_grad()
-        one_hot = torch.zeros_like(output)
-        one_hot[0, class_idx] = 1
-        output.backward(gradient=one_hot, retain_graph=True)
+            if class_idx is None:
+                class_idx = logits.argmax(dim=1)
+            elif not torch.is_tensor(class_idx):
+                class_idx = torch.as_tensor(class_idx, device=logits.device).reshape(-1)
+            class_idx = class_idx.expand(logits.shape[0])
 
-        # Compute weights
-        weights = self.gradients.mean(dim=(2,3), keepdim=True)
-        cam = (weights * self.activations).sum(dim=1, keepdim=True)
+            # Each sample's score only depends on its own activations, so the
+            # gradient of the summed scores is the per-sample gradient.
+            score = logits.gather(1, class_idx.view(-1, 1)).sum()
+            with span("gradcam_backward"):
+                gradients, = torch.autograd.grad(score, activations)
+
+        logits = logits.detach()
+        probs = torch.softmax(logits, dim=1)
+        cam = self._cams(gradients.detach(), activations.detach(), input_tensor.shape[2:] if upsample else None)
+        return logits, probs, class_idx, cam
+
+    def explain_views(self, input_tensor, num_views, choose_class, upsample=False):
+        """
+        One forward/backward pass over a view-major (V*N, 3, H, W) batch of
+        test-time augmented views (see tta.py), explaining the first view of
+        each input. `choose_class` maps the detached (V*N, C) logits to the
+        (N,) classes to explain, e.g. the argmax of view-averaged probabilities.
+        Returns (logits, class_idx, cams) with cams (N, h, w) in [0, 1].
+        """
+        n = input_tensor.shape[0] // num_views
+        with torch.enable_grad():
+            with span("forward"):
+                logits, activations = self._forward(input_tensor)
+            class_idx = choose_class(logits.detach())
+            # Only the unaugmented rows are scored, so the other views get zero gradient
+            score = logits[:n].gather(1, class_idx.view(-1, 1)).sum()
+            with span("gradcam_backward"):
+                gradients, = torch.autograd.grad(score, activations)
+
+        cam = self._cams(gradients[:n].detach(), activations[:n].detach(), input_tensor.shape[2:] if upsample else None)
+        return logits.detach(), class_idx, cam
+
+    @staticmethod
+    def _cams(gradients, activations, size=None):
+        """(N, h, w) CAMs in [0, 1] as a numpy array; upsampled to `size` if given."""
+        weights = gradients.mean(dim=(2, 3), keepdim=True)
+        cam = (weights * activations).sum(dim=1, keepdim=True)
 
         cam = F.relu(cam)
-        cam = F.interpolate(cam, size=input_tensor.shape[2:], mode='bilinear', align_corners=False)
-        cam = cam.squeeze().cpu().numpy()
-        cam = (cam - cam.min()) / (cam.max() - cam.min() + 1e-8)
-        return cam
+        if size is not None:
+            cam = F.interpolate(cam, size=size, mode='bilinear', align_corners=False)
+        cam = cam.squeeze(1)
+        flat = cam.flatten(1)
+        cam_min = flat.min(dim=1).values.view(-1, 1, 1)
+        cam_max = flat.max(dim=1).values.view(-1, 1, 1)
+        cam = (cam - cam_min) / (cam_max - cam_min + 1e-8)
+        return cam.cpu().numpy()
 
-import cv2
-import numpy as np
+    def explain_classes(self, input_tensor, num_classes=None, temperature=1.0):
+        """
+        One forward pass, then a CAM for every class.
+        Returns (probs, cams) with cams (C, N, h, w) at the target layer's
+        resolution, ReLU'd but not normalised, so CAMs of different inputs
+        (e.g. tiles of one slide) stay comparable and can be stitched; probs
+        are softmax(logits / temperature).
+        """
+        with torch.enable_grad():
+            with span("forward"):
+                logits, activations = self._forward(input_tensor)
+            num_classes = num_classes or logits.shape[1]
+            cams = []
+            with span("gradcam_backward"):
+                for c in range(num_classes):
+                    gradients, = torch.autograd.grad(logits[:, c].sum(), activations,
+                                                     retain_graph=c < num_classes - 1)
+                    weights = gradients.mean(dim=(2, 3), keepdim=True)
+                    cams.append(F.relu((weights * activations.detach()).sum(dim=1)))
+        return torch.softmax(logits.detach() / temperature, dim=1), torch.stack(cams)
 
-def overlay_heatmap(img, cam, alpha=0.5, colormap=cv2.COLORMAP_JET):
+    def generate(self, input_tensor, class_idx=None):
+        _, _, _, cams = self.explain(input_tensor, class_idx=class_idx)
+        return cams[0]
+
+_colormap_luts = {}
+
+def colormap_lut(colormap=cv2.COLORMAP_JET):
+    """256-entry (256, 3) uint8 lookup table for an OpenCV colormap, built once."""
+    lut = _colormap_luts.get(colormap)
+    if lut is None:
+        lut = cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(256, 1), colormap).reshape(256, 3)
+        _colormap_luts[colormap] = lut
+    return lut
+
+def overlay_heatmap(img, cam, alpha=0.5, colormap=cv2.COLORMAP_JET, max_side=None, out=None):
     """
     img: original image (H, W, 3) uint8
-    cam: Grad-CAM output (H, W) float normalized 0-1
+    cam: Grad-CAM output (h, w) float normalized 0-1, at any resolution
+         (the raw feature-map grid is enough; it is upsampled exactly once)
+    max_side: optional cap on the longer side of the returned overlay
+    out: optional preallocated uint8 buffer of the output shape to blend into
     """
-    # Ensure cam is same size as image
-    cam_resized = cv2.resize(cam, (img.shape[1], img.shape[0]))
-
-    # Convert to 0-255 uint8
-    heatmap = np.uint8(255 * cam_resized)
+    h, w = img.shape[:2]
+    if max_side and max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        w, h = max(1, round(w * scale)), max(1, round(h * scale))
+        img = cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA)
 
-    # Apply colormap (converts to 3 channels)
-    heatmap = cv2.applyColorMap(heatmap, colormap)
+    # Quantise the small CAM first, then upsample straight to output size as uint8
+    cam_u8 = np.empty(cam.shape, dtype=np.uint8)
+    np.multiply(cam, 255, out=cam_u8, casting="unsafe")
+    cam_u8 = cv2.resize(cam_u8, (w, h), interpolation=cv2.INTER_LINEAR)
 
-    # Overlay heatmap onto original image
-    overlay = cv2.addWeighted(heatmap, alpha, img, 1 - alpha, 0)
-    return overlay
+    # Colormap via LUT, written directly into the output buffer
+    if out is None:
+        out = np.empty((h, w, 3), dtype=np.uint8)
+    np.take(colormap_lut(colormap), cam_u8, axis=0, out=out, mode="clip")  # clip: no buffered copy
 
+    # Overlay heatmap onto original image, in place
+    cv2.addWeighted(out, alpha, img, 1 - alpha, 0, dst=out)
+    return out
@@ -0,0 +1,55 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """
+    Local stand-in for ChatOpenAI that streams a canned reply word by word.
+
+    `first_token_delay` simulates time-to-first-token and `token_delay` the
+    gap between tokens, so streaming and non-streaming paths can be measured
+    offline. Select it in main.py with LIFELENS_CHAT_MODEL=fake.
+    """
+
+    reply: str = (
+        "This is a simulated LifeLens reply. The analysis suggests reviewing the "
+        "result with a qualified healthcare professional, who can interpret it in "
+        "the context of your full medical history. This is not a diagnosis."
+    )
+    first_token_delay: float = 0.5
+    token_delay: float = 0.02
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-chat"
+
+    def _tokens(self) -> List[str]:
+        words = self.reply.split(" ")
+        return [w if i == 0 else f" {w}" for i, w in enumerate(words)]
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for i, token in enumerate(self._tokens()):
+            time.sleep(self.first_token_delay if i == 0 else self.token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        for i, token in enumerate(self._tokens()):
+            await asyncio.sleep(self.first_token_delay if i == 0 else self.token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        text = "".join(chunk.message.content for chunk in self._stream(messages, stop))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        parts = [chunk.message.content async for chunk in self._astream(messages, stop)]
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(parts)))])
@@ -3,7 +3,7 @@ import matplotlib.pyplot as plt
 import torch
 from torchvision import transforms
 from torch.utils.data import DataLoader
-from process_data import CancerDataset, testing_data
+from process_data import CancerDataset
 from torchvision.models import resnet18, ResNet18_Weights
 import torch.nn as nn
 import numpy as np
@@ -25,7 +25,7 @@ test_transform = transforms.Compose([
 ])
 
 # --- Dataset and DataLoader ---
-dataset_test = CancerDataset(testing_data, transform=test_transform)
+dataset_test = CancerDataset("test", transform=test_transform)
 test_loader = DataLoader(dataset_test, batch_size=batch_size, shuffle=False)
 
 # --- Load model ---
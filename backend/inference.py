@@ -0,0 +1,171 @@
+from io import BytesIO
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from explainability import overlay_heatmap
+from telemetry import span
+from tiling import predict_slide
+from tta import MAX_VIEWS, average_probs, expand_views
+
+CLASS_NAMES = {0: "benign", 1: "malignant"}
+
+# --- Preprocessing (per model in model_registry.py; this is the breast cancer default) ---
+DEFAULT_PREPROCESSING = {
+    "resize": 224,                    # Resize shorter side to 224
+    "crop": 224,                      # Crop to 224x224 from center (also the tile size in tiled mode)
+    "mean": [0.485, 0.456, 0.406],
+    "std": [0.229, 0.224, 0.225],
+}
+
+def make_transform(preprocessing):
+    return transforms.Compose([
+        transforms.ToPILImage(),
+        transforms.Resize(preprocessing["resize"]),
+        transforms.CenterCrop(preprocessing["crop"]),
+        transforms.ToTensor(),
+        transforms.Normalize(preprocessing["mean"], preprocessing["std"]),
+    ])
+
+# --- Transform for single image (same as the served model) ---
+transform = make_transform(DEFAULT_PREPROCESSING)
+
+# cv2 flags that decode at 1/2, 1/4 or 1/8 size (JPEG scales during decoding)
+_REDUCED_READS = ((2, cv2.IMREAD_REDUCED_COLOR_2), (4, cv2.IMREAD_REDUCED_COLOR_4), (8, cv2.IMREAD_REDUCED_COLOR_8))
+
+def image_size(image_bytes):
+    """(width, height) from the image header without decoding pixels, or None if unknown."""
+    try:
+        with Image.open(BytesIO(image_bytes)) as im:
+            return im.size
+    except Image.DecompressionBombError:
+        return (1 << 16, 1 << 16)  # far too large; forces the strongest reduction
+    except Exception:
+        return None
+
+def decode_image(image_bytes, max_pixels=None):
+    """
+    Decode uploaded bytes into an RGB uint8 array. With max_pixels, images
+    larger than that are decoded at 1/2, 1/4 or 1/8 size instead of at full
+    resolution.
+    """
+    img_array = np.frombuffer(image_bytes, np.uint8)
+    flags = cv2.IMREAD_COLOR
+    size = image_size(image_bytes) if max_pixels else None
+    if size and size[0] * size[1] > max_pixels:
+        flags = _REDUCED_READS[-1][1]
+        for factor, reduced in _REDUCED_READS:
+            if size[0] * size[1] / factor ** 2 <= max_pixels:
+                flags = reduced
+                break
+    img = cv2.imdecode(img_array, flags)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+def predict_batch(explainer, images, overlay_max_side=None, temperature=1.0, preprocess=transform,
+                  class_names=CLASS_NAMES):
+    """
+    Classify and explain a list of RGB images with one batched forward/backward pass.
+    Returns a list of (certainty_percent, diagnosis, overlay_img); overlays are
+    capped to overlay_max_side on their longer side if given. Certainties use
+    softmax(logits / temperature).
+    """
+    with span("transform"):
+        batch = torch.stack([preprocess(img) for img in images])
+    # Keep the CAM at feature-map resolution; overlay_heatmap upsamples it once
+    logits, probs, class_idx, cams = explainer.explain(batch, upsample=False)
+    if temperature != 1.0:
+        probs = torch.softmax(logits / temperature, dim=1)
+    confidences = probs.gather(1, class_idx.view(-1, 1)).squeeze(1).tolist()
+
+    results = []
+    with span("overlay"):
+        for img, pred_class, confidence, cam in zip(images, class_idx.tolist(), confidences, cams):
+            diagnosis = class_names[pred_class]
+            certainty_percent = round(confidence * 100, 2)
+            results.append((certainty_percent, diagnosis, overlay_heatmap(img, cam, max_side=overlay_max_side)))
+    return results
+
+def predict_batch_tta(explainer, images, overlay_max_side=None, views=MAX_VIEWS, ensemble=None, temperature=1.0,
+                      preprocess=transform, class_names=CLASS_NAMES):
+    """
+    Test-time augmented predict_batch. The `views` flips/rotations of every
+    image go through the model in one forward pass, and through the extra
+    `ensemble` checkpoints in one vmapped pass. Probabilities are averaged
+    over views and models; the CAM is the served model's on the unaugmented
+    view. Returns a list of (certainty_percent, diagnosis, overlay_img, tta_info).
+    """
+    with span("transform"):
+        batch = expand_views(torch.stack([preprocess(img) for img in images]), views)
+    extra_logits = None
+    if ensemble is not None:
+        with torch.no_grad(), span("ensemble_forward"):
+            extra_logits = ensemble(batch).float()
+
+    def combine(logits):
+        if extra_logits is not None:
+            logits = torch.cat([logits.unsqueeze(0), extra_logits])
+        return average_probs(logits, views, temperature)
+
+    logits, class_idx, cams = explainer.explain_views(batch, views, lambda logits: combine(logits)[0].argmax(dim=1))
+    mean, std = combine(logits)
+    models = 1 + (ensemble.size if ensemble is not None else 0)
+
+    results = []
+    with span("overlay"):
+        for img, pred_class, probs, spread, cam in zip(images, class_idx.tolist(), mean.tolist(), std.tolist(), cams):
+            tta_info = {
+                "views": views,
+                "models": models,
+                "probabilities": {class_names[c]: round(p * 100, 2) for c, p in enumerate(probs)},
+                "certaintyStd": round(spread[pred_class] * 100, 2),
+            }
+            overlay = overlay_heatmap(img, cam, max_side=overlay_max_side)
+            results.append((round(probs[pred_class] * 100, 2), class_names[pred_class], overlay, tta_info))
+    return results
+
+def predict_tiled(explainer, img, overlay_max_side=None, tile_batch_size=16, overlap=0.25, min_tissue=0.05,
+                  preprocessing=DEFAULT_PREPROCESSING, temperature=1.0, class_names=CLASS_NAMES):
+    """
+    Whole-slide variant of predict_batch for one RGB image: overlapping
+    native-resolution tiles, averaged probabilities and a stitched CAM.
+    Tiles are preprocessing["crop"] pixels, normalised with its mean/std, and
+    each tile's probabilities are softmax(logits / temperature) as in predict_batch.
+    Returns (certainty_percent, diagnosis, overlay_img, tile_info).
+    """
+    slide = predict_slide(explainer, img, tile=preprocessing["crop"], overlap=overlap, batch_size=tile_batch_size,
+                          min_tissue=min_tissue, mean=preprocessing["mean"], std=preprocessing["std"],
+                          temperature=temperature)
+    certainty_percent = round(float(slide["probs"][slide["class_idx"]]) * 100, 2)
+    with span("overlay"):
+        overlay = overlay_heatmap(img, slide["cam"], max_side=overlay_max_side)
+    tile_info = {
+        "tiles": slide["tiles"],
+        "skippedTiles": slide["skipped_tiles"],
+        "imageSize": [int(img.shape[1]), int(img.shape[0])],
+        "maxTileCertainty": round(float(slide["max_probs"][slide["class_idx"]]) * 100, 2),
+    }
+    return certainty_percent, class_names[slide["class_idx"]], overlay, tile_info
+
+def predict_bytes_batch(explainer, image_bytes_list, overlay_max_side=None, **predict_options):
+    """
+    Decode and run a batch of uploads. Uploads that fail to decode get their
+    exception in place of a result so one bad file doesn't fail the batch.
+    """
+    results = [None] * len(image_bytes_list)
+    decoded, positions = [], []
+    for i, image_bytes in enumerate(image_bytes_list):
+        try:
+            decoded.append(decode_image(image_bytes))
+            positions.append(i)
+        except Exception as e:
+            results[i] = e
+
+    if decoded:
+        for i, result in zip(positions, predict_batch(explainer, decoded, overlay_max_side, **predict_options)):
+            results[i] = result
+    return results
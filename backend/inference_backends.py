@@ -0,0 +1,195 @@
+"""
+Selectable CPU inference backends for the served ResNet18.
+
+Grad-CAM on layer4[-1] only needs gradients from the class score back to
+that layer's output, and those flow through avgpool + fc alone. A backend
+therefore only runs the convolutional trunk (conv1 .. layer4) and returns
+the (N, 512, 7, 7) feature map; the eager fp32 head turns it into logits
+and CAM gradients.
+
+    eager         the fp32 trunk as-is
+    torchscript   traced, frozen and optimized for inference
+    compile       torch.compile
+    onnx          ONNX export run by ONNX Runtime
+    int8-dynamic  ONNX Runtime dynamic int8 quantization of the export
+    int8-static   PyTorch FX static int8 quantization, calibrated on validation images
+
+Before a non-eager backend is used, its probabilities are compared with
+eager fp32 on calibration images. If it drifts past the tolerance, or it
+cannot be built (e.g. onnxruntime is not installed), the loader falls back
+to eager and reports why.
+"""
+import contextlib
+import copy
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+
+BACKENDS = ("eager", "torchscript", "compile", "onnx", "int8-dynamic", "int8-static")
+
+
+def trunk_of(model):
+    """ResNet18 up to and including layer4, i.e. the Grad-CAM target layer's output."""
+    return nn.Sequential(
+        model.conv1, model.bn1, model.relu, model.maxpool,
+        model.layer1, model.layer2, model.layer3, model.layer4,
+    ).eval()
+
+
+def head_of(model):
+    def head(features):
+        return model.fc(torch.flatten(model.avgpool(features), 1))
+    return head
+
+
+class OnnxTrunk:
+    """ONNX Runtime session wrapped to take and return torch tensors."""
+    def __init__(self, path):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, x):
+        features, = self.session.run(None, {"input": x.detach().contiguous().numpy()})
+        return torch.from_numpy(features)
+
+
+def _export_onnx(trunk, example, path):
+    torch.onnx.export(
+        trunk, example, path, input_names=["input"], output_names=["features"],
+        dynamic_axes={"input": {0: "batch"}, "features": {0: "batch"}}, opset_version=17,
+    )
+    return path
+
+
+def _build_torchscript(trunk, example, calibration, work_dir):
+    with torch.no_grad():
+        traced = torch.jit.trace(trunk, example)
+    return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+
+def _build_compile(trunk, example, calibration, work_dir):
+    compiled = torch.compile(trunk, dynamic=True)
+    with torch.no_grad():
+        compiled(example)  # compile now rather than on the first request
+    return compiled
+
+
+def _build_onnx(trunk, example, calibration, work_dir):
+    return OnnxTrunk(_export_onnx(trunk, example, os.path.join(work_dir, "resnet18_trunk.onnx")))
+
+
+def _build_int8_dynamic(trunk, example, calibration, work_dir):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    fp32_path = _export_onnx(trunk, example, os.path.join(work_dir, "resnet18_trunk.onnx"))
+    int8_path = os.path.join(work_dir, "resnet18_trunk.int8.onnx")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return OnnxTrunk(int8_path)
+
+
+def _build_int8_static(trunk, example, calibration, work_dir):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    if not calibration:
+        raise ValueError("int8-static needs calibration images")
+    engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "fbgemm"
+    torch.backends.quantized.engine = engine
+    prepared = prepare_fx(copy.deepcopy(trunk), get_default_qconfig_mapping(engine), example_inputs=(example,))
+    with torch.no_grad():
+        for batch in calibration:
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+_BUILDERS = {
+    "eager": lambda trunk, example, calibration, work_dir: trunk,
+    "torchscript": _build_torchscript,
+    "compile": _build_compile,
+    "onnx": _build_onnx,
+    "int8-dynamic": _build_int8_dynamic,
+    "int8-static": _build_int8_static,
+}
+
+
+def calibration_batches(root, split="val", max_images=64, batch_size=16, transform=None):
+    """Serving-preprocessed validation images in batches; [] if the split isn't on disk."""
+    from process_data import list_split
+
+    if transform is None:
+        from inference import transform
+    try:
+        paths, _ = list_split(split, root)
+    except (OSError, ValueError):
+        return []
+    # Spread the sample over both classes instead of taking the first folder only
+    if len(paths) > max_images:
+        paths = [paths[i] for i in np.linspace(0, len(paths) - 1, max_images).astype(int)]
+    tensors = []
+    for path in paths:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is not None:
+            tensors.append(transform(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)))
+    return [torch.stack(tensors[i:i + batch_size]) for i in range(0, len(tensors), batch_size)]
+
+
+def measure_drift(reference, candidate, head, batches):
+    """Max absolute softmax difference and top-1 agreement of `candidate` vs `reference` features."""
+    max_diff, agree, n = 0.0, 0, 0
+    with torch.no_grad():
+        for batch in batches:
+            ref = torch.softmax(head(reference(batch)), dim=1)
+            cand = torch.softmax(head(candidate(batch).float()), dim=1)
+            max_diff = max(max_diff, float((ref - cand).abs().max()))
+            agree += int((ref.argmax(1) == cand.argmax(1)).sum())
+            n += batch.shape[0]
+    return {"max_prob_diff": max_diff, "top1_agreement": agree / n if n else 1.0, "images": n}
+
+
+def load_backend(model, name="eager", calibration=None, tolerance=0.05, min_agreement=0.98, work_dir=None):
+    """
+    Build the trunk for backend `name` and check it against eager fp32.
+    Returns (features_fn, head_fn, report); features_fn is the eager trunk
+    whenever the requested backend is rejected.
+    """
+    if name not in _BUILDERS:
+        raise ValueError(f"Unknown inference backend '{name}', expected one of {BACKENDS}")
+    trunk, head = trunk_of(model), head_of(model)
+    report = {"requested": name, "backend": "eager", "build_s": 0.0, "drift": None, "rejected": None}
+    if name == "eager":
+        return trunk, head, report
+
+    # Drift is judged on real validation images when available, random inputs otherwise
+    checks = calibration or [torch.randn(8, 3, 224, 224)]
+    example = checks[0][:1]
+    start = time.perf_counter()
+    try:
+        # ORT reads the exported model into the session, so a scratch dir can go once it is built
+        with contextlib.nullcontext(work_dir) if work_dir else tempfile.TemporaryDirectory(
+                prefix="lifelens-backend-") as build_dir:
+            candidate = _BUILDERS[name](trunk, example, calibration, build_dir)
+        drift = measure_drift(trunk, candidate, head, checks)
+    except Exception as e:
+        report["rejected"] = f"build failed: {e!r}"
+        print(f"Inference backend '{name}' unavailable ({e!r}), using eager")
+        return trunk, head, report
+    report["build_s"] = time.perf_counter() - start
+    report["drift"] = drift
+    if drift["max_prob_diff"] > tolerance or drift["top1_agreement"] < min_agreement:
+        report["rejected"] = (f"drift: max prob diff {drift['max_prob_diff']:.4f} (tolerance {tolerance}), "
+                              f"top-1 agreement {drift['top1_agreement']:.3f} (min {min_agreement})")
+        print(f"Inference backend '{name}' rejected, {report['rejected']}; using eager")
+        return trunk, head, report
+    report["backend"] = name
+    print(f"Inference backend '{name}' ready in {report['build_s']:.1f}s "
+          f"(max prob diff {drift['max_prob_diff']:.4f}, top-1 agreement {drift['top1_agreement']:.3f})")
+    return candidate, head, report
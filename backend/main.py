@@ -1,18 +1,344 @@
-from fastapi import FastAPI, File, UploadFile, Request, HTTPException
+import asyncio
+import contextvars
+import json
+import os
+import secrets
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, UploadFile, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from io import BytesIO
-from PIL import Image
-import base64
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import SystemMessage
 
-from demo_model import predict_cancer_with_gradcam  # Your ML model
+# torch, cv2, the ResNet weights and langchain_openai are imported by the
+# startup task (see MODEL LOADING below), not here, so the server binds fast
+from prediction_cache import PredictionCache
+from overlay_encoding import FORMATS, encode_overlay, extension, media_type, to_data_uri
+from batching import InFlightLimit, MicroBatcher, QueueFullError, ViewBudget
+from chat_history import ChatHistoryManager, get_encoding
+from answer_cache import AnswerCache, results_key
+from sessions import SESSION_COOKIE, SESSION_HEADER, create_session_store, new_session_state, new_session_token
+from telemetry import (PROFILE_ID_HEADER, REQUEST_ID_HEADER, TelemetryMiddleware, current_request_id,
+                       observe_chat_usage, observe_stage, profile_path, render_metrics, set_enabled, span)
 
 # ==================== SETUP ====================
 load_dotenv()
-app = FastAPI()
+
+# Concurrent uploads are gathered for up to BATCH_WINDOW_MS (or BATCH_MAX_SIZE
+# images) and run through the model as one batch.
+BATCH_MAX_SIZE = int(os.getenv("LIFELENS_BATCH_MAX_SIZE", "16"))
+BATCH_WINDOW_MS = float(os.getenv("LIFELENS_BATCH_WINDOW_MS", "10"))
+
+# Blocking work (inference, image encoding) runs on this bounded pool so the
+# event loop keeps serving /health and other requests. Once QUEUE_MAX_SIZE
+# uploads are waiting, /predict answers 503 instead of queueing more.
+# Defaults to one worker per physical core (counted from /proc/cpuinfo, since
+# torch isn't imported yet); the cores are split between the workers' intra-op
+# thread pools so N workers don't each run a pool as wide as the machine.
+def physical_cores():
+    """Physical CPU cores (Linux), or os.cpu_count() when they can't be counted."""
+    try:
+        cores, physical_id = set(), None
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                key = key.strip()
+                if key == "physical id":
+                    physical_id = value.strip()
+                elif key == "core id":
+                    cores.add((physical_id, value.strip()))
+        if cores:
+            return len(cores)
+    except OSError:
+        pass
+    return os.cpu_count() or 1
+
+
+CPU_CORES = physical_cores()
+INFERENCE_WORKERS = int(os.getenv("LIFELENS_INFERENCE_WORKERS") or CPU_CORES)
+INTRA_OP_THREADS = max(1, CPU_CORES // INFERENCE_WORKERS)
+QUEUE_MAX_SIZE = int(os.getenv("LIFELENS_QUEUE_MAX_SIZE", "64"))
+RETRY_AFTER_SECONDS = 1
+
+# Cap on the longer side of the returned overlay (0 = full image resolution)
+OVERLAY_MAX_SIDE = int(os.getenv("LIFELENS_OVERLAY_MAX_SIDE", "0")) or None
+
+# Prediction mode: "center" resizes and centre-crops to 224 (micro-batched),
+# "tiled" scores overlapping native-resolution tiles of the whole slide and
+# stitches their CAMs (see tiling.py), "tta" averages up to TTA_MAX_VIEWS
+# flips/rotations (and any LIFELENS_ENSEMBLE_WEIGHTS checkpoints) in one
+# forward pass (see tta.py). Clients can pick with ?mode=.
+# Tiled uploads above TILED_MAX_PIXELS are decoded at a reduced size, and
+# beyond TILED_MAX_IN_FLIGHT concurrent tiled predictions /predict answers 503.
+PREDICT_MODE = os.getenv("LIFELENS_PREDICT_MODE", "center").lower()
+TILE_BATCH_SIZE = int(os.getenv("LIFELENS_TILE_BATCH_SIZE", "16"))
+TILE_OVERLAP = float(os.getenv("LIFELENS_TILE_OVERLAP", "0.25"))
+TILE_MIN_TISSUE = float(os.getenv("LIFELENS_TILE_MIN_TISSUE", "0.05"))
+TILED_MAX_PIXELS = int(float(os.getenv("LIFELENS_TILED_MAX_PIXELS", "1e8")))
+TILED_MAX_IN_FLIGHT = int(os.getenv("LIFELENS_TILED_MAX_IN_FLIGHT", str(min(QUEUE_MAX_SIZE, 8))))
+TTA_MAX_VIEWS = int(os.getenv("LIFELENS_TTA_VIEWS", "8"))
+TTA_MIN_VIEWS = int(os.getenv("LIFELENS_TTA_MIN_VIEWS", "1"))
+# Per-batch latency budget for TTA (0 = always TTA_MAX_VIEWS); under load the
+# view count drops so the batch plus the queue behind it fits the budget
+TTA_BUDGET_MS = float(os.getenv("LIFELENS_TTA_BUDGET_MS", "0"))
+PREDICT_MODES = ("center", "tiled", "tta")
+if PREDICT_MODE not in PREDICT_MODES:
+    raise ValueError(f"LIFELENS_PREDICT_MODE must be one of {PREDICT_MODES}")
+
+# Per-stage timing spans, request IDs and /metrics (LIFELENS_TELEMETRY=0 turns
+# them off). With LIFELENS_PROFILE_DIR set, a request sent with "X-Profile: 1"
+# is sampled every PROFILE_INTERVAL_MS and its collapsed stacks are served
+# from GET /profiles/{profile id} (the id comes back in X-Profile-Id).
+TELEMETRY_ENABLED = os.getenv("LIFELENS_TELEMETRY", "1") == "1"
+PROFILE_DIR = os.getenv("LIFELENS_PROFILE_DIR") or None
+PROFILE_INTERVAL_MS = float(os.getenv("LIFELENS_PROFILE_INTERVAL_MS", "5"))
+set_enabled(TELEMETRY_ENABLED)
+
+def init_inference_thread():
+    """Runs in each inference worker as the pool starts it; imports torch there, not at module import"""
+    import torch
+    torch.set_num_threads(INTRA_OP_THREADS)
+
+
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference",
+                                        initializer=init_inference_thread)
+
+
+async def run_blocking(fn, *args):
+    """Run a blocking call on the inference pool without stalling the event loop"""
+    loop = asyncio.get_running_loop()
+    # Run in a copy of the caller's context so spans land in its request trace
+    return await loop.run_in_executor(inference_executor, contextvars.copy_context().run, fn, *args)
+
+
+def run_grouped(items, predict):
+    """
+    Run a micro-batch of (served_model, img) items as one batch per model;
+    results come back in item order
+    """
+    groups = {}
+    for i, (served, _) in enumerate(items):
+        groups.setdefault(id(served), (served, []))[1].append(i)
+    results = [None] * len(items)
+    for served, positions in groups.values():
+        for i, result in zip(positions, predict(served, [items[i][1] for i in positions])):
+            results[i] = result
+    return results
+
+
+def predict_images(items):
+    """Micro-batcher entry point over (served_model, img) items"""
+    return run_grouped(items, lambda served, images: served.predict_images(images, overlay_max_side=OVERLAY_MAX_SIDE))
+
+
+predict_batcher = MicroBatcher(
+    predict_images,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_WINDOW_MS,
+    executor=inference_executor,
+    max_queue_size=QUEUE_MAX_SIZE,
+)
+
+tta_budget = ViewBudget(TTA_MAX_VIEWS, budget_ms=TTA_BUDGET_MS, min_views=TTA_MIN_VIEWS)
+
+
+def predict_images_tta(items):
+    """TTA micro-batcher entry point; picks the view count for this batch from the latency budget"""
+    views = tta_budget.choose(len(items), tta_batcher.queue_depth())
+    start = time.perf_counter()
+    results = run_grouped(
+        items, lambda served, images: served.predict_images_tta(images, overlay_max_side=OVERLAY_MAX_SIDE, views=views))
+    tta_budget.record(len(items), views, time.perf_counter() - start)
+    return results
+
+
+tta_batcher = MicroBatcher(
+    predict_images_tta,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_WINDOW_MS,
+    executor=inference_executor,
+    max_queue_size=QUEUE_MAX_SIZE,
+)
+
+# Tiled slides batch their own tiles on the inference pool (see predict_slide)
+tiled_limit = InFlightLimit(TILED_MAX_IN_FLIGHT)
+
+# Re-uploads of the same slide are served from a content-addressed cache
+# (keyed on upload bytes / decoded pixels plus the weights fingerprint).
+CACHE_MAX_MB = float(os.getenv("LIFELENS_CACHE_MAX_MB", "256"))
+CACHE_DIR = os.getenv("LIFELENS_CACHE_DIR") or None
+prediction_cache = None  # created once the model (and so its fingerprint) is loaded
+
+# Overlay encoding (png | webp | jpeg) and delivery: "inline" embeds a data
+# URI in the JSON, "url" returns a link to GET /predict/{id}/overlay.{ext}.
+# Clients can pick per request with ?overlay=inline|url.
+OVERLAY_FORMAT = os.getenv("LIFELENS_OVERLAY_FORMAT", "png").lower()
+OVERLAY_QUALITY = int(os.getenv("LIFELENS_OVERLAY_QUALITY", "85"))
+OVERLAY_PNG_COMPRESS_LEVEL = int(os.getenv("LIFELENS_OVERLAY_PNG_COMPRESS_LEVEL", "6"))
+OVERLAY_DELIVERY = os.getenv("LIFELENS_OVERLAY_DELIVERY", "inline").lower()
+if OVERLAY_FORMAT not in FORMATS:
+    raise ValueError(f"LIFELENS_OVERLAY_FORMAT must be one of {sorted(FORMATS)}")
+
+# Overlay URLs point into the prediction cache. With several uvicorn workers
+# (WEB_CONCURRENCY, or the shared SQLite session backend) the follow-up GET
+# usually reaches another worker, which can only find the overlay in the disk
+# tier; without LIFELENS_CACHE_DIR, "url" requests are then answered inline.
+MULTI_WORKER = (int(os.getenv("WEB_CONCURRENCY", "1")) > 1
+                or os.getenv("LIFELENS_SESSION_BACKEND", "memory").lower() == "sqlite")
+URL_DELIVERY_AVAILABLE = bool(CACHE_DIR) or (not MULTI_WORKER and CACHE_MAX_MB > 0)
+if OVERLAY_DELIVERY == "url" and not URL_DELIVERY_AVAILABLE:
+    print("LIFELENS_OVERLAY_DELIVERY=url needs LIFELENS_CACHE_DIR with multiple workers "
+          "(or a memory cache with one); overlays are returned inline")
+
+# ==================== MODEL LOADING ====================
+# A startup task builds the chat model, loads the default cancer type's ResNet
+# and runs warmup batches (one per size in WARMUP_BATCH_SIZES) through the
+# full predict + overlay encoding path. /health answers as soon as the server
+# is up; /ready and /predict wait until warmup has finished.
+WARMUP_BATCH_SIZES = [int(s) for s in os.getenv("LIFELENS_WARMUP_BATCH_SIZES", f"1,{BATCH_MAX_SIZE}").split(",") if s.strip()]
+
+# Each cancer type has its own model (see model_registry.py and
+# LIFELENS_MODEL_REGISTRY). Other types load on first use, and the least
+# recently used ones are evicted once resident models pass MODEL_MEMORY_MB.
+# LIFELENS_PRELOAD_MODELS lists types (or "all") to load at startup too.
+# Changed checkpoints are hot-reloaded every MODEL_WATCH_SECONDS (0 = off),
+# or on demand by POST /models/{type}/reload with the X-Admin-Token header
+# (disabled unless LIFELENS_ADMIN_TOKEN is set); a {"weights": path} body
+# must name a file inside LIFELENS_WEIGHTS_DIR.
+MODEL_MEMORY_MB = float(os.getenv("LIFELENS_MODEL_MEMORY_MB", "1024"))
+PRELOAD_MODELS = [t.strip().lower() for t in os.getenv("LIFELENS_PRELOAD_MODELS", "").split(",") if t.strip()]
+MODEL_WATCH_SECONDS = float(os.getenv("LIFELENS_MODEL_WATCH_SECONDS", "0"))
+ADMIN_TOKEN = os.getenv("LIFELENS_ADMIN_TOKEN") or None
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+readiness = {"ready": False, "stage": "starting", "error": None, "timings": {}}
+serving = {}  # decode_image; filled by load_serving_model()
+model_registry = None  # ModelRegistry, created by load_serving_model()
+
+
+def create_chat_model():
+    """Chat model (LIFELENS_CHAT_MODEL=fake uses a local streaming stub)"""
+    if os.getenv("LIFELENS_CHAT_MODEL", "openai").lower() == "fake":
+        from fake_llm import FakeStreamingChatModel
+        return FakeStreamingChatModel(
+            first_token_delay=float(os.getenv("LIFELENS_FAKE_FIRST_TOKEN_DELAY", "0.5")),
+            token_delay=float(os.getenv("LIFELENS_FAKE_TOKEN_DELAY", "0.02")),
+        )
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(temperature=0.7, model="gpt-4")
+
+
+def warmup_images(batch_size):
+    """Random slide-sized RGB images; content doesn't matter, shapes and code paths do"""
+    import numpy as np
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, size=(460, 700, 3), dtype=np.uint8) for _ in range(batch_size)]
+
+
+def load_serving_model():
+    """Import and load everything heavy, then warm it up (blocking; runs once at startup)"""
+    global model, history_manager, prediction_cache, model_registry
+    timings = readiness["timings"]
+
+    readiness["stage"] = "chat_model"
+    start = time.perf_counter()
+    model = create_chat_model()
+    history_manager = ChatHistoryManager(model, max_prompt_tokens=CHAT_MAX_PROMPT_TOKENS, keep_last_turns=CHAT_KEEP_TURNS)
+    get_encoding()  # tiktoken's BPE file may need a download; do it here, not on the first chat
+    timings["chat_model_s"] = time.perf_counter() - start
+
+    readiness["stage"] = "model"
+    start = time.perf_counter()
+    from model_registry import ModelRegistry, load_specs  # imports torch/cv2
+    from inference import decode_image
+    model_registry = ModelRegistry(load_specs(), memory_budget_bytes=int(MODEL_MEMORY_MB * 1024 * 1024))
+    preload = list(model_registry.specs) if PRELOAD_MODELS == ["all"] else PRELOAD_MODELS
+    for cancer_type in preload:
+        model_registry.get(cancer_type)
+    default_model = model_registry.get(model_registry.default)  # loaded last, so it's the most recently used
+    serving.update(decode_image=decode_image)
+    # Keys carry each model's own fingerprint (see lookup_upload)
+    prediction_cache = PredictionCache(max_bytes=int(CACHE_MAX_MB * 1024 * 1024), disk_dir=CACHE_DIR)
+    timings["model_load_s"] = time.perf_counter() - start
+
+    readiness["stage"] = "warmup"
+    start = time.perf_counter()
+    for batch_size in WARMUP_BATCH_SIZES:
+        results = predict_images([(default_model, img) for img in warmup_images(batch_size)])
+        encode_overlay_bytes(results[0][2])
+        if PREDICT_MODE == "tta":
+            # also seeds the TTA cost estimate
+            predict_images_tta([(default_model, img) for img in warmup_images(batch_size)])
+    timings["warmup_s"] = time.perf_counter() - start
+
+
+async def start_serving():
+    start = time.perf_counter()
+    try:
+        await run_blocking(load_serving_model)
+    except Exception as e:
+        readiness.update(stage="failed", error=str(e))
+        print(f"Model startup failed: {str(e)}")
+        raise
+    readiness["timings"]["startup_s"] = time.perf_counter() - start
+    readiness.update(ready=True, stage="ready")
+    print(f"Ready in {readiness['timings']['startup_s']:.2f}s: {readiness['timings']}")
+
+
+def require_ready():
+    """503 with Retry-After until the model has loaded and warmed up"""
+    if not readiness["ready"]:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Model is not ready yet ({readiness['stage']})",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+
+
+def require_chat_model():
+    if model is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Chat model is not ready yet",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+
+
+async def watch_models():
+    """Reload resident models whose checkpoint changed on disk, every MODEL_WATCH_SECONDS"""
+    while True:
+        await asyncio.sleep(MODEL_WATCH_SECONDS)
+        if model_registry is None:
+            continue
+        try:
+            reloaded = await run_blocking(model_registry.check_for_updates)
+            if reloaded:
+                print(f"Hot-reloaded models: {reloaded}")
+        except Exception as e:
+            print(f"Model watch error: {str(e)}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await predict_batcher.start()
+    await tta_batcher.start()
+    startup = asyncio.create_task(start_serving())
+    watcher = asyncio.create_task(watch_models()) if MODEL_WATCH_SECONDS > 0 else None
+    yield
+    startup.cancel()
+    if watcher is not None:
+        watcher.cancel()
+    await predict_batcher.stop()
+    await tta_batcher.stop()
+    inference_executor.shutdown(wait=False)
+    session_executor.shutdown(wait=False)
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS Configuration
 app.add_middleware(
@@ -21,51 +347,75 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[SESSION_HEADER, REQUEST_ID_HEADER, PROFILE_ID_HEADER, "Server-Timing"],
 )
+if TELEMETRY_ENABLED:
+    app.add_middleware(TelemetryMiddleware, profile_dir=PROFILE_DIR, profile_interval_ms=PROFILE_INTERVAL_MS,
+                       run_blocking=run_blocking)
+
+# ==================== SESSION STATE ====================
+# Prediction results and chat history live per session, keyed by the token
+# sent in the X-Session-Id header (or lifelens_session cookie). Use
+# LIFELENS_SESSION_BACKEND=sqlite to share sessions across uvicorn workers.
+session_store = create_session_store()
+# SQLite calls are short but synchronous; keep them off both the event loop and the inference pool
+session_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="session")
+
+# Chat model and history manager are created by the startup task (create_chat_model)
+model = None
+history_manager = None
 
-# ==================== GLOBAL STATE ====================
-# Stores current prediction results and chat history
-current_results = {
-    "certainty": 0.0,
-    "riskLevel": "unknown",
-    "detection": "unknown",
-    "cancerType": "breast cancer",
-    "history": [],  # Will store conversation history
-}
+# Chat prompts keep the last CHAT_KEEP_TURNS exchanges verbatim and fold older
+# ones into a cached summary so prompts stay under CHAT_MAX_PROMPT_TOKENS.
+CHAT_MAX_PROMPT_TOKENS = int(os.getenv("LIFELENS_CHAT_MAX_PROMPT_TOKENS", "3000"))
+CHAT_KEEP_TURNS = int(os.getenv("LIFELENS_CHAT_KEEP_TURNS", "6"))
 
-# Initialize ChatOpenAI model
-model = ChatOpenAI(temperature=0.7, model="gpt-4")
+# Optional cache of first-turn answers keyed on the normalized question and the
+# bucketed results tuple (LIFELENS_ANSWER_CACHE=1). A fuzzy threshold > 0 also
+# matches near-identical phrasings by character n-gram similarity.
+if os.getenv("LIFELENS_ANSWER_CACHE", "0") == "1":
+    answer_cache = AnswerCache(
+        max_entries=int(os.getenv("LIFELENS_ANSWER_CACHE_MAX", "1000")),
+        ttl_seconds=float(os.getenv("LIFELENS_ANSWER_CACHE_TTL_SECONDS", "86400")),
+        fuzzy_threshold=float(os.getenv("LIFELENS_ANSWER_CACHE_FUZZY", "0")),
+    )
+else:
+    answer_cache = None
 
 
 # ==================== HELPER FUNCTIONS ====================
 
-def create_system_message(certainty, risk_level, detection, cancer_type):
-    """Generate a dynamic system message based on prediction results"""
-    return SystemMessage(
-        content=(
-            f"You are LifeLens, a friendly and knowledgeable AI medical assistant. "
-            f"Your role is to help users interpret cancer detection results, explain them clearly, and provide helpful next steps.\n\n"
-            f"CURRENT ANALYSIS RESULTS:\n"
-            f"- Cancer Type: {cancer_type.upper()}\n"
-            f"- Prediction: {detection.upper()}\n"
-            f"- Confidence: {certainty}%\n"
-            f"- Risk Level: {risk_level.upper()}\n\n"
-            f"⚠️ IMPORTANT DISCLAIMERS:\n"
-            f"1. This is for RESEARCH and EDUCATIONAL purposes ONLY\n"
-            f"2. This is NOT a medical diagnosis or professional medical advice\n"
-            f"3. Always encourage users to consult qualified healthcare professionals\n"
-            f"4. Do not provide medical treatment recommendations\n"
-            f"5. Be empathetic, clear, and supportive\n\n"
-            f"Guidelines:\n"
-            f"- Explain what the results mean in simple terms\n"
-            f"- Suggest next steps like consulting a doctor\n"
-            f"- Answer questions about the analysis\n"
-            f"- Always remind users this is not a diagnosis\n"
-            f"- Format responses as natural conversation text"
-        )
+@lru_cache(maxsize=512)
+def system_prompt(certainty, risk_level, detection, cancer_type):
+    """System prompt text for a set of prediction results (cached per results tuple)"""
+    return (
+        f"You are LifeLens, a friendly and knowledgeable AI medical assistant. "
+        f"Your role is to help users interpret cancer detection results, explain them clearly, and provide helpful next steps.\n\n"
+        f"CURRENT ANALYSIS RESULTS:\n"
+        f"- Cancer Type: {cancer_type.upper()}\n"
+        f"- Prediction: {detection.upper()}\n"
+        f"- Confidence: {certainty}%\n"
+        f"- Risk Level: {risk_level.upper()}\n\n"
+        f"⚠️ IMPORTANT DISCLAIMERS:\n"
+        f"1. This is for RESEARCH and EDUCATIONAL purposes ONLY\n"
+        f"2. This is NOT a medical diagnosis or professional medical advice\n"
+        f"3. Always encourage users to consult qualified healthcare professionals\n"
+        f"4. Do not provide medical treatment recommendations\n"
+        f"5. Be empathetic, clear, and supportive\n\n"
+        f"Guidelines:\n"
+        f"- Explain what the results mean in simple terms\n"
+        f"- Suggest next steps like consulting a doctor\n"
+        f"- Answer questions about the analysis\n"
+        f"- Always remind users this is not a diagnosis\n"
+        f"- Format responses as natural conversation text"
     )
 
 
+def create_system_message(certainty, risk_level, detection, cancer_type):
+    """Generate a dynamic system message based on prediction results; a new message per call, never shared"""
+    return SystemMessage(content=system_prompt(certainty, risk_level, detection, cancer_type))
+
+
 def determine_risk_level(prediction, confidence):
     """Determine risk level based on prediction and confidence"""
     if prediction.lower() == "malignant":
@@ -93,20 +443,262 @@ def normalize_gradcam(raw_data):
     return f"data:image/png;base64,{raw_data}"
 
 
+def encode_overlay_bytes(overlay_img):
+    """Encode the Grad-CAM overlay array with the configured format"""
+    with span("encode"):
+        return encode_overlay(
+            overlay_img,
+            OVERLAY_FORMAT,
+            quality=OVERLAY_QUALITY,
+            compress_level=OVERLAY_PNG_COMPRESS_LEVEL,
+        )
+
+
+async def run_session_io(fn, *args):
+    """Session store call; disk-backed stores run on their own small pool, off the event loop"""
+    if not session_store.blocking_io:
+        return fn(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(session_executor, contextvars.copy_context().run, fn, *args)
+
+
+async def load_session(request: Request, create=True):
+    """Return (token, state) for the caller's session, starting a new one if needed"""
+    token = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    state = await run_session_io(session_store.get, token) if token else None
+    if state is None:
+        if not create:
+            return token, None
+        token = token or new_session_token()
+        state = new_session_state()
+    return token, state
+
+
+async def save_session(token, state, response: Response):
+    """Persist the session and hand its token back to the client"""
+    with span("session_save"):
+        await run_session_io(session_store.save, token, state)
+    response.headers[SESSION_HEADER] = token
+    response.set_cookie(SESSION_COOKIE, token, httponly=True, samesite="lax")
+
+
+def current_results_view(state):
+    return {
+        "certainty": state["certainty"],
+        "riskLevel": state["riskLevel"],
+        "detection": state["detection"],
+        "cancerType": state["cancerType"],
+    }
+
+
+async def build_chat_messages(state, user_message):
+    """
+    System prompt with the session's current results, recent turns (older ones
+    summarized) and the new message; returns (messages, usage)
+    """
+    # Build the system message with current results
+    system_message = create_system_message(
+        state["certainty"],
+        state["riskLevel"],
+        state["detection"],
+        state["cancerType"]
+    )
+    with span("prompt_build"):
+        return await history_manager.build_messages(state, system_message, user_message)
+
+
+def answer_cache_key(state):
+    """Results key if this turn may use the answer cache (no prior conversation), else None"""
+    if answer_cache is None or state["detection"] == "unknown" or state.get("summary"):
+        return None
+    if any(not isinstance(msg, SystemMessage) for msg in state["history"]):
+        return None
+    return results_key(state)
+
+
+def cached_usage():
+    return {"prompt_tokens": 0, "unbounded_prompt_tokens": 0, "cached": True}
+
+
+def sse_event(data, event=None):
+    """Format one Server-Sent Event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+# Cached entries hold encoded overlays, and the disk tier outlives restarts,
+# so every setting that changes the stored bytes is part of the key
+OVERLAY_VARIANT = "-".join([
+    OVERLAY_FORMAT,
+    str(OVERLAY_PNG_COMPRESS_LEVEL if OVERLAY_FORMAT == "png" else OVERLAY_QUALITY),
+    str(OVERLAY_MAX_SIDE or 0),
+])
+
+
+def cache_variant(mode):
+    if mode == "tiled":
+        return f"tiled-{TILE_OVERLAP}-{TILE_MIN_TISSUE}-{TILED_MAX_PIXELS}-{OVERLAY_VARIANT}"
+    if mode == "tta":
+        return f"tta{TTA_MAX_VIEWS}-{OVERLAY_VARIANT}"
+    return OVERLAY_VARIANT if mode == "center" else f"{mode}-{OVERLAY_VARIANT}"
+
+
+def lookup_upload(image_bytes, served, mode="center"):
+    """Hash the upload and check the cache; returns (bytes_key, entry or None)"""
+    with span("cache_lookup"):
+        key = prediction_cache.key_for_bytes(image_bytes, cache_variant(mode), served.fingerprint)
+        return key, prediction_cache.get(key)
+
+
+def decode_and_lookup(image_bytes, served, mode="center"):
+    """Decode the upload and check the cache by pixels; returns (img, pixel_key, entry or None)"""
+    with span("decode"):
+        img = serving["decode_image"](image_bytes, TILED_MAX_PIXELS if mode == "tiled" else None)
+    with span("cache_lookup"):
+        key = prediction_cache.key_for_pixels(img, cache_variant(mode), served.fingerprint)
+        return img, key, prediction_cache.get(key)
+
+
+def predict_slide(served, img):
+    """Tiled whole-slide prediction; batches its own tiles, so it bypasses the micro-batcher"""
+    return served.predict_slide(
+        img,
+        overlay_max_side=OVERLAY_MAX_SIDE,
+        tile_batch_size=TILE_BATCH_SIZE,
+        overlap=TILE_OVERLAP,
+        min_tissue=TILE_MIN_TISSUE,
+    )
+
+
+async def resolve_model(cancer_type):
+    """
+    ServedModel for a cancer type, loading it on first use. The request keeps
+    this model to the end, even if it is reloaded or evicted meanwhile
+    """
+    try:
+        served = model_registry.resident(cancer_type)
+        if served is None:
+            with span("model_load"):
+                served = await run_blocking(model_registry.get, cancer_type)
+        return served
+    except LookupError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"[{current_request_id()}] Model load error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Model for '{cancer_type}' failed to load: {str(e)}")
+
+
+async def run_prediction(image_bytes, served, mode="center"):
+    """
+    Cached prediction for an upload: returns (prediction_id, entry) where entry
+    holds certainty, diagnosis and the encoded overlay bytes; prediction_id is
+    None when the result was not cached (TTA cut short by the latency budget)
+    """
+    bytes_key, entry = await run_blocking(lookup_upload, image_bytes, served, mode)
+    if entry is not None:
+        return bytes_key, entry
+
+    img, pixel_key, entry = await run_blocking(decode_and_lookup, image_bytes, served, mode)
+    if entry is None:
+        tile_info = tta_info = None
+        # Queue wait plus the whole batch; the model's own stages are recorded inside it
+        with span(f"inference_{mode}"):
+            if mode == "tiled":
+                with tiled_limit:
+                    certainty_val, diagnosis, overlay_img, tile_info = await run_blocking(predict_slide, served, img)
+            elif mode == "tta":
+                certainty_val, diagnosis, overlay_img, tta_info = await tta_batcher.submit((served, img))
+            else:
+                # Run the ML model (batched with any concurrent uploads)
+                certainty_val, diagnosis, overlay_img = await predict_batcher.submit((served, img))
+        del img
+        # Encode the overlay image
+        overlay = await run_blocking(encode_overlay_bytes, overlay_img)
+        entry = {
+            "certainty": certainty_val,
+            "diagnosis": diagnosis,
+            "overlay": overlay,
+            "overlay_format": OVERLAY_FORMAT,
+        }
+        if tile_info:
+            entry["tiles"] = tile_info
+        if tta_info:
+            entry["tta"] = tta_info
+            if tta_info["views"] < TTA_MAX_VIEWS:
+                # Cut short by the latency budget; don't serve it to later uploads as the full result
+                return None, entry
+        await run_blocking(prediction_cache.put, pixel_key, entry)
+    await run_blocking(prediction_cache.put, bytes_key, entry)
+    return bytes_key, entry
+
+
 # ==================== API ENDPOINTS ====================
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint; reads only in-memory counters, never the session store"""
+    models = model_registry.stats() if model_registry else None
     return {
         "status": "healthy",
-        "model": "online",
-        "currentResults": current_results
+        "model": "online" if readiness["ready"] else readiness["stage"],
+        "inferenceBackend": models["models"][models["default"]].get("backendReport") if models else None,
+        "models": models,
+        "batching": predict_batcher.stats(),
+        "tta": {"batching": tta_batcher.stats(), "budget": tta_budget.stats()},
+        "tiled": tiled_limit.stats(),
+        "sessions": session_store.stats(),
+        "predictionCache": prediction_cache.stats() if prediction_cache else None,
+        "answerCache": answer_cache.stats() if answer_cache else None,
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint: stage and request latency histograms plus queue/cache gauges"""
+    gauges = {
+        "lifelens_model_ready": int(readiness["ready"]),
+        "lifelens_predict_queue_depth": predict_batcher.queue_depth(),
+        "lifelens_tta_queue_depth": tta_batcher.queue_depth(),
+        "lifelens_tiled_in_flight": tiled_limit.in_flight,
+        "lifelens_predict_rejected": predict_batcher.rejected + tta_batcher.rejected + tiled_limit.rejected,
     }
+    if model_registry is not None:
+        models = model_registry.stats()
+        gauges["lifelens_models_resident"] = len(models["lruOrder"])
+        gauges["lifelens_models_resident_mb"] = models["residentMb"]
+    return Response(content=render_metrics(gauges), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    """Collapsed-stack profile of a request sent with X-Profile: 1 (feed to flamegraph.pl or speedscope)"""
+    if not PROFILE_DIR:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (set LIFELENS_PROFILE_DIR)")
+    path = profile_path(PROFILE_DIR, profile_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found (it is written once the request finishes)")
+    with open(path) as f:
+        return Response(content=f.read(), media_type="text/plain")
+
+
+@app.get("/ready")
+async def ready_check():
+    """Readiness probe: 200 once the model is loaded and warmed up, 503 before"""
+    body = {
+        "ready": readiness["ready"],
+        "stage": readiness["stage"],
+        "error": readiness["error"],
+        "timings": readiness["timings"],
+    }
+    return Response(
+        content=json.dumps(body),
+        status_code=200 if readiness["ready"] else 503,
+        media_type="application/json",
+    )
 
 
 @app.post("/set-cancer-type")
-async def set_cancer_type(request: Request):
+async def set_cancer_type(request: Request, response: Response):
     """
     Set the cancer type before running prediction
     Helps the AI assistant know what to expect
@@ -115,76 +707,162 @@ async def set_cancer_type(request: Request):
         data = await request.json()
         cancer_type = data.get("cancerType", "breast cancer").lower()
         
-        current_results["cancerType"] = cancer_type
+        token, state = await load_session(request)
+        state["cancerType"] = cancer_type
+        await save_session(token, state, response)
         
         return {
             "status": "success",
-            "cancerType": cancer_type
+            "cancerType": cancer_type,
+            # /predict answers 400 for types without a registered model
+            "modelAvailable": model_registry.has(cancer_type) if model_registry else None,
+            "sessionId": token
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(request: Request, response: Response, file: UploadFile = File(...), overlay: str = None,
+                  mode: str = None):
     """
     Run ML model prediction on uploaded medical image
     Returns prediction, confidence, Grad-CAM overlay, and risk level
     """
+    require_ready()
+    delivery = (overlay or OVERLAY_DELIVERY).lower()
+    if delivery not in ("inline", "url"):
+        raise HTTPException(status_code=400, detail="overlay must be 'inline' or 'url'")
+    if not URL_DELIVERY_AVAILABLE:
+        delivery = "inline"
+    mode = (mode or PREDICT_MODE).lower()
+    if mode not in PREDICT_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {PREDICT_MODES}")
+    token, state = await load_session(request)
+    served = await resolve_model(state["cancerType"])
     try:
         # Read the uploaded file
-        image_bytes = await file.read()
+        with span("read"):
+            image_bytes = await file.read()
         
-        # Run the ML model
-        certainty_val, diagnosis, overlay_img = predict_cancer_with_gradcam(image_bytes)
+        # Run the ML model, or reuse the result for a slide seen before
+        prediction_id, entry = await run_prediction(image_bytes, served, mode)
+        if prediction_id is None:
+            delivery = "inline"  # nothing cached for the overlay URL to point at
+        certainty_val = entry["certainty"]
+        diagnosis = entry["diagnosis"]
         
         # Calculate risk level
         risk_level = determine_risk_level(diagnosis, certainty_val)
         
-        # Update global results
-        current_results["certainty"] = certainty_val
-        current_results["detection"] = diagnosis
-        current_results["riskLevel"] = risk_level
+        # Update this session's results
+        state["certainty"] = certainty_val
+        state["detection"] = diagnosis
+        state["riskLevel"] = risk_level
         
         # Reset chat history with fresh system message
-        current_results["history"] = [
+        state["history"] = [
             create_system_message(
                 certainty_val,
                 risk_level,
                 diagnosis,
-                current_results["cancerType"]
+                state["cancerType"]
             )
         ]
+        state["summary"] = None
+        state["summarized_messages"] = 0
+        state["transcript_tokens"] = 0
+        await save_session(token, state, response)
         
-        # Convert overlay image to base64
-        if overlay_img.ndim == 2:  # Grayscale
-            pil_img = Image.fromarray(overlay_img.astype("uint8"), mode="L").convert("RGB")
-        else:  # Already RGB
-            pil_img = Image.fromarray(overlay_img.astype("uint8"))
-        
-        buffered = BytesIO()
-        pil_img.save(buffered, format="PNG")
-        overlay_base64 = base64.b64encode(buffered.getvalue()).decode()
-        
-        return {
+        result = {
             "status": "success",
             "certainty_percent": certainty_val,
             "diagnosis": diagnosis,
             "riskLevel": risk_level,
-            "gradcam_overlay": f"data:image/png;base64,{overlay_base64}",
+            "model": {"cancerType": served.cancer_type, "version": served.version},
+            "sessionId": token,
         }
+        if "tiles" in entry:
+            result["tiles"] = entry["tiles"]
+        if "tta" in entry:
+            result["tta"] = entry["tta"]
+        overlay_format = entry["overlay_format"]
+        if delivery == "url":
+            result["gradcam_url"] = f"/predict/{prediction_id}/overlay.{extension(overlay_format)}"
+        else:
+            with span("base64"):
+                result["gradcam_overlay"] = to_data_uri(entry["overlay"], overlay_format)
+        return result
     
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server busy: {str(e)}",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
     except Exception as e:
-        print(f"Prediction error: {str(e)}")
+        print(f"[{current_request_id()}] Prediction error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
 
+@app.get("/models")
+async def list_models():
+    """Registered cancer types with their resident state, memory and load/evict timings"""
+    require_ready()
+    return model_registry.stats()
+
+
+@app.post("/models/{cancer_type}/reload")
+async def reload_model(cancer_type: str, request: Request):
+    """
+    Hot-reload a cancer type's model from its checkpoint, or from {"weights": path}
+    Requests in flight finish on the old model; a failed load keeps it serving
+    """
+    require_ready()
+    if ADMIN_TOKEN is None:
+        raise HTTPException(status_code=403, detail="Model reload is disabled (set LIFELENS_ADMIN_TOKEN)")
+    if not secrets.compare_digest(request.headers.get(ADMIN_TOKEN_HEADER, ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    data = await request.json() if await request.body() else {}
+    weights = data.get("weights")
+    if weights is not None and not isinstance(weights, str):
+        raise HTTPException(status_code=400, detail="weights must be a path string")
+    try:
+        served = await run_blocking(model_registry.reload, cancer_type, weights)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"[{current_request_id()}] Model reload error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Reload failed, previous model still serving: {str(e)}")
+    return {"status": "success", "cancerType": served.cancer_type, "loadS": round(served.load_s, 3), **served.info()}
+
+
+@app.get("/predict/{prediction_id}/overlay.{ext}")
+async def get_overlay(prediction_id: str, ext: str):
+    """
+    Serve a Grad-CAM overlay as a binary image
+    The id comes from the gradcam_url returned by /predict?overlay=url
+    """
+    require_ready()
+    entry = await run_blocking(prediction_cache.get, prediction_id)
+    if entry is None or extension(entry["overlay_format"]) != ext:
+        raise HTTPException(status_code=404, detail="Overlay not found or expired")
+    return Response(
+        content=entry["overlay"],
+        media_type=media_type(entry["overlay_format"]),
+        headers={"Cache-Control": "private, max-age=3600, immutable"},
+    )
+
+
 @app.post("/chat")
-async def chat(request: Request):
+async def chat(request: Request, response: Response):
     """
     Chat endpoint for discussing analysis results
     Uses the current prediction results in context
     """
+    require_chat_model()
     try:
         data = await request.json()
         user_message = data.get("message", "").strip()
@@ -195,46 +873,37 @@ async def chat(request: Request):
                 "error": None
             }
         
-        # Build the system message with current results
-        system_message = create_system_message(
-            current_results["certainty"],
-            current_results["riskLevel"],
-            current_results["detection"],
-            current_results["cancerType"]
-        )
-        
-        # Build messages for the model
-        messages = [system_message]
-        
-        # Add previous conversation messages (skip initial system message)
-        for msg in current_results["history"]:
-            if not isinstance(msg, SystemMessage):
-                messages.append(msg)
-        
-        # Add the new user message
-        messages.append(HumanMessage(content=user_message))
+        token, state = await load_session(request)
+        cache_key = answer_cache_key(state)
+        response_text = answer_cache.get(user_message, cache_key) if cache_key else None
         
-        # Get response from AI
-        response = model.invoke(messages)
-        response_text = response.content
+        if response_text is not None:
+            usage = cached_usage()
+        else:
+            messages, usage = await build_chat_messages(state, user_message)
+            
+            # Get response from AI
+            with span("llm"):
+                ai_message = await model.ainvoke(messages)
+            response_text = ai_message.content
+            if cache_key:
+                answer_cache.put(user_message, cache_key, response_text)
         
         # Store conversation in history
-        current_results["history"].append(HumanMessage(content=user_message))
-        current_results["history"].append(AIMessage(content=response_text))
+        history_manager.record_turn(state, user_message, response_text)
+        await save_session(token, state, response)
         
+        observe_chat_usage("/chat", usage)
         return {
             "reply": response_text,
-            "currentResults": {
-                "certainty": current_results["certainty"],
-                "riskLevel": current_results["riskLevel"],
-                "detection": current_results["detection"],
-                "cancerType": current_results["cancerType"],
-            },
+            "currentResults": current_results_view(state),
+            "sessionId": token,
+            "usage": usage,
             "error": None
         }
     
     except Exception as e:
-        print(f"Chat error: {str(e)}")
+        print(f"[{current_request_id()}] Chat error: {str(e)}")
         import traceback
         traceback.print_exc()
         
@@ -244,6 +913,81 @@ async def chat(request: Request):
         }
 
 
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
+    """
+    Streaming variant of /chat using Server-Sent Events
+    Sends {"token": ...} events as the model generates, then a "done" event
+    with the full reply and timings; history is saved only once the stream completes
+    """
+    require_chat_model()
+    data = await request.json()
+    user_message = data.get("message", "").strip()
+    token, state = await load_session(request)
+
+    async def event_stream():
+        if not user_message:
+            yield sse_event({"reply": "Please enter a message.", "sessionId": token}, event="done")
+            return
+
+        parts = []
+        start = time.perf_counter()
+        first_token_time = None
+        cache_key = answer_cache_key(state)
+        cached_reply = answer_cache.get(user_message, cache_key) if cache_key else None
+        try:
+            if cached_reply is not None:
+                usage = cached_usage()
+                first_token_time = time.perf_counter()
+                parts.append(cached_reply)
+                yield sse_event({"token": cached_reply})
+            else:
+                messages, usage = await build_chat_messages(state, user_message)
+                llm_start = time.perf_counter()
+                async for chunk in model.astream(messages):
+                    if not chunk.content:
+                        continue
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter()
+                    parts.append(chunk.content)
+                    yield sse_event({"token": chunk.content})
+        except Exception as e:
+            print(f"[{current_request_id()}] Chat stream error: {str(e)}")
+            yield sse_event({"error": str(e)}, event="error")
+            return
+
+        total_ms = 1000.0 * (time.perf_counter() - start)
+        ttft_ms = 1000.0 * (first_token_time - start) if first_token_time else total_ms
+        if cached_reply is None:
+            observe_stage("llm_first_token", (first_token_time or time.perf_counter()) - llm_start)
+            observe_stage("llm", time.perf_counter() - llm_start)
+        response_text = "".join(parts)
+        if cache_key and cached_reply is None:
+            answer_cache.put(user_message, cache_key, response_text)
+
+        # Store conversation in history now that the reply is complete
+        history_manager.record_turn(state, user_message, response_text)
+        await run_session_io(session_store.save, token, state)
+
+        observe_chat_usage("/chat/stream", usage)
+        yield sse_event({
+            "reply": response_text,
+            "currentResults": current_results_view(state),
+            "sessionId": token,
+            "timings": {"ttft_ms": ttft_ms, "total_ms": total_ms},
+            "usage": usage,
+        }, event="done")
+
+    response = StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", SESSION_HEADER: token},
+    )
+    # Same cookie as save_session, so cookie-based clients keep their session
+    response.set_cookie(SESSION_COOKIE, token, httponly=True, samesite="lax")
+    return response
+
+
 @app.post("/export/conversation")
 async def export_conversation(request: Request):
     """
@@ -252,6 +996,7 @@ async def export_conversation(request: Request):
     """
     try:
         data = await request.json()
+        _, state = await load_session(request)
         
         export_data = {
             "report_metadata": {
@@ -260,18 +1005,19 @@ async def export_conversation(request: Request):
                 "disclaimer": "Research purposes only - not for medical diagnosis"
             },
             "analysis": {
-                "cancer_type": data.get("cancerType", current_results["cancerType"]),
-                "prediction": data.get("diagnosis", current_results["detection"]),
-                "confidence_percent": data.get("confidence", current_results["certainty"]),
-                "risk_level": data.get("riskLevel", current_results["riskLevel"]),
+                "cancer_type": data.get("cancerType", state["cancerType"]),
+                "prediction": data.get("diagnosis", state["detection"]),
+                "confidence_percent": data.get("confidence", state["certainty"]),
+                "risk_level": data.get("riskLevel", state["riskLevel"]),
                 "key_factors": data.get("key_factors", [])
             },
+            "conversation_summary": state.get("summary"),
             "conversation_history": [
                 {
                     "role": msg.type if hasattr(msg, 'type') else "unknown",
                     "content": msg.content if hasattr(msg, 'content') else str(msg)
                 }
-                for msg in current_results["history"]
+                for msg in state["history"]
             ]
         }
         
@@ -285,14 +1031,13 @@ async def export_conversation(request: Request):
 
 
 @app.post("/reset")
-async def reset_session():
+async def reset_session(request: Request, response: Response):
     """
     Reset the session - clear all analysis and chat history
     """
-    current_results["certainty"] = 0.0
-    current_results["riskLevel"] = "unknown"
-    current_results["detection"] = "unknown"
-    current_results["history"] = []
+    token, state = await load_session(request, create=False)
+    if state is not None:
+        await save_session(token, new_session_state(state["cancerType"]), response)
     
     return {
         "status": "success",
@@ -0,0 +1,421 @@
+"""
+Registry of served models, one per cancer type.
+
+Each cancer type maps to a checkpoint plus its preprocessing, class names,
+inference backend, optional ensemble and temperature file. The mapping is
+read from a JSON file (LIFELENS_MODEL_REGISTRY, default models.json):
+
+    {
+      "breast cancer": {"weights": "breast_cancer.pth", "aliases": ["breast"]},
+      "melanoma": {
+        "weights": "melanoma.pth",
+        "preprocessing": {"resize": 256, "crop": 224, "mean": [0.71, 0.58, 0.54], "std": [0.09, 0.12, 0.14]}
+      }
+    }
+
+Relative paths are resolved against the file's directory, and missing
+fields take the defaults below. Without the file, only "breast cancer" is
+registered, configured by LIFELENS_WEIGHTS_PATH and the other LIFELENS_*
+settings below.
+
+Models are loaded on first use and kept in LRU order under a memory budget.
+A reload builds the new model next to the old one and swaps the reference;
+requests that already hold the old ServedModel finish on it. A reload may
+name a new checkpoint, which must be a file inside the weights directory
+(LIFELENS_WEIGHTS_DIR, default the working directory). Checkpoints are
+loaded with torch.load(weights_only=True), so they are never unpickled as
+arbitrary objects.
+"""
+import gc
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from torchvision.models import resnet18
+
+from explainability import GradCAM
+from inference import (CLASS_NAMES, DEFAULT_PREPROCESSING, make_transform, predict_batch, predict_batch_tta,
+                       predict_bytes_batch, predict_tiled)
+from inference_backends import calibration_batches, load_backend
+from prediction_cache import file_fingerprint
+from process_data import DATA_ROOT
+from tta import MAX_VIEWS, ModelEnsemble, load_temperatures, temperature_for
+
+REGISTRY_PATH = os.getenv("LIFELENS_MODEL_REGISTRY", "models.json")
+DEFAULT_CANCER_TYPE = os.getenv("LIFELENS_DEFAULT_CANCER_TYPE", "breast cancer").strip().lower()
+WEIGHTS_PATH = os.getenv("LIFELENS_WEIGHTS_PATH", "breast_cancer.pth")
+WEIGHTS_DIR = os.getenv("LIFELENS_WEIGHTS_DIR", ".")  # checkpoints a reload may point at
+
+# Inference backend, see inference_backends.py
+INFERENCE_BACKEND = os.getenv("LIFELENS_INFERENCE_BACKEND", "eager")
+BACKEND_TOLERANCE = float(os.getenv("LIFELENS_BACKEND_TOLERANCE", "0.05"))          # max softmax difference vs fp32
+BACKEND_MIN_AGREEMENT = float(os.getenv("LIFELENS_BACKEND_MIN_AGREEMENT", "0.98"))  # min top-1 agreement vs fp32
+CALIBRATION_ROOT = os.getenv("LIFELENS_CALIBRATION_ROOT", DATA_ROOT)
+CALIBRATION_IMAGES = int(os.getenv("LIFELENS_CALIBRATION_IMAGES", "64"))
+
+# Test-time augmentation (see tta.py): extra checkpoints averaged with the
+# served one, and per-view-count temperatures fitted by calibrate.py
+ENSEMBLE_WEIGHTS = [p.strip() for p in os.getenv("LIFELENS_ENSEMBLE_WEIGHTS", "").split(",") if p.strip()]
+TEMPERATURE_PATH = os.getenv("LIFELENS_TEMPERATURE_PATH", "temperature.json")
+
+ARCHITECTURES = ("resnet18",)
+# Spec fields naming files; those are fingerprinted by content instead
+PATH_FIELDS = ("weights", "ensemble", "temperature", "calibration_root")
+
+
+# ---------- SPECS ----------
+
+def default_spec():
+    return {
+        "weights": None,
+        "architecture": "resnet18",
+        "class_names": [CLASS_NAMES[i] for i in sorted(CLASS_NAMES)],
+        "preprocessing": dict(DEFAULT_PREPROCESSING),
+        "backend": INFERENCE_BACKEND,
+        "calibration_root": CALIBRATION_ROOT,
+        "ensemble": [],
+        "temperature": None,
+        "aliases": [],
+    }
+
+
+def env_spec():
+    """The single breast cancer model configured through LIFELENS_* settings."""
+    return {**default_spec(), "weights": WEIGHTS_PATH, "ensemble": ENSEMBLE_WEIGHTS, "temperature": TEMPERATURE_PATH}
+
+
+def load_specs(path=REGISTRY_PATH):
+    """{cancer type: spec} from the registry file, or just the env-configured breast cancer model without one."""
+    if not path or not os.path.exists(path):
+        return {DEFAULT_CANCER_TYPE: env_spec()}
+
+    with open(path) as f:
+        raw = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    def resolve(p):
+        return p if p is None or os.path.isabs(p) else os.path.join(base_dir, p)
+
+    specs = {}
+    for cancer_type, entry in raw.items():
+        spec = {**default_spec(), **entry}
+        spec["preprocessing"] = {**DEFAULT_PREPROCESSING, **entry.get("preprocessing", {})}
+        if not spec["weights"]:
+            raise ValueError(f"Model '{cancer_type}' in {path} has no weights")
+        if spec["architecture"] not in ARCHITECTURES:
+            raise ValueError(f"Model '{cancer_type}': unknown architecture '{spec['architecture']}', "
+                             f"expected one of {ARCHITECTURES}")
+        spec["weights"] = resolve(spec["weights"])
+        spec["ensemble"] = [resolve(p) for p in spec["ensemble"]]
+        spec["temperature"] = resolve(spec["temperature"])
+        specs[cancer_type.strip().lower()] = spec
+    if not specs:
+        raise ValueError(f"{path} registers no models")
+    return specs
+
+
+# ---------- SERVED MODEL ----------
+
+def load_model(weights_path, num_classes=2):
+    # No pretrained weights: the checkpoint overwrites every parameter anyway
+    model = resnet18(weights=None)
+    model.fc = torch.nn.Linear(model.fc.in_features, num_classes)
+    model.load_state_dict(torch.load(weights_path, map_location=torch.device("cpu"), weights_only=True))
+    return model.eval()
+
+
+def spec_fingerprint(spec):
+    """Short hash of a spec's settings (preprocessing, class names, ...) as canonical JSON, without its paths."""
+    settings = {k: v for k, v in spec.items() if k not in PATH_FIELDS}
+    canonical = json.dumps(settings, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode(), digest_size=8).hexdigest()
+
+
+def tensor_bytes(module):
+    return sum(t.numel() * t.element_size() for t in [*module.parameters(), *module.buffers()])
+
+
+def process_rss_bytes():
+    """Resident set size of this process (Linux), or None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def source_stats(paths):
+    """{path: (mtime_ns, size)} of the files a model was built from; None for missing files."""
+    stats = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stats[path] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stats[path] = None
+    return stats
+
+
+class ServedModel:
+    """
+    One cancer type's model with everything needed to serve it: the trunk
+    on the chosen backend, the Grad-CAM explainer, preprocessing, class
+    names, ensemble and temperatures. Never mutated after construction;
+    a reload builds a new one.
+    """
+
+    def __init__(self, cancer_type, spec):
+        start = time.perf_counter()
+        self.cancer_type = cancer_type
+        self.spec = spec
+        self.class_names = dict(enumerate(spec["class_names"]))
+        self.preprocessing = spec["preprocessing"]
+        self.transform = make_transform(self.preprocessing)
+
+        self.model = load_model(spec["weights"], len(self.class_names))
+        self.ensemble = ModelEnsemble([load_model(p, len(self.class_names)) for p in spec["ensemble"]]) \
+            if spec["ensemble"] else None
+        self.temperatures = load_temperatures(spec["temperature"])
+
+        # Accelerated trunk for the forward pass (eager head keeps Grad-CAM exact)
+        calibration = []
+        if spec["backend"] != "eager":
+            calibration = calibration_batches(spec["calibration_root"], "val", CALIBRATION_IMAGES,
+                                              transform=self.transform)
+        self.features, self.head, self.backend_report = load_backend(
+            self.model, spec["backend"], calibration, BACKEND_TOLERANCE, BACKEND_MIN_AGREEMENT)
+        self.explainer = GradCAM(self.model, self.model.layer4[-1], features=self.features, head=self.head)
+
+        # Keys the prediction cache; backends round differently, so they don't share entries,
+        # and a changed normalisation or label set must not serve the old predictions
+        weights_fingerprint = file_fingerprint(spec["weights"])
+        self.version = weights_fingerprint[:12]
+        self.fingerprint = ":".join([
+            weights_fingerprint,
+            self.backend_report["backend"],
+            spec_fingerprint(spec),
+            *[file_fingerprint(path) for path in spec["ensemble"]],
+            *([file_fingerprint(spec["temperature"])] if self.temperatures else []),
+        ])
+        self.sources = [spec["weights"], *spec["ensemble"], *([spec["temperature"]] if spec["temperature"] else [])]
+        self.source_stats = source_stats(self.sources)
+
+        # fp32 tensors; a non-eager trunk holds its own copy of the conv weights
+        trunk_copies = 1 if self.backend_report["backend"] == "eager" else 2
+        self.nbytes = tensor_bytes(self.model) * trunk_copies + \
+            sum(tensor_bytes(m) for m in (self.ensemble.models if self.ensemble else []))
+        self.load_s = time.perf_counter() - start
+
+    def predict_images(self, images, overlay_max_side=None):
+        return predict_batch(self.explainer, images, overlay_max_side, temperature_for(self.temperatures, 1),
+                             self.transform, self.class_names)
+
+    def predict_images_tta(self, images, overlay_max_side=None, views=MAX_VIEWS):
+        temperature = temperature_for(self.temperatures, views, ensembled=self.ensemble is not None)
+        return predict_batch_tta(self.explainer, images, overlay_max_side, views, self.ensemble,
+                                 temperature, self.transform, self.class_names)
+
+    def predict_slide(self, img, overlay_max_side=None, **tile_options):
+        return predict_tiled(self.explainer, img, overlay_max_side, preprocessing=self.preprocessing,
+                             temperature=temperature_for(self.temperatures, 1), class_names=self.class_names,
+                             **tile_options)
+
+    def predict_bytes(self, image_bytes_list, overlay_max_side=None):
+        return predict_bytes_batch(self.explainer, image_bytes_list, overlay_max_side,
+                                   temperature=temperature_for(self.temperatures, 1),
+                                   preprocess=self.transform, class_names=self.class_names)
+
+    def warmup(self):
+        size = self.preprocessing["resize"]
+        img = np.random.default_rng(0).integers(0, 256, (size, size, 3), dtype=np.uint8)
+        self.predict_images([img])
+
+    def info(self):
+        return {
+            "version": self.version,
+            "backend": self.backend_report["backend"],
+            "backendReport": self.backend_report,
+            "weights": self.spec["weights"],
+            "classNames": list(self.class_names.values()),
+            "ensembleSize": self.ensemble.size if self.ensemble else 1,
+            "mb": round(self.nbytes / 2 ** 20, 1),
+        }
+
+
+# ---------- REGISTRY ----------
+
+class ModelRegistry:
+    """
+    Cancer type -> ServedModel, loaded lazily on first use.
+
+    Resident models are kept in LRU order. After each load, least recently
+    used models are evicted until the estimated total fits
+    `memory_budget_bytes`; the model just loaded is always kept. Eviction
+    and reload only drop the registry's reference, so requests holding a
+    ServedModel finish on it and it is freed afterwards.
+    """
+
+    def __init__(self, specs, memory_budget_bytes=1024 * 2 ** 20, default=DEFAULT_CANCER_TYPE, warmup=True,
+                 weights_dir=WEIGHTS_DIR):
+        self.specs = dict(specs)
+        self.weights_dir = os.path.realpath(weights_dir)
+        self.memory_budget_bytes = memory_budget_bytes
+        self.default = default if default in self.specs else next(iter(self.specs))
+        self.warmup = warmup
+        self.aliases = {}
+        for name, spec in self.specs.items():
+            for alias in [name, *spec.get("aliases", [])]:
+                self.aliases[alias.strip().lower()] = name
+        self._resident = OrderedDict()  # name -> ServedModel, least recently used first
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in self.specs}
+        self._failed_sources = {}       # name -> source_stats of a checkpoint that failed to reload
+        self._stats = {name: {"loads": 0, "reloads": 0, "evictions": 0, "loadFailures": 0, "lastLoadS": None,
+                              "lastWarmupS": None, "lastLoadRssMb": None, "lastEvictS": None, "lastError": None}
+                       for name in self.specs}
+
+    # ---------- lookup ----------
+    def resolve(self, cancer_type):
+        """Registered name for a cancer type or alias; LookupError if there is none."""
+        name = self.aliases.get((cancer_type or self.default).strip().lower())
+        if name is None:
+            raise LookupError(f"No model registered for '{cancer_type}'; available: {sorted(self.specs)}")
+        return name
+
+    def has(self, cancer_type):
+        return (cancer_type or "").strip().lower() in self.aliases
+
+    def resident(self, cancer_type):
+        """The resident model without loading (None if it isn't loaded); cheap enough for the event loop."""
+        name = self.resolve(cancer_type)
+        with self._lock:
+            served = self._resident.get(name)
+            if served is not None:
+                self._resident.move_to_end(name)
+            return served
+
+    def get(self, cancer_type):
+        """The model for a cancer type, loading it (blocking) on first use."""
+        name = self.resolve(cancer_type)
+        served = self.resident(name)
+        if served is not None:
+            return served
+        with self._load_locks[name]:
+            served = self.resident(name)  # loaded while we waited for the lock
+            if served is None:
+                served = self._load(name, self.specs[name])
+                self._install(name, served)
+            return served
+
+    # ---------- loading ----------
+    def _load(self, name, spec):
+        stats = self._stats[name]
+        rss_before = process_rss_bytes()
+        try:
+            served = ServedModel(name, spec)
+            warmup_start = time.perf_counter()
+            if self.warmup:
+                served.warmup()
+        except Exception as e:
+            stats["loadFailures"] += 1
+            stats["lastError"] = f"{type(e).__name__}: {e}"
+            raise
+        rss_after = process_rss_bytes()
+        stats["loads"] += 1
+        stats["lastLoadS"] = round(served.load_s, 3)
+        stats["lastWarmupS"] = round(time.perf_counter() - warmup_start, 3) if self.warmup else None
+        stats["lastLoadRssMb"] = round((rss_after - rss_before) / 2 ** 20, 1) if rss_before and rss_after else None
+        stats["lastError"] = None
+        print(f"Loaded model '{name}' ({served.version}, {served.backend_report['backend']}) "
+              f"in {served.load_s:.2f}s")
+        return served
+
+    def _install(self, name, served):
+        evicted = []
+        with self._lock:
+            self._resident[name] = served
+            self._resident.move_to_end(name)
+            resident_bytes = sum(m.nbytes for m in self._resident.values())
+            while resident_bytes > self.memory_budget_bytes and len(self._resident) > 1:
+                victim = next(n for n in self._resident if n != name)
+                resident_bytes -= self._resident[victim].nbytes
+                evicted.append((victim, self._resident.pop(victim)))
+        while evicted:
+            victim, model = evicted.pop()
+            start = time.perf_counter()
+            del model
+            gc.collect()  # hooks make model <-> explainer a cycle
+            self._stats[victim]["evictions"] += 1
+            self._stats[victim]["lastEvictS"] = round(time.perf_counter() - start, 4)
+            print(f"Evicted model '{victim}' to stay within {self.memory_budget_bytes / 2 ** 20:.0f} MB")
+
+    def weights_path(self, weights):
+        """
+        Absolute path of a checkpoint named by a reload request (relative to
+        the weights directory); ValueError unless it resolves, symlinks
+        included, to an existing file inside that directory.
+        """
+        path = os.path.realpath(os.path.join(self.weights_dir, weights))
+        if os.path.commonpath([self.weights_dir, path]) != self.weights_dir or not os.path.isfile(path):
+            raise ValueError(f"Weights must be an existing file inside the weights directory ({self.weights_dir})")
+        return path
+
+    def reload(self, cancer_type, weights=None):
+        """
+        Rebuild a model (from `weights` if given, else its registered
+        checkpoint) and swap it in atomically. If the new model fails to
+        load, the old one keeps serving and the error is raised. `weights`
+        must lie inside the weights directory (see weights_path).
+        """
+        name = self.resolve(cancer_type)
+        if weights:
+            weights = self.weights_path(weights)
+        with self._load_locks[name]:
+            spec = {**self.specs[name], "weights": weights} if weights else self.specs[name]
+            served = self._load(name, spec)
+            self.specs[name] = spec
+            self._stats[name]["reloads"] += 1
+            self._failed_sources.pop(name, None)
+            self._install(name, served)
+        return served
+
+    def check_for_updates(self):
+        """Reload resident models whose checkpoint, ensemble or temperature file changed on disk."""
+        with self._lock:
+            resident = list(self._resident.items())
+        reloaded = []
+        for name, served in resident:
+            current = source_stats(served.sources)
+            if current == served.source_stats or current == self._failed_sources.get(name):
+                continue
+            try:
+                self.reload(name)
+                reloaded.append(name)
+            except Exception as e:
+                # Retried once the files change again, e.g. when a copy finishes
+                self._failed_sources[name] = current
+                print(f"Reload of '{name}' failed, still serving {served.version}: {type(e).__name__}: {e}")
+        return reloaded
+
+    # ---------- stats ----------
+    def stats(self):
+        with self._lock:
+            resident = OrderedDict(self._resident)
+        rss = process_rss_bytes()
+        return {
+            "default": self.default,
+            "memoryBudgetMb": round(self.memory_budget_bytes / 2 ** 20, 1),
+            "residentMb": round(sum(m.nbytes for m in resident.values()) / 2 ** 20, 1),
+            "processRssMb": round(rss / 2 ** 20, 1) if rss else None,
+            "lruOrder": list(resident),
+            "models": {
+                name: {"resident": name in resident, **(resident[name].info() if name in resident else {}),
+                       **self._stats[name]}
+                for name in self.specs
+            },
+        }
@@ -0,0 +1,44 @@
+import base64
+from io import BytesIO
+
+from PIL import Image
+
+# format name -> (PIL format, media type, file extension)
+FORMATS = {
+    "png": ("PNG", "image/png", "png"),
+    "webp": ("WEBP", "image/webp", "webp"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+}
+
+
+def encode_overlay(overlay_img, fmt="png", quality=90, compress_level=6):
+    """
+    Encode the Grad-CAM overlay array to image bytes.
+    quality applies to WebP/JPEG, compress_level (0-9) to PNG.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported overlay format: {fmt}")
+    if overlay_img.ndim == 2:  # Grayscale
+        pil_img = Image.fromarray(overlay_img.astype("uint8"), mode="L").convert("RGB")
+    else:  # Already RGB
+        pil_img = Image.fromarray(overlay_img.astype("uint8"))
+
+    pil_format = FORMATS[fmt][0]
+    buffered = BytesIO()
+    if pil_format == "PNG":
+        pil_img.save(buffered, format="PNG", compress_level=compress_level)
+    else:
+        pil_img.save(buffered, format=pil_format, quality=quality)
+    return buffered.getvalue()
+
+
+def media_type(fmt):
+    return FORMATS[fmt][1]
+
+
+def extension(fmt):
+    return FORMATS[fmt][2]
+
+
+def to_data_uri(data, fmt):
+    return f"data:{media_type(fmt)};base64,{base64.b64encode(data).decode()}"
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """Short content hash of a weights file; changes whenever the checkpoint does"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """
+    Content-addressed cache of /predict results.
+
+    Keys combine the model weights fingerprint with a hash of either the raw
+    upload bytes or the decoded pixels, so re-uploads (even re-encoded ones)
+    skip inference and a new checkpoint never serves stale results. One cache
+    can hold several models' results by passing each key call its model's
+    fingerprint instead of the cache-wide one. Entries
+    are dicts of JSON-serialisable fields plus the encoded overlay bytes under
+    "overlay"; the in-memory tier is an LRU bounded by `max_bytes` and an
+    optional on-disk tier lives under `disk_dir`.
+    """
+
+    def __init__(self, fingerprint=None, max_bytes=256 * 1024 * 1024, disk_dir=None, max_disk_entries=10000):
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()  # key -> (size, entry)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._disk_writes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    # ---------- keys ----------
+    # `variant` separates results of different prediction modes (e.g. "tiled")
+    def _prefix(self, variant, fingerprint):
+        fingerprint = fingerprint or self.fingerprint
+        return f"{fingerprint}-{variant}" if variant else fingerprint
+
+    def key_for_bytes(self, image_bytes, variant=None, fingerprint=None):
+        prefix = self._prefix(variant, fingerprint)
+        return f"{prefix}-b-{hashlib.blake2b(image_bytes, digest_size=20).hexdigest()}"
+
+    def key_for_pixels(self, img, variant=None, fingerprint=None):
+        prefix = self._prefix(variant, fingerprint)
+        digest = hashlib.blake2b(repr(img.shape).encode(), digest_size=20)
+        digest.update(memoryview(np.ascontiguousarray(img)).cast("B"))
+        return f"{prefix}-p-{digest.hexdigest()}"
+
+    # ---------- lookup ----------
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return item[1]
+
+        entry = self._read_disk(key)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self._put_memory(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        self._put_memory(key, entry)
+        self._write_disk(key, entry)
+
+    def _put_memory(self, key, entry):
+        size = len(entry["overlay"]) + 256
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[0]
+            self._entries[key] = (size, entry)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (old_size, _) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    # ---------- disk tier ----------
+    def _disk_path(self, key, suffix):
+        return os.path.join(self.disk_dir, f"{key}{suffix}")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key, ".json")) as f:
+                entry = json.load(f)
+            with open(self._disk_path(key, ".bin"), "rb") as f:
+                entry["overlay"] = f.read()
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def _atomic_write(self, path, data, mode):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, mode) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        meta = {k: v for k, v in entry.items() if k != "overlay"}
+        # Overlay first: a .json only ever exists next to a complete .bin
+        self._atomic_write(self._disk_path(key, ".bin"), entry["overlay"], "wb")
+        self._atomic_write(self._disk_path(key, ".json"), json.dumps(meta), "w")
+        self._disk_writes += 1
+        if self._disk_writes % 64 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        files = [e for e in os.scandir(self.disk_dir) if e.name.endswith(".json")]
+        if len(files) <= self.max_disk_entries:
+            return
+        files.sort(key=lambda e: e.stat().st_mtime)
+        for e in files[:len(files) - self.max_disk_entries]:
+            for path in (e.path, e.path[:-len(".json")] + ".bin"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "disk_dir": self.disk_dir,
+            "fingerprint": self.fingerprint,
+        }
@@ -1,81 +1,134 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
-import torch
-from torch.utils.data import Dataset, DataLoader
-from torchvision import transforms, models
-import torch.nn as nn
-import random
+from torch.utils.data import Dataset
+from torchvision import transforms
 
 # ---------------- CONFIG ----------------
 img_size = 224
-SEED = 42
-random.seed(SEED)
-np.random.seed(SEED)
-torch.manual_seed(SEED)
-if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
-    torch.mps.manual_seed(SEED)
-
-# Folder locations
-ben_train_folder = "./archive/BreaKHis_v1/BreaKHis_v1/dataset_split/benign/train"
-mal_train_folder = "./archive/BreaKHis_v1/BreaKHis_v1/dataset_split/malignant/train"
-ben_val_folder   = "./archive/BreaKHis_v1/BreaKHis_v1/dataset_split/benign/val"
-mal_val_folder   = "./archive/BreaKHis_v1/BreaKHis_v1/dataset_split/malignant/val"
-ben_test_folder  = "./archive/BreaKHis_v1/BreaKHis_v1/dataset_split/benign/test"
-mal_test_folder  = "./archive/BreaKHis_v1/BreaKHis_v1/dataset_split/malignant/test"
+
+# Folder locations: <DATA_ROOT>/<class>/<split>
+DATA_ROOT = "./archive/BreaKHis_v1/BreaKHis_v1/dataset_split"
+CLASSES = {"benign": 0, "malignant": 1}
+SPLITS = ("train", "val", "test")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+
+# ---------------- IMAGE INDEXING & LOADING ----------------
+def list_split(split, root=DATA_ROOT):
+    """File paths and labels for one split, without decoding anything."""
+    if split not in SPLITS:
+        raise ValueError(f"Unknown split '{split}', expected one of {SPLITS}")
+    paths, labels = [], []
+    for class_name, label in CLASSES.items():
+        folder = os.path.join(root, class_name, split)
+        for filename in sorted(os.listdir(folder)):
+            if "mask" in filename.lower() or not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            paths.append(os.path.join(folder, filename))
+            labels.append(label)
+    return paths, labels
+
+def load_image(path, img_size=224):
+    """Decode one image as RGB uint8, resized to img_size x img_size (native size if img_size is None)."""
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError(f"Could not read image {path}")
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    if img_size is None:
+        return img
+    return cv2.resize(img, (img_size, img_size))
+
+def readable_images(paths, labels, workers=None):
+    """
+    Keep only the files OpenCV can decode, as the old eager loader did, so a
+    corrupt image is dropped once here instead of failing a DataLoader worker.
+    Decodes every file once (on threads; cv2 releases the GIL).
+    """
+    def readable(path):
+        return cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_2) is not None
+
+    with ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1)) as pool:
+        ok = list(pool.map(readable, paths))
+    for path, good in zip(paths, ok):
+        if not good:
+            print(f"Skipped {path}: could not decode")
+    return [p for p, good in zip(paths, ok) if good], [y for y, good in zip(labels, ok) if good]
 
 # ---------------- DATASET CLASS ----------------
 class CancerDataset(Dataset):
-    def __init__(self, data, transform=None):
-        self.data = data
+    """
+    BreaKHis split indexed by file path; images are decoded lazily in
+    __getitem__. Undecodable files are left out of the index when the dataset
+    is built (by a one-off decode check, or from the tensor-cache manifest).
+
+    With cache_dir set, images come from the preprocessed memory-mapped cache
+    built by tensor_cache.py (rebuilt incrementally if the split changed) and
+    __getitem__ returns a zero-copy view of the cached row.
+
+    img_size=None yields images at their native size, e.g. to apply the
+    serving transform exactly (not available with the fixed-size cache).
+
+    build_cache=False only maps an existing cache, for processes that let
+    another one build it (e.g. DDP ranks other than local rank 0).
+    """
+    def __init__(self, split, transform=None, root=DATA_ROOT, img_size=img_size, cache_dir=None, build_cache=True):
+        self.split = split
         self.transform = transform
+        self.img_size = img_size
+        self.cache_dir = cache_dir
+        self._images = None
+        if cache_dir and img_size is None:
+            raise ValueError("The tensor cache stores fixed-size images; pass img_size or drop cache_dir")
+        if cache_dir:
+            from tensor_cache import cache_paths, cached_files, ensure_split_cache, read_manifest
+            if build_cache:
+                self._cache_files = ensure_split_cache(split, root, cache_dir, img_size)
+            else:
+                self._cache_files = cache_paths(cache_dir, split)
+            manifest = read_manifest(cache_dir, split)
+            if manifest is None:
+                raise FileNotFoundError(f"No tensor cache for split '{split}' in {cache_dir}")
+            files = cached_files(manifest)  # undecodable files are listed but have no row
+            self.paths = [f["path"] for f in files]
+            self.labels = np.asarray([f["label"] for f in files], dtype=np.int64)
+            print(f"Mapped {len(self.paths)} cached images for split '{split}' from {cache_dir}")
+        else:
+            self.paths, labels = readable_images(*list_split(split, root))
+            self.labels = np.asarray(labels, dtype=np.int64)
+            print(f"Indexed {len(self.paths)} images for split '{split}' from {root}")
 
     def __len__(self):
-        return len(self.data)
+        return len(self.paths)
+
+    @property
+    def class_counts(self):
+        """Number of images per class, indexed by label"""
+        return np.bincount(self.labels, minlength=len(CLASSES))
+
+    @property
+    def images(self):
+        """Memory-mapped (N, S, S, 3) uint8 array when reading from the cache"""
+        if self._images is None and self.cache_dir:
+            # Opened lazily so each DataLoader worker maps the file itself
+            self._images = np.load(self._cache_files["images"], mmap_mode="r")
+        return self._images
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_images"] = None  # never pickle the mapped array into workers
+        return state
 
     def __getitem__(self, idx):
-        img, label = self.data[idx]
+        if self.cache_dir:
+            img = self.images[idx]
+        else:
+            img = load_image(self.paths[idx], self.img_size)
+        label = int(self.labels[idx])
         if self.transform:
             img = self.transform(img)
         return img, label
 
-# ---------------- IMAGE LOADING ----------------
-def load_images_from_folder(folder, label, img_size=224):
-    data = []
-    count = 0
-    for filename in os.listdir(folder):
-        if "mask" in filename.lower():
-            continue
-        path = os.path.join(folder, filename)
-        try:
-            img = cv2.imread(path, cv2.IMREAD_COLOR)
-            if img is None:
-                continue
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            img = cv2.resize(img, (img_size, img_size))
-            data.append([img, label])
-            count += 1
-        except Exception as e:
-            print(f"Skipped {path}: {e}")
-    print(f"Loaded {count} images from {folder}")
-    return data
-
-# ---------------- LOAD DATA ----------------
-ben_train = load_images_from_folder(ben_train_folder, 0, img_size)
-mal_train = load_images_from_folder(mal_train_folder, 1, img_size)
-ben_val   = load_images_from_folder(ben_val_folder, 0, img_size)
-mal_val   = load_images_from_folder(mal_val_folder, 1, img_size)
-ben_test  = load_images_from_folder(ben_test_folder, 0, img_size)
-mal_test  = load_images_from_folder(mal_test_folder, 1, img_size)
-
-training_data   = ben_train + mal_train
-validation_data = ben_val + mal_val
-testing_data    = ben_test + mal_test
-
-np.random.shuffle(training_data)
-np.random.shuffle(validation_data)
-np.random.shuffle(testing_data)
-
 # ---------------- TRANSFORMS ----------------
 train_transform = transforms.Compose([
     transforms.ToPILImage(),
@@ -94,33 +147,3 @@ val_test_transform = transforms.Compose([
     transforms.Normalize([0.485, 0.456, 0.406],
                          [0.229, 0.224, 0.225])
 ])
-
-# ---------------- DATASETS & LOADERS ----------------
-dataset_train = CancerDataset(training_data, transform=train_transform)
-dataset_val   = CancerDataset(validation_data, transform=val_test_transform)
-dataset_test  = CancerDataset(testing_data, transform=val_test_transform)
-
-train_loader = DataLoader(dataset_train, batch_size=32, shuffle=True)
-val_loader   = DataLoader(dataset_val, batch_size=32, shuffle=False)
-test_loader  = DataLoader(dataset_test, batch_size=32, shuffle=False)
-
-# ---------------- MODEL SETUP ----------------
-model = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1)
-num_features = model.fc.in_features
-model.fc = nn.Linear(num_features, 2)  # Binary classification
-
-# Move to device
-if torch.cuda.is_available():
-    device = torch.device("cuda")
-elif getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
-    device = torch.device("mps")
-else:
-    device = torch.device("cpu")
-
-model = model.to(device)
-
-# ---------------- LOSS & OPTIMIZER ----------------
-criterion = nn.CrossEntropyLoss()
-optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
-
-print("✅ Pretrained ResNet18 model ready for training with RGB inputs")
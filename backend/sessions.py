@@ -0,0 +1,254 @@
+import copy
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from langchain_core.messages import messages_from_dict, messages_to_dict
+
+SESSION_HEADER = "X-Session-Id"
+SESSION_COOKIE = "lifelens_session"
+
+
+def new_session_token():
+    return secrets.token_urlsafe(24)
+
+
+def new_session_state(cancer_type="breast cancer"):
+    """Fresh per-session analysis results and chat history"""
+    return {
+        "certainty": 0.0,
+        "riskLevel": "unknown",
+        "detection": "unknown",
+        "cancerType": cancer_type,
+        "history": [],  # Will store conversation history
+        "summary": None,  # Rolling summary of turns folded out of history
+        "summarized_messages": 0,
+        "transcript_tokens": 0,
+    }
+
+
+def trim_history(state, max_history):
+    """Bound per-session memory: keep a leading system message plus the newest messages"""
+    history = state["history"]
+    if max_history and len(history) > max_history:
+        head = history[:1] if history and history[0].type == "system" else []
+        state["history"] = head + history[-(max_history - len(head)):]
+    return state
+
+
+class SessionStore(ABC):
+    """
+    Interface for session backends. `get` returns a private copy of the state
+    dict for a token (or None if unknown/expired); callers mutate it and hand
+    it back to `save`, which is the only way changes reach the store.
+    Backends with `blocking_io` set do disk I/O, so async callers should run
+    them on an executor. `stats` never touches the backing storage.
+    """
+
+    blocking_io = False
+
+    def __init__(self, ttl_seconds=3600, max_history=50):
+        self.ttl_seconds = ttl_seconds
+        self.max_history = max_history
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @abstractmethod
+    def get(self, token):
+        ...
+
+    @abstractmethod
+    def save(self, token, state):
+        ...
+
+    @abstractmethod
+    def delete(self, token):
+        ...
+
+    @abstractmethod
+    def __len__(self):
+        ...
+
+    def cached_size(self):
+        """Session count without a storage round trip (may lag behind other workers)"""
+        return len(self)
+
+    def stats(self):
+        return {
+            "backend": type(self).__name__,
+            "sessions": self.cached_size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "ttl_seconds": self.ttl_seconds,
+            "max_history": self.max_history,
+        }
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU + TTL store. Only suitable for a single worker."""
+
+    def __init__(self, max_sessions=1000, ttl_seconds=3600, max_history=50):
+        super().__init__(ttl_seconds, max_history)
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # token -> (last_access, state)
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            last_access, state = entry
+            if time.time() - last_access > self.ttl_seconds:
+                del self._sessions[token]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._sessions[token] = (time.time(), state)
+            self._sessions.move_to_end(token)
+            self.hits += 1
+        # Copies in and out, so unsaved mutations never reach the store (as with SQLite)
+        return copy.deepcopy(state)
+
+    def save(self, token, state):
+        state = copy.deepcopy(trim_history(state, self.max_history))
+        with self._lock:
+            self._sessions[token] = (time.time(), state)
+            self._sessions.move_to_end(token)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+
+    def delete(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self):
+        stats = super().stats()
+        stats["max_sessions"] = self.max_sessions
+        return stats
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Shared store backed by a SQLite file, so several uvicorn workers on one
+    host see the same sessions. Chat history is stored as LangChain message dicts.
+    """
+
+    blocking_io = True
+
+    def __init__(self, path="sessions.db", max_sessions=10000, ttl_seconds=3600, max_history=50):
+        super().__init__(ttl_seconds, max_history)
+        self.path = path
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "token TEXT PRIMARY KEY, state TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON sessions(last_access)")
+        self._conn.commit()
+        self._size = self._count()  # refreshed by save/delete, read by stats()
+
+    def _count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    @staticmethod
+    def _dumps(state):
+        data = dict(state)
+        data["history"] = messages_to_dict(state["history"])
+        return json.dumps(data)
+
+    @staticmethod
+    def _loads(raw):
+        state = json.loads(raw)
+        state["history"] = messages_from_dict(state["history"])
+        return state
+
+    def get(self, token):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, last_access FROM sessions WHERE token = ?", (token,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if time.time() - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+                self._conn.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE sessions SET last_access = ? WHERE token = ?", (time.time(), token))
+            self._conn.commit()
+            self.hits += 1
+            return self._loads(row[0])
+
+    def save(self, token, state):
+        raw = self._dumps(trim_history(state, self.max_history))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (token, state, last_access) VALUES (?, ?, ?) "
+                "ON CONFLICT(token) DO UPDATE SET state = excluded.state, last_access = excluded.last_access",
+                (token, raw, now),
+            )
+            self.expired += self._conn.execute(
+                "DELETE FROM sessions WHERE last_access < ?", (now - self.ttl_seconds,)
+            ).rowcount
+            self.evicted += self._conn.execute(
+                "DELETE FROM sessions WHERE token IN ("
+                "SELECT token FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            ).rowcount
+            self._conn.commit()
+            self._size = self._count()
+
+    def delete(self, token):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+            self._conn.commit()
+            self._size = self._count()
+
+    def __len__(self):
+        with self._lock:
+            self._size = self._count()
+            return self._size
+
+    def cached_size(self):
+        return self._size
+
+    def stats(self):
+        stats = super().stats()
+        stats["max_sessions"] = self.max_sessions
+        stats["path"] = self.path
+        return stats
+
+
+def create_session_store():
+    """Pick the session backend from LIFELENS_SESSION_* environment variables"""
+    backend = os.getenv("LIFELENS_SESSION_BACKEND", "memory").lower()
+    ttl = float(os.getenv("LIFELENS_SESSION_TTL_SECONDS", "3600"))
+    max_sessions = int(os.getenv("LIFELENS_SESSION_MAX", "1000"))
+    max_history = int(os.getenv("LIFELENS_SESSION_MAX_HISTORY", "50"))
+    if backend == "memory":
+        return MemorySessionStore(max_sessions=max_sessions, ttl_seconds=ttl, max_history=max_history)
+    if backend == "sqlite":
+        path = os.getenv("LIFELENS_SESSION_DB", "sessions.db")
+        return SQLiteSessionStore(path, max_sessions=max_sessions, ttl_seconds=ttl, max_history=max_history)
+    raise ValueError(f"Unknown LIFELENS_SESSION_BACKEND: {backend}")
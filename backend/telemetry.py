@@ -0,0 +1,320 @@
+"""
+Request-level telemetry: request IDs, per-stage timing spans, Prometheus
+histograms and an opt-in sampling profiler. Standard library only.
+
+`span("decode")` times a block into the lifelens_stage_seconds histogram
+and into the current request's trace, which is returned as a Server-Timing
+header. When telemetry is disabled, `span` returns a shared no-op context
+manager. The instrumentation left on hot paths then costs one call and a
+flag check.
+
+TelemetryMiddleware assigns every HTTP request an ID (taken from X-Request-ID
+or generated) and records its latency per route and status. If a profile
+directory is configured, a request sent with "X-Profile: 1" is sampled by
+SamplingProfiler while it runs. The profile is written as collapsed stacks
+to <profile_dir>/<profile id>.folded, with a server-generated profile id.
+"""
+import asyncio
+import contextvars
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import Counter
+
+REQUEST_ID_HEADER = "X-Request-ID"
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_enabled = True
+_current = contextvars.ContextVar("lifelens_request", default=None)
+_UNSAFE_ID_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def is_enabled():
+    return _enabled
+
+
+# ---------- METRICS ----------
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, rendered in the Prometheus text format."""
+
+    def __init__(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts (last is +Inf), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def snapshot(self):
+        """{label values: (count, sum)}"""
+        with self._lock:
+            return {labels: (sum(counts), total) for labels, (counts, total) in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for label_values, counts, total in sorted(series):
+            labels = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.label_names, label_values))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram("lifelens_stage_seconds", "Time spent in each request stage", ("stage",))
+REQUEST_SECONDS = Histogram("lifelens_request_seconds", "HTTP request latency", ("method", "route", "status"))
+CHAT_PROMPT_TOKENS = Histogram(
+    "lifelens_chat_prompt_tokens", "Prompt tokens per chat turn, as sent and as they would be without the budget",
+    ("endpoint", "prompt"), (250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 16000, 32000))
+
+
+def observe_chat_usage(endpoint, usage):
+    """Record a chat turn's prompt size; turns answered from the answer cache send no prompt."""
+    if not _enabled or usage.get("cached"):
+        return
+    CHAT_PROMPT_TOKENS.observe(usage["prompt_tokens"], endpoint, "sent")
+    CHAT_PROMPT_TOKENS.observe(usage["unbounded_prompt_tokens"], endpoint, "unbounded")
+
+
+def render_metrics(gauges=None):
+    """Prometheus text exposition of all histograms plus {name: value} gauges."""
+    parts = [STAGE_SECONDS.render(), REQUEST_SECONDS.render(), CHAT_PROMPT_TOKENS.render()]
+    for name, value in (gauges or {}).items():
+        parts.append(f"# TYPE {name} gauge\n{name} {value}")
+    return "\n".join(parts) + "\n"
+
+
+# ---------- SPANS ----------
+
+class RequestTrace:
+    __slots__ = ("request_id", "spans")
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.spans = []  # (stage, seconds), in completion order
+
+    def server_timing(self, total_s):
+        """Server-Timing header value; repeated stages are summed."""
+        totals = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in totals.items()]
+        entries.append(f"total;dur={total_s * 1000:.2f}")
+        return ", ".join(entries)
+
+
+def current_request_id():
+    trace = _current.get()
+    return trace.request_id if trace is not None else "-"
+
+
+def observe_stage(stage, seconds):
+    """Record an already-measured duration as a stage of the current request."""
+    if not _enabled:
+        return
+    STAGE_SECONDS.observe(seconds, stage)
+    trace = _current.get()
+    if trace is not None:
+        trace.spans.append((stage, seconds))
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe_stage(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(stage):
+    """Context manager timing one stage; a shared no-op when telemetry is off."""
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(stage)
+
+
+# ---------- PROFILER ----------
+
+# Leaf frames in these files are threads parked on a lock, queue or selector
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of every other thread each `interval_ms` from
+    a background thread and aggregates them as collapsed stacks, i.e.
+    "thread;outer;...;inner count" lines. This is the input format of
+    flamegraph.pl, inferno and speedscope. Idle threads are skipped.
+    Threads are sampled process-wide, so concurrent requests show up too.
+    """
+
+    def __init__(self, interval_ms=5.0, max_seconds=60.0):
+        self.interval = interval_ms / 1000.0
+        self.max_seconds = max_seconds
+        self.samples = Counter()
+        self.ticks = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+            self.ticks += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def write(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.collapsed())
+        os.replace(tmp, path)
+
+
+def profile_path(profile_dir, profile_id):
+    return os.path.join(profile_dir, f"{_UNSAFE_ID_CHARS.sub('_', profile_id)}.folded")
+
+
+# ---------- MIDDLEWARE ----------
+
+class TelemetryMiddleware:
+    """
+    ASGI middleware: request IDs, per-route latency, a Server-Timing header
+    with the request's spans and the X-Profile sampling profiler.
+
+    Profiles are stored under a server-generated id (returned in X-Profile-Id),
+    never the client's request id, so concurrent requests can't overwrite each
+    other's. Stopping the profiler and writing the file are blocking, so they
+    go through `run_blocking(fn, *args)` (the loop's default executor if None).
+    """
+
+    def __init__(self, app, profile_dir=None, profile_interval_ms=5.0, run_blocking=None):
+        self.app = app
+        self.profile_dir = profile_dir
+        self.profile_interval_ms = profile_interval_ms
+        self.run_blocking = run_blocking or self._run_in_default_executor
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    @staticmethod
+    async def _run_in_default_executor(fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    @staticmethod
+    def _finish_profile(profiler, path):
+        profiler.stop().write(path)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        request_id = _UNSAFE_ID_CHARS.sub("", headers.get(b"x-request-id", b"").decode("latin-1"))[:64]
+        request_id = request_id or uuid.uuid4().hex
+        trace = RequestTrace(request_id)
+        token = _current.set(trace)
+        profiler = profile_id = None
+        if self.profile_dir and headers.get(b"x-profile", b"").lower() in (b"1", b"true"):
+            profile_id = uuid.uuid4().hex
+            profiler = SamplingProfiler(self.profile_interval_ms).start()
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_headers(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                extra = [
+                    (REQUEST_ID_HEADER.lower().encode(), request_id.encode()),
+                    (b"server-timing", trace.server_timing(time.perf_counter() - start).encode()),
+                ]
+                if profiler is not None:
+                    extra.append((PROFILE_ID_HEADER.lower().encode(), profile_id.encode()))
+                message = {**message, "headers": [*message.get("headers", []), *extra]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], route, str(status))
+            if profiler is not None:
+                await self.run_blocking(self._finish_profile, profiler, profile_path(self.profile_dir, profile_id))
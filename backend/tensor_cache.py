@@ -0,0 +1,205 @@
+"""
+Preprocessed, memory-mapped image cache for the BreaKHis splits.
+
+Each split is decoded, converted to RGB and resized once into
+<cache_dir>/<split>_images.npy (N, S, S, 3) uint8, next to <split>_labels.npy
+and a <split>_manifest.json listing every source file with its size, mtime and
+content hash. Files that can't be decoded stay in the manifest flagged
+"skipped" (with no image row), so the cache still counts as fresh and they are
+not read again until they change. CancerDataset(..., cache_dir=...) reads rows
+straight from the memory map. When the source folders change only new or modified files are
+decoded again; unchanged rows are copied over from the previous cache.
+
+The manifest is what makes a cache valid: a rebuild deletes it before
+swapping in the new arrays and writes the new one last, so a crash in between
+leaves no manifest (and a full rebuild) rather than an old manifest indexing
+new rows. Temporary files are per process; under DDP only one process per
+host should build (see train_model.make_dataloaders).
+
+    python tensor_cache.py --cache-dir cache --splits train val test
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from process_data import DATA_ROOT, SPLITS, img_size, list_split
+
+MANIFEST_VERSION = 2
+
+
+def cache_paths(cache_dir, split):
+    return {
+        "images": os.path.join(cache_dir, f"{split}_images.npy"),
+        "labels": os.path.join(cache_dir, f"{split}_labels.npy"),
+        "manifest": os.path.join(cache_dir, f"{split}_manifest.json"),
+    }
+
+
+def _file_stat(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _decode(raw, size):
+    img = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("undecodable image")
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return cv2.resize(img, (size, size))
+
+
+def cached_files(manifest):
+    """Manifest entries that have an image row, in row order."""
+    return [entry for entry in manifest["files"] if not entry.get("skipped")]
+
+
+def read_manifest(cache_dir, split):
+    try:
+        with open(cache_paths(cache_dir, split)["manifest"]) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_fresh(cache_dir, split, root=DATA_ROOT, size=img_size):
+    """True if the cache for `split` matches the files currently on disk (stat only, no hashing)."""
+    manifest = read_manifest(cache_dir, split)
+    if manifest is None or manifest.get("version") != MANIFEST_VERSION or manifest.get("img_size") != size:
+        return False
+    paths, labels = list_split(split, root)
+    files = manifest["files"]
+    if len(files) != len(paths):
+        return False
+    for entry, path, label in zip(files, paths, labels):
+        if entry["path"] != path or entry["label"] != label:
+            return False
+        if [entry["size"], entry["mtime_ns"]] != list(_file_stat(path)):
+            return False
+    return True
+
+
+def build_split_cache(split, root=DATA_ROOT, cache_dir="cache", size=img_size, verbose=True):
+    """(Re)build the cache for one split, reusing rows of unchanged files. Returns build stats."""
+    os.makedirs(cache_dir, exist_ok=True)
+    out = cache_paths(cache_dir, split)
+    start = time.perf_counter()
+    paths, labels = list_split(split, root)
+
+    # Index the previous cache so unchanged files can be copied instead of decoded
+    old_manifest = read_manifest(cache_dir, split)
+    old_rows, old_images = {}, None
+    if (old_manifest and old_manifest.get("version") == MANIFEST_VERSION
+            and old_manifest.get("img_size") == size and os.path.exists(out["images"])):
+        old_images = np.load(out["images"], mmap_mode="r")
+        if len(old_images) == len(cached_files(old_manifest)):
+            rows = iter(range(len(old_images)))
+            old_rows = {entry["path"]: (None if entry.get("skipped") else next(rows), entry)
+                        for entry in old_manifest["files"]}
+
+    tmp = f".{os.getpid()}.tmp"
+    tmp_images = out["images"] + tmp + ".npy"
+    images = np.lib.format.open_memmap(tmp_images, mode="w+", dtype=np.uint8, shape=(len(paths), size, size, 3))
+    files, reused, decoded, skipped = [], 0, 0, 0
+    keep = []
+    for path, label in zip(paths, labels):
+        file_size, mtime_ns = _file_stat(path)
+        old = old_rows.get(path)
+        row = len(keep)
+        entry = {"path": path, "label": label, "size": file_size, "mtime_ns": mtime_ns}
+        if old is not None and [old[1]["size"], old[1]["mtime_ns"]] == [file_size, mtime_ns]:
+            source, digest = old[0], old[1]["hash"]
+        else:
+            with open(path, "rb") as f:
+                raw = f.read()
+            digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+            source = old[0] if old is not None and old[1]["hash"] == digest else "decode"
+            if source == "decode":
+                try:
+                    images[row] = _decode(raw, size)
+                    decoded += 1
+                except ValueError:
+                    print(f"Skipped {path}: could not decode")
+                    source = None
+        entry["hash"] = digest
+        if source is None:  # undecodable, now or when it was last cached
+            files.append({**entry, "skipped": True})
+            skipped += 1
+            continue
+        if source != "decode":
+            images[row] = old_images[source]
+            reused += 1
+        keep.append(row)
+        files.append(entry)
+
+    images.flush()
+    del images, old_images
+    if skipped:
+        # Compact away the rows of undecodable files
+        full = np.load(tmp_images, mmap_mode="r")
+        compact_path = out["images"] + tmp + ".compact.npy"
+        compact = np.lib.format.open_memmap(compact_path, mode="w+", dtype=np.uint8, shape=(len(keep), size, size, 3))
+        compact[:] = full[:len(keep)]
+        compact.flush()
+        del compact, full
+        os.replace(compact_path, tmp_images)
+
+    tmp_labels = out["labels"] + tmp + ".npy"
+    np.save(tmp_labels, np.asarray([f["label"] for f in files if not f.get("skipped")], dtype=np.int64))
+    manifest = {"version": MANIFEST_VERSION, "split": split, "root": root, "img_size": size, "files": files}
+    tmp_manifest = out["manifest"] + tmp
+    with open(tmp_manifest, "w") as f:
+        json.dump(manifest, f)
+
+    # Invalidate, swap the arrays, then publish the manifest that describes them
+    if os.path.exists(out["manifest"]):
+        os.remove(out["manifest"])
+    os.replace(tmp_images, out["images"])
+    os.replace(tmp_labels, out["labels"])
+    os.replace(tmp_manifest, out["manifest"])
+
+    stats = {"split": split, "images": len(keep), "decoded": decoded, "reused": reused,
+             "skipped": skipped, "seconds": time.perf_counter() - start}
+    if verbose:
+        print(f"Cached split '{split}': {len(keep)} images ({decoded} decoded, {reused} reused, {skipped} skipped) "
+              f"in {stats['seconds']:.1f}s -> {out['images']}")
+    return stats
+
+
+def ensure_split_cache(split, root=DATA_ROOT, cache_dir="cache", size=img_size):
+    """Rebuild the split's cache only if its source folder changed."""
+    if not is_fresh(cache_dir, split, root, size):
+        build_split_cache(split, root, cache_dir, size)
+    return cache_paths(cache_dir, split)
+
+
+def load_split_cache(split, cache_dir="cache"):
+    """(images memmap, labels array, manifest) for one cached split."""
+    out = cache_paths(cache_dir, split)
+    images = np.load(out["images"], mmap_mode="r")
+    labels = np.load(out["labels"])
+    return images, labels, read_manifest(cache_dir, split)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess BreaKHis splits into memory-mapped .npy caches")
+    parser.add_argument("--root", default=DATA_ROOT)
+    parser.add_argument("--cache-dir", default="cache")
+    parser.add_argument("--splits", nargs="+", default=list(SPLITS), choices=SPLITS)
+    parser.add_argument("--img-size", type=int, default=img_size)
+    parser.add_argument("--force", action="store_true", help="rebuild even if the cache is fresh")
+    args = parser.parse_args()
+
+    for split in args.splits:
+        if args.force or not is_fresh(args.cache_dir, split, args.root, args.img_size):
+            build_split_cache(split, args.root, args.cache_dir, args.img_size)
+        else:
+            print(f"Split '{split}' is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,29 @@
+import argparse
+import json
+import os
+
+import numpy as np
 import torch
 from torchvision import transforms
 from torch.utils.data import DataLoader
-from process_data import CancerDataset, testing_data
-from torchvision.models import resnet18, ResNet18_Weights
+from process_data import CancerDataset, DATA_ROOT
+from torchvision.models import resnet18
 import torch.nn as nn
-from sklearn.metrics import confusion_matrix
+
+from evaluation import compute_metrics, magnification_of, run_inference
 
 # --- Config ---
-BATCH_SIZE = 8
+BATCH_SIZE = 64
+NUM_WORKERS = min(8, os.cpu_count() or 1)
 IMG_SIZE = 224
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 BEST_MODEL_PATH = "breast_cancer.pth"  # trained model path
+DATA_CACHE_DIR = None  # e.g. "cache" to read preprocessed memmaps from tensor_cache.py
 
 # --- Transforms ---
+# "serving" is inference.transform applied to the native-size image, exactly as
+# /predict does; "square" is the training-time validation transform on images
+# squashed to IMG_SIZE x IMG_SIZE (and works with DATA_CACHE_DIR).
 test_transform = transforms.Compose([
     transforms.ToPILImage(),
     transforms.Resize((IMG_SIZE, IMG_SIZE)),
@@ -21,66 +32,100 @@ test_transform = transforms.Compose([
                          [0.229, 0.224, 0.225])
 ])
 
-# --- Dataset and DataLoader ---
-dataset_test = CancerDataset(testing_data, transform=test_transform)
-test_loader = DataLoader(dataset_test, batch_size=BATCH_SIZE, shuffle=False)
+# --- Risk function ---
+def get_risk(pred_class, confidence):
+    """Vectorized risk level for arrays of predicted classes and confidences"""
+    high_if_malignant = np.where(pred_class == 1, "High", "Low")
+    low_if_malignant = np.where(pred_class == 1, "Low", "High")
+    return np.where(confidence > 0.75, high_if_malignant,
+                    np.where(confidence > 0.5, "Medium", low_if_malignant))
 
-# --- Load pretrained ResNet18 (must match training) ---
-model = resnet18(weights=ResNet18_Weights.IMAGENET1K_V1)
-num_features = model.fc.in_features
-model.fc = nn.Linear(num_features, 2)  # binary classification
-model.to(DEVICE)
+def make_dataset(preprocessing, root=DATA_ROOT, cache_dir=DATA_CACHE_DIR, split="test"):
+    if preprocessing == "serving":
+        from inference import transform
+        return CancerDataset(split, transform=transform, root=root, img_size=None)
+    return CancerDataset(split, transform=test_transform, root=root, cache_dir=cache_dir)
 
-# --- Load trained weights ---
-model.load_state_dict(torch.load(BEST_MODEL_PATH, map_location=DEVICE))
-model.eval()
+def load_model(weights_path=BEST_MODEL_PATH, device=DEVICE):
+    # No pretrained weights: the checkpoint overwrites every parameter
+    model = resnet18(weights=None)
+    num_features = model.fc.in_features
+    model.fc = nn.Linear(num_features, 2)  # binary classification
+    model.load_state_dict(torch.load(weights_path, map_location=device))
+    return model.to(device).eval()
 
-# --- Risk function ---
-def get_risk(pred_class, confidence):
-    if confidence > 0.75:
-        return "High" if pred_class == 1 else "Low"
-    elif confidence > 0.5:
-        return "Medium"
-    else:
-        return "Low" if pred_class == 1 else "High"
-
-# --- Evaluation ---
-results = []
-all_preds = []
-all_labels = []
-
-with torch.no_grad():
-    for batch_x, batch_y in test_loader:
-        batch_x, batch_y = batch_x.to(DEVICE), batch_y.to(DEVICE)
-        outputs = model(batch_x)
-        probs = torch.softmax(outputs, dim=1)
-        preds = torch.argmax(outputs, dim=1)
-
-        all_preds.extend(preds.cpu().tolist())
-        all_labels.extend(batch_y.cpu().tolist())
-
-        for i in range(len(batch_x)):
-            pred_class = preds[i].item()
-            confidence = probs[i, pred_class].item()
-            risk_level = get_risk(pred_class, confidence)
-
-            results.append({
-                "true_label": int(batch_y[i].item()),
-                "prediction": int(pred_class),
-                "confidence_percent": round(confidence * 100, 2),
-                "risk_level": risk_level
-            })
-
-# --- Print summary ---
-correct = sum([r["true_label"] == r["prediction"] for r in results])
-accuracy = 100.0 * correct / len(results)
-print(f"Test Accuracy: {accuracy:.2f}%")
-print(f"Total test samples: {len(results)}")
-print("\nSample predictions:")
-for r in results[:10]:
-    print(r)
-
-# --- Confusion matrix ---
-cm = confusion_matrix(all_labels, all_preds)
-print("\nConfusion Matrix:")
-print(cm)
+def make_logits_fn(model, backend="eager", root=DATA_ROOT, device=DEVICE):
+    """Logits through the same trunk/head split the server uses for `backend`."""
+    if backend == "eager":
+        return lambda x: model(x.to(device, non_blocking=True))
+    from inference import transform
+    from inference_backends import calibration_batches, load_backend
+    calibration = calibration_batches(root, "val", 64, transform=transform) if backend == "int8-static" else None
+    features, head, report = load_backend(model.cpu(), backend, calibration)
+    if report["backend"] != backend:
+        raise RuntimeError(f"Backend '{backend}' rejected: {report['rejected']}")
+    return lambda x: head(features(x).float())
+
+def evaluate(model, dataset, backend="eager", batch_size=BATCH_SIZE, num_workers=NUM_WORKERS,
+             root=DATA_ROOT, device=DEVICE):
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers,
+                        pin_memory=device.type == "cuda", persistent_workers=False)
+    logits_fn = make_logits_fn(model, backend, root, device)
+    logits, labels, timings = run_inference(logits_fn, loader, len(dataset))
+    magnifications = [magnification_of(p) for p in dataset.paths]
+    report = compute_metrics(logits, labels.numpy(), magnifications)
+    report["timings"] = timings
+    return report, logits
+
+def print_report(report, logits, labels):
+    print(f"Test Accuracy: {report['accuracy']:.2f}%")
+    print(f"Total test samples: {report['count']}")
+    auc = report["roc_auc"]
+    print(f"ROC-AUC: {auc:.4f}" if auc is not None else "ROC-AUC: n/a (one class only)")
+    print(f"ECE: {report['ece']:.4f}")
+    timings = report["timings"]
+    print(f"Throughput: {timings['images_per_s']:.1f} images/s end-to-end, "
+          f"{timings['model_images_per_s']:.1f} images/s in the model")
+
+    print("\nPer magnification:")
+    for mag, m in report["per_magnification"].items():
+        mag_auc = f"{m['roc_auc']:.4f}" if m["roc_auc"] is not None else "n/a"
+        print(f"  {mag:>4}x: n={m['count']:5d} | acc {m['accuracy']:6.2f}% | AUC {mag_auc} | ECE {m['ece']:.4f}")
+
+    probs = torch.softmax(logits[:10], dim=1).numpy()
+    preds = probs.argmax(axis=1)
+    confidence = probs.max(axis=1)
+    print("\nSample predictions:")
+    for true_label, pred, conf, risk in zip(labels[:10], preds, confidence, get_risk(preds, confidence)):
+        print({"true_label": int(true_label), "prediction": int(pred),
+               "confidence_percent": round(float(conf) * 100, 2), "risk_level": str(risk)})
+
+    print("\nConfusion Matrix:")
+    print(np.array(report["confusion_matrix"]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the classifier on the test split")
+    parser.add_argument("--weights", default=BEST_MODEL_PATH)
+    parser.add_argument("--root", default=DATA_ROOT)
+    parser.add_argument("--preprocessing", choices=["serving", "square"], default="serving")
+    parser.add_argument("--backend", default="eager",
+                        help="inference backend as in LIFELENS_INFERENCE_BACKEND (CPU only for non-eager)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--cache-dir", default=DATA_CACHE_DIR, help="tensor cache (square preprocessing only)")
+    parser.add_argument("--json", default=None, help="write the full report here")
+    args = parser.parse_args()
+
+    device = DEVICE if args.backend == "eager" else torch.device("cpu")
+    dataset = make_dataset(args.preprocessing, args.root, args.cache_dir)
+    model = load_model(args.weights, device)
+    report, logits = evaluate(model, dataset, args.backend, args.batch_size, args.workers, args.root, device)
+    report.update(preprocessing=args.preprocessing, backend=args.backend, weights=args.weights)
+    print_report(report, logits, dataset.labels)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Known-value checks for the vectorized metrics in evaluation.py."""
+import itertools
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torch")
+
+from evaluation import confusion, expected_calibration_error, roc_auc
+
+
+def pairwise_auc(labels, scores):
+    """Reference ROC-AUC: share of (positive, negative) pairs ranked correctly, ties counting half."""
+    pos = [s for s, y in zip(scores, labels) if y == 1]
+    neg = [s for s, y in zip(scores, labels) if y == 0]
+    wins = sum(1.0 if p > n else 0.5 if p == n else 0.0 for p, n in itertools.product(pos, neg))
+    return wins / (len(pos) * len(neg))
+
+
+def test_confusion_rows_are_true_classes():
+    labels = np.array([0, 0, 1, 1, 1])
+    preds = np.array([0, 1, 1, 1, 0])
+    assert confusion(labels, preds).tolist() == [[1, 1], [1, 2]]
+
+
+def test_confusion_keeps_empty_classes():
+    labels = np.array([0, 2])
+    preds = np.array([0, 2])
+    assert confusion(labels, preds, num_classes=3).tolist() == [[1, 0, 0], [0, 0, 0], [0, 0, 1]]
+
+
+def test_roc_auc_without_ties():
+    labels = np.array([0, 0, 1, 1])
+    scores = np.array([0.1, 0.4, 0.35, 0.8])
+    assert roc_auc(labels, scores) == pytest.approx(0.75)
+
+
+def test_roc_auc_ties_count_half():
+    labels = np.array([0, 1, 0, 1])
+    scores = np.array([0.5, 0.5, 0.2, 0.9])
+    assert roc_auc(labels, scores) == pytest.approx(0.875)
+    assert roc_auc(labels, np.full(4, 0.3)) == pytest.approx(0.5)
+
+
+def test_roc_auc_matches_pairwise_definition():
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 2, 200)
+    scores = rng.integers(0, 10, 200) / 10.0  # coarse scores, so many ties
+    assert roc_auc(labels, scores) == pytest.approx(pairwise_auc(labels, scores))
+
+
+def test_roc_auc_single_class_is_none():
+    assert roc_auc(np.array([1, 1, 1]), np.array([0.2, 0.5, 0.9])) is None
+    assert roc_auc(np.array([0, 0]), np.array([0.2, 0.5])) is None
+
+
+def test_ece_known_value():
+    confidences = np.array([0.95, 0.95, 0.55, 0.55])
+    correct = np.array([True, False, True, True])
+    ece, table = expected_calibration_error(confidences, correct, num_bins=10)
+    # Each bin holds half the samples and is off by 0.45
+    assert ece == pytest.approx(0.45)
+    assert [(row["bin"], row["count"]) for row in table] == [(5, 2), (9, 2)]
+    assert table[0]["accuracy"] == pytest.approx(1.0)
+    assert table[1]["confidence"] == pytest.approx(0.95)
+
+
+def test_ece_calibrated_and_full_confidence():
+    ece, _ = expected_calibration_error(np.full(4, 0.75), np.array([True, True, True, False]), num_bins=10)
+    assert ece == pytest.approx(0.0)
+    # A confidence of exactly 1.0 falls in the last bin rather than past it
+    ece, table = expected_calibration_error(np.array([1.0]), np.array([True]), num_bins=10)
+    assert ece == pytest.approx(0.0)
+    assert table[0]["bin"] == 9
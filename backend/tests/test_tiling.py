@@ -0,0 +1,60 @@
+"""Geometry of the stitched whole-slide CAM in tiling.py."""
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+torch = pytest.importorskip("torch")
+F = torch.nn.functional
+
+from tiling import FEATURE_STRIDE, TILE_SIZE, predict_slide, tile_grid
+
+
+class PoolingExplainer:
+    """Stand-in for GradCAM: each tile's CAM is its darkness averaged over FEATURE_STRIDE cells."""
+
+    def explain_classes(self, batch, temperature=1.0):
+        darkness = -batch.mean(dim=1, keepdim=True)
+        cams = F.avg_pool2d(darkness, FEATURE_STRIDE)
+        cams = (cams - cams.amin(dim=(2, 3), keepdim=True)).squeeze(1)
+        probs = torch.full((batch.shape[0], 2), 0.5)
+        return probs, torch.stack([cams, cams])
+
+
+def stitched_peak(h, w, dot_y, dot_x, size=4):
+    img = np.full((h, w, 3), 255, dtype=np.uint8)
+    img[dot_y:dot_y + size, dot_x:dot_x + size] = 0
+    slide = predict_slide(PoolingExplainer(), img, min_tissue=0.0)
+    # Upsample as overlay_heatmap does, then take the weighted centroid of the peak
+    cam = cv2.resize(slide["cam"], (w, h), interpolation=cv2.INTER_LINEAR)
+    cam = np.where(cam > 0.5 * cam.max(), cam, 0)
+    ys, xs = np.indices(cam.shape)
+    return (ys * cam).sum() / cam.sum(), (xs * cam).sum() / cam.sum()
+
+
+def test_tile_origins_are_stride_aligned_and_cover_the_image():
+    h, w = 500, 700
+    positions = tile_grid(h, w)
+    assert all(y % FEATURE_STRIDE == 0 and x % FEATURE_STRIDE == 0 for y, x in positions)
+    assert max(y for y, _ in positions) + TILE_SIZE >= h
+    assert max(x for _, x in positions) + TILE_SIZE >= w
+
+
+@pytest.mark.parametrize("dot_y, dot_x", [(462, 654), (14, 14), (238, 366)])
+def test_point_activation_lands_on_its_cell(dot_y, dot_x):
+    # The dots sit at the centre of a feature cell, so the stitched peak should too,
+    # including in the edge tiles of an image that isn't a multiple of the stride
+    y, x = stitched_peak(500, 700, dot_y, dot_x)
+    cell_y = (dot_y // FEATURE_STRIDE + 0.5) * FEATURE_STRIDE - 0.5
+    cell_x = (dot_x // FEATURE_STRIDE + 0.5) * FEATURE_STRIDE - 0.5
+    assert abs(y - cell_y) < 3
+    assert abs(x - cell_x) < 3
+
+
+def test_cam_spans_the_image_for_small_inputs():
+    img = np.full((100, 150, 3), 255, dtype=np.uint8)
+    img[40:44, 70:74] = 0
+    slide = predict_slide(PoolingExplainer(), img, min_tissue=0.0)
+    assert slide["tiles"] == 1
+    cam = cv2.resize(slide["cam"], (150, 100), interpolation=cv2.INTER_LINEAR)
+    peak_y, peak_x = np.unravel_index(cam.argmax(), cam.shape)
+    assert abs(peak_y - 47.5) < FEATURE_STRIDE / 2 and abs(peak_x - 79.5) < FEATURE_STRIDE / 2
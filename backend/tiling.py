@@ -0,0 +1,157 @@
+"""
+Tiled whole-slide inference.
+
+The default /predict path resizes the shorter side to 224 and centre-crops.
+Here the image is instead cut into overlapping 224x224 tiles at native
+resolution and streamed through the model in fixed-size batches. Only one
+batch of tiles exists at a time, so memory beyond the decoded image stays
+constant. Tile probabilities are averaged into a slide prediction. Each
+tile's unnormalised CAM (7x7 for ResNet18) is accumulated into a canvas at
+feature resolution (1/32 of the image). Every tile origin is a multiple of
+the feature stride, so tile CAM cells land exactly on canvas cells; tiles at
+the bottom/right edge overhang the image and are padded with background.
+The canvas is then resampled onto a grid covering exactly the image and
+upsampled to full size once, when the overlay is drawn.
+"""
+import math
+
+import cv2
+import numpy as np
+import torch
+
+TILE_SIZE = 224
+FEATURE_STRIDE = 32  # ResNet18 layer4 output is 1/32 of the input
+CAM_SAMPLES_PER_CELL = 4  # resolution of the returned CAM, per feature cell
+IMAGENET_MEAN = torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1)
+IMAGENET_STD = torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1)
+
+
+def _positions(length, tile, step):
+    if length <= tile:
+        return [0]
+    positions = list(range(0, length - tile + 1, step))
+    if positions[-1] + tile < length:
+        # Last tile stays stride-aligned and overhangs the edge instead of sitting flush with it
+        positions.append(math.ceil((length - tile) / FEATURE_STRIDE) * FEATURE_STRIDE)
+    return positions
+
+
+def tile_grid(h, w, tile=TILE_SIZE, overlap=0.25):
+    """
+    Top-left (y, x) of overlapping tiles covering an h x w image. Every
+    origin is a multiple of the feature stride; edge tiles may overhang.
+    """
+    step = max(FEATURE_STRIDE, round(tile * (1 - overlap) / FEATURE_STRIDE) * FEATURE_STRIDE)
+    return [(y, x) for y in _positions(h, tile, step) for x in _positions(w, tile, step)]
+
+
+def tissue_fraction(tile, threshold=220):
+    """Share of pixels darker than near-white background."""
+    return float((tile.mean(axis=2) < threshold).mean())
+
+
+def _to_tensor(tiles, mean=IMAGENET_MEAN, std=IMAGENET_STD):
+    batch = torch.from_numpy(tiles).permute(0, 3, 1, 2).float().div_(255)
+    return batch.sub_(mean).div_(std)
+
+
+def iter_tile_batches(img, positions, tile=TILE_SIZE, batch_size=16, min_tissue=0.0, skipped=None,
+                      mean=None, std=None):
+    """
+    Yield (positions, normalised (B, 3, tile, tile) tensor) batches, reusing
+    one uint8 staging buffer. Tiles with less than `min_tissue` tissue are
+    skipped and counted in skipped[0] if a list is given. Normalisation
+    defaults to the ImageNet mean/std.
+    """
+    mean = IMAGENET_MEAN if mean is None else torch.tensor(mean, dtype=torch.float32).view(1, 3, 1, 1)
+    std = IMAGENET_STD if std is None else torch.tensor(std, dtype=torch.float32).view(1, 3, 1, 1)
+    staging = np.empty((batch_size, tile, tile, 3), dtype=np.uint8)
+    batch_positions = []
+    for y, x in positions:
+        patch = img[y:y + tile, x:x + tile]
+        if patch.shape[0] != tile or patch.shape[1] != tile:
+            # Tile overhangs the image edge (or the image is smaller than a tile): pad with white background
+            patch = cv2.copyMakeBorder(patch, 0, tile - patch.shape[0], 0, tile - patch.shape[1],
+                                       cv2.BORDER_CONSTANT, value=(255, 255, 255))
+        if min_tissue and tissue_fraction(patch) < min_tissue:
+            if skipped is not None:
+                skipped[0] += 1
+            continue
+        staging[len(batch_positions)] = patch
+        batch_positions.append((y, x))
+        if len(batch_positions) == batch_size:
+            yield batch_positions, _to_tensor(staging, mean, std)
+            batch_positions = []
+    if batch_positions:
+        yield batch_positions, _to_tensor(staging[:len(batch_positions)], mean, std)
+
+
+def cam_to_image(canvas, h, w, stride=FEATURE_STRIDE, samples_per_cell=CAM_SAMPLES_PER_CELL):
+    """
+    Resample a stitched canvas, whose cell (i, j) is centred on image pixel
+    ((i + 0.5) * stride, (j + 0.5) * stride), onto a grid spanning exactly the
+    h x w image. Cropping whole cells instead would stretch the CAM by up to
+    a cell when it is resized to the image.
+    """
+    out_h = max(1, math.ceil(h / stride) * samples_per_cell)
+    out_w = max(1, math.ceil(w / stride) * samples_per_cell)
+    sy, sx = stride * out_h / h, stride * out_w / w
+    # Canvas coordinate c maps to output coordinate (c + 0.5) * s - 0.5 (pixel-centre convention)
+    matrix = np.float32([[sx, 0, 0.5 * sx - 0.5], [0, sy, 0.5 * sy - 0.5]])
+    return cv2.warpAffine(canvas, matrix, (out_w, out_h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def predict_slide(explainer, img, tile=TILE_SIZE, overlap=0.25, batch_size=16, min_tissue=0.05, mean=None, std=None,
+                  temperature=1.0):
+    """
+    Tiled prediction for one RGB image. Returns a dict with the slide-level
+    probs and class_idx, the stitched cam (spanning exactly the image at
+    CAM_SAMPLES_PER_CELL samples per feature cell, [0, 1]) and tile counts.
+    Falls back to every tile if none pass the tissue filter. Tile
+    probabilities are scaled by `temperature` before they are averaged.
+    """
+    h, w = img.shape[:2]
+    positions = tile_grid(h, w, tile, overlap)
+    last_y = max(y for y, _ in positions)
+    last_x = max(x for _, x in positions)
+
+    cam_sum = cam_count = prob_sum = prob_max = None
+    tiles, skipped = 0, [0]
+    for threshold in (min_tissue, 0.0):
+        batches = iter_tile_batches(img, positions, tile, batch_size, threshold, skipped, mean, std)
+        for batch_positions, batch in batches:
+            probs, cams = explainer.explain_classes(batch, temperature=temperature)
+            probs, cams = probs.numpy(), cams.cpu().numpy()  # (B, C), (C, B, fh, fw)
+            fh, fw = cams.shape[2:]
+            if cam_sum is None:
+                num_classes = probs.shape[1]
+                grid_h, grid_w = last_y // FEATURE_STRIDE + fh, last_x // FEATURE_STRIDE + fw
+                cam_sum = np.zeros((num_classes, grid_h, grid_w), dtype=np.float32)
+                cam_count = np.zeros((grid_h, grid_w), dtype=np.float32)
+                prob_sum = np.zeros(num_classes, dtype=np.float64)
+                prob_max = np.zeros(num_classes, dtype=np.float64)
+            for i, (y, x) in enumerate(batch_positions):
+                gy, gx = y // FEATURE_STRIDE, x // FEATURE_STRIDE  # exact: origins are stride-aligned
+                cam_sum[:, gy:gy + fh, gx:gx + fw] += cams[:, i]
+                cam_count[gy:gy + fh, gx:gx + fw] += 1
+            prob_sum += probs.sum(axis=0)
+            prob_max = np.maximum(prob_max, probs.max(axis=0))
+            tiles += len(batch_positions)
+        if tiles or not threshold:
+            break
+        skipped = [0]  # nothing looked like tissue; score every tile instead
+
+    probs = prob_sum / tiles
+    class_idx = int(probs.argmax())
+    # Average overlapping tiles, map onto the image (dropping the padding), then normalise over the whole slide
+    cam = cam_to_image(cam_sum[class_idx] / np.maximum(cam_count, 1), h, w)
+    cam = (cam - cam.min()) / (cam.max() - cam.min() + 1e-8)
+    return {
+        "probs": probs,
+        "class_idx": class_idx,
+        "max_probs": prob_max,
+        "cam": cam,
+        "tiles": tiles,
+        "skipped_tiles": skipped[0],
+        "grid": [grid_h, grid_w],
+    }
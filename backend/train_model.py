@@ -1,4 +1,8 @@
+import argparse
+import os
 import random
+import time
+from contextlib import nullcontext
 import numpy as np
 from pathlib import Path
 import torch
@@ -8,7 +12,14 @@ from torch.utils.data import DataLoader, WeightedRandomSampler
 from torchvision import transforms, models
 from tqdm import tqdm
 
-from process_data import CancerDataset, training_data, validation_data
+from process_data import CancerDataset, DATA_ROOT
+from augment import BatchAugment, ToUint8Tensor
+from tensor_cache import ensure_split_cache
+from checkpointing import AsyncCheckpointer, capture_rng_state, latest_checkpoint, load_checkpoint, restore_rng_state
+from distributed import (
+    DistributedWeightedSampler, ShardSampler, all_gather_objects, all_reduce_sum, barrier, broadcast_object,
+    cleanup_distributed, init_distributed, is_main_process, print_main, unwrap_model,
+)
 
 # -------------------- CONFIG --------------------
 SEED = 42
@@ -21,6 +32,29 @@ MODEL_NAME = "resnet18"
 OUTPUT_DIR = Path("checkpoints")
 OUTPUT_DIR.mkdir(exist_ok=True, parents=True)
 BEST_MODEL_PATH = OUTPUT_DIR / "best_model.pth"
+DATA_CACHE_DIR = None  # e.g. "cache" to read preprocessed memmaps from tensor_cache.py
+
+# Input pipeline
+NUM_WORKERS = min(8, os.cpu_count() or 1)  # 0 = load in the main process
+PREFETCH_FACTOR = 4                         # batches prefetched per worker
+# Workers draw their seeds from the checkpointed loader generator each time they
+# start. Persistent workers start only once, so True saves the per-epoch worker
+# startup but makes a resumed run's augmentation differ from an uninterrupted one.
+PERSISTENT_WORKERS = False
+BATCH_AUGMENT = False                       # augment uint8 batches on-device instead of per-sample PIL
+
+# Training mode
+PRECISION = "fp32"      # "fp32", "bf16" (autocast, CPU or GPU), "fp16" (CUDA autocast + GradScaler) or "auto"
+CHANNELS_LAST = False   # NHWC model weights and inputs
+ACCUM_STEPS = 1         # micro-batches per optimizer step; each loader batch is BATCH_SIZE // ACCUM_STEPS
+
+# Resumable training state
+CHECKPOINT_DIR = OUTPUT_DIR / "state"
+CHECKPOINT_EVERY = 1    # epochs between full-state checkpoints
+KEEP_CHECKPOINTS = 3    # newest checkpoints kept on disk
+
+# Data-parallel training (under torchrun; BATCH_SIZE and NUM_WORKERS are per host process)
+DIST_BACKEND = "gloo"
 # ------------------------------------------------
 
 def seed_everything(seed=SEED):
@@ -30,13 +64,56 @@ def seed_everything(seed=SEED):
     if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
         torch.mps.manual_seed(seed)
 
-def get_device():
+def seed_worker(worker_id):
+    """Derive each DataLoader worker's python/numpy seeds from its torch seed."""
+    worker_seed = torch.initial_seed() % 2**32
+    np.random.seed(worker_seed)
+    random.seed(worker_seed)
+
+def loader_kwargs(num_workers, device, seed=SEED):
+    """DataLoader settings for a reproducible multi-process input pipeline."""
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    kwargs = {
+        "num_workers": num_workers,
+        "pin_memory": torch.device(device).type == "cuda",
+        "worker_init_fn": seed_worker,
+        "generator": generator,
+    }
+    if num_workers > 0:
+        kwargs["persistent_workers"] = PERSISTENT_WORKERS
+        kwargs["prefetch_factor"] = PREFETCH_FACTOR
+    return kwargs
+
+def get_device(local_rank=0):
     if torch.cuda.is_available():
-        return torch.device("cuda")
+        return torch.device("cuda", local_rank)
     if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
         return torch.device("mps")
     return torch.device("cpu")
 
+def resolve_precision(precision, device):
+    """Map PRECISION to what `device` supports: fp16 needs CUDA, "auto" picks bf16 on CPU and fp16 on CUDA."""
+    device_type = torch.device(device).type
+    if precision == "auto":
+        return {"cuda": "fp16", "cpu": "bf16"}.get(device_type, "fp32")
+    if precision == "fp16" and device_type != "cuda":
+        print(f"fp16 autocast needs CUDA, using bf16 on {device_type}")
+        return "bf16" if device_type == "cpu" else "fp32"
+    if precision not in ("fp32", "bf16", "fp16"):
+        raise ValueError(f"Unknown precision '{precision}'")
+    return precision
+
+def autocast(device, precision):
+    if precision == "fp32":
+        return nullcontext()
+    dtype = torch.bfloat16 if precision == "bf16" else torch.float16
+    return torch.autocast(device_type=torch.device(device).type, dtype=dtype)
+
+def make_grad_scaler(precision):
+    """Loss scaler for fp16; disabled (a no-op passthrough) otherwise."""
+    return torch.amp.GradScaler("cuda", enabled=precision == "fp16")
+
 def make_transforms(img_size=IMG_SIZE):
     train_transform = transforms.Compose([
         transforms.ToPILImage(),
@@ -60,19 +137,49 @@ def make_transforms(img_size=IMG_SIZE):
     ])
     return train_transform, val_transform
 
-def make_dataloaders(train_transform, val_transform):
-    train_dataset = CancerDataset(training_data, transform=train_transform)
-    val_dataset = CancerDataset(validation_data, transform=val_transform)
+def make_batch_augment(device, seed=SEED):
+    """uint8 dataset transform plus the on-device batch augmentation replacing the PIL pipeline."""
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    return ToUint8Tensor(), BatchAugment(generator=generator).to(device)
+
+def balanced_sample_weights(labels, class_counts):
+    """Per-sample weights 1 / count(class), so each class is drawn equally often."""
+    class_weights = 1.0 / np.maximum(class_counts, 1)
+    return torch.from_numpy(class_weights[labels]).double()
+
+def make_dataloaders(train_transform, val_transform, batch_size=BATCH_SIZE, num_workers=NUM_WORKERS,
+                     device="cpu", root=DATA_ROOT, cache_dir=DATA_CACHE_DIR, seed=SEED, rank=0, world_size=1,
+                     local_rank=0):
+    if cache_dir and world_size > 1:
+        # One builder per host; the other ranks wait, then only map the finished cache
+        if local_rank == 0:
+            for split in ("train", "val"):
+                ensure_split_cache(split, root, cache_dir)
+        barrier()
+    build_cache = world_size == 1
+    train_dataset = CancerDataset("train", transform=train_transform, root=root, cache_dir=cache_dir,
+                                  build_cache=build_cache)
+    val_dataset = CancerDataset("val", transform=val_transform, root=root, cache_dir=cache_dir,
+                                build_cache=build_cache)
 
     # --- Balanced sampler for train ---
-    labels = [y for _, y in train_dataset]
-    class_sample_counts = np.bincount(labels)
-    weights = 1. / class_sample_counts
-    sample_weights = [weights[y] for y in labels]
-    sampler = WeightedRandomSampler(sample_weights, num_samples=len(sample_weights), replacement=True)
-
-    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, sampler=sampler)
-    val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False)
+    sample_weights = balanced_sample_weights(train_dataset.labels, train_dataset.class_counts)
+    if world_size > 1:
+        sampler = DistributedWeightedSampler(sample_weights, rank=rank, world_size=world_size, seed=seed)
+        val_sampler = ShardSampler(len(val_dataset), rank, world_size)
+    else:
+        sampler_generator = torch.Generator()
+        sampler_generator.manual_seed(seed)
+        sampler = WeightedRandomSampler(sample_weights, num_samples=len(sample_weights), replacement=True,
+                                        generator=sampler_generator)
+        val_sampler = None
+
+    # Worker seeds differ per rank so ranks don't repeat each other's augmentation
+    train_loader = DataLoader(train_dataset, batch_size=batch_size, sampler=sampler,
+                              **loader_kwargs(num_workers, device, seed + rank))
+    val_loader = DataLoader(val_dataset, batch_size=batch_size, sampler=val_sampler, shuffle=False,
+                            **loader_kwargs(num_workers, device, seed + rank))
     return train_loader, val_loader, train_dataset
 
 def build_model(model_name, num_classes=2, device="cpu"):
@@ -85,44 +192,169 @@ def build_model(model_name, num_classes=2, device="cpu"):
     model.fc = nn.Linear(in_feats, num_classes)
     return model.to(device)
 
-def evaluate(model, loader, criterion, device):
+def evaluate(model, loader, criterion, device, precision="fp32", channels_last=False):
     model.eval()
     total_loss, total, correct = 0, 0, 0
     with torch.no_grad():
         for x, y in loader:
             x, y = x.to(device), y.to(device)
-            outputs = model(x)
+            if channels_last:
+                x = x.contiguous(memory_format=torch.channels_last)
+            with autocast(device, precision):
+                outputs = model(x)
+            outputs = outputs.float()
             loss = criterion(outputs, y)
             total_loss += loss.item() * x.size(0)
             preds = outputs.argmax(1)
             correct += (preds == y).sum().item()
             total += y.size(0)
+    # Each rank saw a disjoint shard; sum before dividing so every rank gets the global numbers
+    total_loss, correct, total = all_reduce_sum(total_loss, correct, total)
     return total_loss / total, 100.0 * correct / total
 
-def train_one_epoch(model, loader, criterion, optimizer, device):
+def train_one_epoch(model, loader, criterion, optimizer, device, augment=None,
+                    precision="fp32", scaler=None, accum_steps=1, channels_last=False):
+    """
+    One pass over `loader`. The forward runs under autocast for bf16/fp16,
+    and gradients from `accum_steps` micro-batches are summed before each
+    optimizer step. fp16 losses go through `scaler`.
+    """
     model.train()
     total_loss, total, correct = 0, 0, 0
-    for x, y in tqdm(loader, desc="Training", leave=False):
-        x, y = x.to(device), y.to(device)
-        optimizer.zero_grad()
-        outputs = model(x)
-        loss = criterion(outputs, y)
-        loss.backward()
-        optimizer.step()
+    scaler = scaler or make_grad_scaler("fp32")
+    optimizer.zero_grad(set_to_none=True)
+    # Steps after `tail_start` form the last, possibly partial, group; its losses are averaged over its real size
+    num_batches = len(loader)
+    tail_start = num_batches - (num_batches % accum_steps or accum_steps)
+    for step, (x, y) in enumerate(tqdm(loader, desc="Training", leave=False, disable=not is_main_process()), start=1):
+        x, y = x.to(device, non_blocking=True), y.to(device, non_blocking=True)
+        if augment is not None:
+            x = augment(x)
+        if channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        update = step % accum_steps == 0 or step == len(loader)
+        # DDP only needs to all-reduce gradients on the micro-batch that steps the optimizer
+        sync = nullcontext() if update or not hasattr(model, "no_sync") else model.no_sync()
+        with sync:
+            with autocast(device, precision):
+                outputs = model(x)
+            outputs = outputs.float()
+            loss = criterion(outputs, y)
+            group_size = accum_steps if step <= tail_start else num_batches - tail_start
+            scaler.scale(loss / group_size).backward()
+        if update:
+            scaler.step(optimizer)
+            scaler.update()
+            optimizer.zero_grad(set_to_none=True)
         total_loss += loss.item() * x.size(0)
         correct += (outputs.argmax(1) == y).sum().item()
         total += y.size(0)
+    total_loss, correct, total = all_reduce_sum(total_loss, correct, total)
     return total_loss / total, 100.0 * correct / total
 
-def main():
-    seed_everything()
-    device = get_device()
-    print("Using device:", device)
+def train_and_validate_epoch(epoch, model, train_loader, val_loader, criterion, optimizer, scheduler, scaler,
+                             device, augment, precision, checkpointer, best_val_loss, counter):
+    """One epoch of training plus validation, LR scheduling and early stopping.
+    Returns (best_val_loss, counter, stop)."""
+    if hasattr(train_loader.sampler, "set_epoch"):
+        train_loader.sampler.set_epoch(epoch)
+    start = time.perf_counter()
+    train_loss, train_acc = train_one_epoch(model, train_loader, criterion, optimizer, device, augment,
+                                            precision, scaler, ACCUM_STEPS, CHANNELS_LAST)
+    images_per_s = all_reduce_sum(len(train_loader.sampler) / (time.perf_counter() - start))[0]
+    val_loss, val_acc = evaluate(model, val_loader, criterion, device, precision, CHANNELS_LAST)
+
+    print_main(f"Epoch {epoch+1}/{EPOCHS} | Train Loss: {train_loss:.4f} | Train Acc: {train_acc:.2f}% | Val Loss: {val_loss:.4f} | Val Acc: {val_acc:.2f}% | {images_per_s:.1f} img/s")
+
+    scheduler.step(val_loss)
+
+    if val_loss < best_val_loss:
+        best_val_loss = val_loss
+        counter = 0
+        if checkpointer is not None:
+            checkpointer.save_file(unwrap_model(model).state_dict(), BEST_MODEL_PATH)
+        print_main(f"✅ Saved best model at epoch {epoch+1} with Val Acc: {val_acc:.2f}%")
+    else:
+        counter += 1
+        if counter >= PATIENCE:
+            print_main("⏹️ Early stopping triggered")
+            return best_val_loss, counter, True
+    return best_val_loss, counter, False
+
+def training_generators(train_loader, augment=None):
+    """Generators whose state decides the next epoch's sampling, worker seeds and batch augmentation."""
+    return {
+        "sampler": getattr(train_loader.sampler, "generator", None),
+        "loader": train_loader.generator,
+        "augment": augment.generator if augment is not None else None,
+    }
+
+def training_state(epoch, model, optimizer, scheduler, scaler, best_val_loss, counter, generators, finished=False):
+    """Checkpoint contents; a collective call under DDP since the RNG states of every rank are gathered."""
+    return {
+        "epoch": epoch,
+        "model": unwrap_model(model).state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "scheduler": scheduler.state_dict(),
+        "scaler": scaler.state_dict(),
+        "best_val_loss": best_val_loss,
+        "counter": counter,
+        "finished": finished,
+        "rng": all_gather_objects(capture_rng_state(generators)),  # one entry per rank
+    }
+
+def load_resume_state(resume, checkpoint_dir):
+    """
+    (path, state) of the checkpoint to resume from. Only rank 0 reads it and
+    broadcasts it, so under multi-node DDP the checkpoint directory only has
+    to be on rank 0's filesystem.
+    """
+    path = state = error = None
+    if is_main_process():
+        path = latest_checkpoint(checkpoint_dir) if resume == "latest" else resume
+        try:
+            if path is None:
+                raise FileNotFoundError(f"No checkpoint to resume from in {checkpoint_dir}")
+            state = load_checkpoint(path)
+        except Exception as e:
+            error = e
+    path, state, error = broadcast_object((path, state, error))
+    if error is not None:
+        raise error
+    return path, state
+
+def main(resume=None, checkpoint_dir=CHECKPOINT_DIR, checkpoint_every=CHECKPOINT_EVERY, keep=KEEP_CHECKPOINTS):
+    rank, world_size, local_rank = init_distributed(DIST_BACKEND)
+    try:
+        run_training(rank, world_size, local_rank, resume, checkpoint_dir, checkpoint_every, keep)
+    finally:
+        cleanup_distributed()
+
+def run_training(rank, world_size, local_rank, resume, checkpoint_dir, checkpoint_every, keep):
+    seed_everything(SEED + rank)
+    device = get_device(local_rank)
+    print_main("Using device:", device, f"| {world_size} process(es), backend {DIST_BACKEND}" if world_size > 1 else "")
 
     train_tf, val_tf = make_transforms()
-    train_loader, val_loader, _ = make_dataloaders(train_tf, val_tf)
+    augment = None
+    if BATCH_AUGMENT:
+        train_tf, augment = make_batch_augment(device, SEED + rank)
+    precision = resolve_precision(PRECISION, device)
+    micro_batch = max(1, BATCH_SIZE // ACCUM_STEPS)
+    print_main(f"Precision: {precision} | channels_last: {CHANNELS_LAST} | "
+               f"batch {micro_batch} x {ACCUM_STEPS} accumulation steps x {world_size} processes")
+    local_procs = int(os.environ.get("LOCAL_WORLD_SIZE", world_size))
+    num_workers = NUM_WORKERS if world_size == 1 else max(1, NUM_WORKERS // local_procs)
+    train_loader, val_loader, _ = make_dataloaders(train_tf, val_tf, batch_size=micro_batch, num_workers=num_workers,
+                                                   device=device, rank=rank, world_size=world_size,
+                                                   local_rank=local_rank)
+    if PERSISTENT_WORKERS and num_workers > 0:
+        print_main("PERSISTENT_WORKERS is on: resuming from a checkpoint will not be bit-exact")
 
     model = build_model(MODEL_NAME, num_classes=2, device=device)
+    if CHANNELS_LAST:
+        model = model.to(memory_format=torch.channels_last)
+    scaler = make_grad_scaler(precision)
 
     # 🔑 Label smoothing reduces overconfidence
     criterion = nn.CrossEntropyLoss(label_smoothing=0.1)
@@ -131,27 +363,61 @@ def main():
 
     best_val_loss = float("inf")
     counter = 0
+    start_epoch = 0
+    generators = training_generators(train_loader, augment)
 
-    for epoch in range(EPOCHS):
-        train_loss, train_acc = train_one_epoch(model, train_loader, criterion, optimizer, device)
-        val_loss, val_acc = evaluate(model, val_loader, criterion, device)
-
-        print(f"Epoch {epoch+1}/{EPOCHS} | Train Loss: {train_loss:.4f} | Train Acc: {train_acc:.2f}% | Val Loss: {val_loss:.4f} | Val Acc: {val_acc:.2f}%")
+    if resume:
+        path, state = load_resume_state(resume, checkpoint_dir)
+        if state["finished"]:
+            print_main(f"{path} is from a finished run, nothing to resume")
+            return
+        model.load_state_dict(state["model"])
+        optimizer.load_state_dict(state["optimizer"])
+        scheduler.load_state_dict(state["scheduler"])
+        scaler.load_state_dict(state["scaler"])
+        best_val_loss, counter = state["best_val_loss"], state["counter"]
+        start_epoch = state["epoch"] + 1
+        rng = state["rng"]
+        if len(rng) != world_size:
+            print_main(f"Checkpoint has RNG state for {len(rng)} process(es), not {world_size}; "
+                       "every rank resumes from rank 0's")
+        restore_rng_state(rng[rank] if len(rng) == world_size else rng[0], generators)
+        print_main(f"Resumed from {path} at epoch {start_epoch + 1}")
 
-        scheduler.step(val_loss)
+    if world_size > 1:
+        # Wraps the same parameters, so the optimizer built above keeps working
+        model = nn.parallel.DistributedDataParallel(
+            model, device_ids=[local_rank] if device.type == "cuda" else None)
 
-        if val_loss < best_val_loss:
-            best_val_loss = val_loss
-            counter = 0
-            torch.save(model.state_dict(), BEST_MODEL_PATH)
-            print(f"✅ Saved best model at epoch {epoch+1} with Val Acc: {val_acc:.2f}%")
-        else:
-            counter += 1
-            if counter >= PATIENCE:
-                print("⏹️ Early stopping triggered")
+    checkpointer = AsyncCheckpointer(checkpoint_dir, keep=keep) if is_main_process() else None
+    try:
+        for epoch in range(start_epoch, EPOCHS):
+            best_val_loss, counter, stop = train_and_validate_epoch(
+                epoch, model, train_loader, val_loader, criterion, optimizer, scheduler, scaler,
+                device, augment, precision, checkpointer, best_val_loss, counter)
+            finished = stop or epoch + 1 == EPOCHS
+            if (epoch + 1) % checkpoint_every == 0 or finished:
+                state = training_state(epoch, model, optimizer, scheduler, scaler, best_val_loss,
+                                       counter, generators, finished)
+                if checkpointer is not None:
+                    checkpointer.save(state, epoch)
+            if stop:
                 break
+    finally:
+        if checkpointer is not None:
+            checkpointer.close()
+
+    print_main(f"Training done. Best Val Loss: {best_val_loss:.4f}")
 
-    print(f"Training done. Best Val Loss: {best_val_loss:.4f}")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the LifeLens ResNet18 classifier")
+    parser.add_argument("--resume", nargs="?", const="latest", default=None,
+                        help="checkpoint path to resume from (no value: newest in --checkpoint-dir)")
+    parser.add_argument("--checkpoint-dir", default=str(CHECKPOINT_DIR))
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY, help="epochs between checkpoints")
+    parser.add_argument("--keep-checkpoints", type=int, default=KEEP_CHECKPOINTS)
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(args.resume, args.checkpoint_dir, args.checkpoint_every, args.keep_checkpoints)
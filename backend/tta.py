@@ -0,0 +1,119 @@
+"""
+Test-time augmentation (TTA), checkpoint ensembles and temperature scaling.
+
+The views of an image are the symmetries of a square (flips and 90 degree
+rotations). Histology has no preferred orientation. The views of a batch
+are stacked view-major into one (V*N, 3, H, W) tensor, so the model runs
+once per batch rather than once per view. Extra checkpoints of the same
+architecture run together as one vmapped call over their stacked weights.
+Probabilities are averaged over views and models. Their spread is the
+dispersion, and a temperature fitted offline on the validation split
+(calibrate.py) rescales the logits before the softmax.
+"""
+import copy
+import json
+import os
+
+import torch
+import torch.nn.functional as F
+from torch.func import functional_call, stack_module_state
+
+# Ordered so that every prefix is a reasonable subset: flips first, then rotations
+VIEWS = (
+    ("identity", lambda x: x),
+    ("hflip", lambda x: x.flip(3)),
+    ("vflip", lambda x: x.flip(2)),
+    ("rot180", lambda x: x.flip(2, 3)),
+    ("rot90", lambda x: x.rot90(1, (2, 3))),
+    ("rot270", lambda x: x.rot90(3, (2, 3))),
+    ("transpose", lambda x: x.transpose(2, 3)),
+    ("antitranspose", lambda x: x.flip(2, 3).transpose(2, 3)),
+)
+MAX_VIEWS = len(VIEWS)
+
+
+def expand_views(batch, num_views):
+    """(N, 3, H, W) -> (V*N, 3, H, W), view-major; the first N rows are the batch itself."""
+    if not 1 <= num_views <= MAX_VIEWS:
+        raise ValueError(f"num_views must be between 1 and {MAX_VIEWS}")
+    if num_views == 1:
+        return batch
+    return torch.cat([fn(batch) for _, fn in VIEWS[:num_views]])
+
+
+def average_probs(logits, num_views, temperature=1.0):
+    """
+    Mean and standard deviation of the softmax probabilities over views (and
+    models). `logits` is view-major (V*N, C), or (M, V*N, C) for M models.
+    Returns (mean, std), both (N, C).
+    """
+    probs = torch.softmax(logits.float() / temperature, dim=-1)
+    n = probs.shape[-2] // num_views
+    probs = probs.reshape(-1, n, probs.shape[-1])
+    return probs.mean(dim=0), probs.std(dim=0, unbiased=False)
+
+
+class ModelEnsemble:
+    """
+    Several eval-mode copies of one architecture with different weights.
+    Calling it runs all of them in one vmapped forward over their stacked
+    parameters and returns (M, N, C) logits.
+    """
+    def __init__(self, models):
+        self.size = len(models)
+        self.params, self.buffers = stack_module_state(models)
+        # Stateless skeleton; functional_call swaps the stacked weights in
+        self.base = copy.deepcopy(models[0]).to("meta").eval()
+
+    def _call_one(self, params, buffers, x):
+        return functional_call(self.base, (params, buffers), (x,))
+
+    def __call__(self, x):
+        return torch.vmap(self._call_one, in_dims=(0, 0, None))(self.params, self.buffers, x)
+
+
+# ---------- TEMPERATURE SCALING ----------
+
+def fit_temperature(logits, labels, num_views=1, max_iter=100):
+    """
+    Temperature that minimises the NLL of the view-averaged probabilities.
+    `logits` as for average_probs, `labels` (N,) int64.
+    """
+    logits = logits.detach().float()
+    log_t = torch.zeros(1, requires_grad=True)
+    optimizer = torch.optim.LBFGS([log_t], lr=0.1, max_iter=max_iter, line_search_fn="strong_wolfe")
+
+    def closure():
+        optimizer.zero_grad()
+        mean, _ = average_probs(logits, num_views, log_t.exp())
+        loss = F.nll_loss(mean.clamp_min(1e-12).log(), labels)
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    return float(log_t.exp())
+
+
+def load_temperatures(path):
+    """
+    {(ensembled, num_views): temperature} from a calibrate.py output file; {}
+    if there is none. Temperatures are fitted separately for the served model
+    alone and for the ensemble, since averaging models changes the confidence.
+    Files from before the split hold one {views: T} table, which applies to
+    whichever model set they list.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        data = json.load(f)
+    tables = data["temperatures"]
+    if not any(isinstance(t, dict) for t in tables.values()):
+        tables = {"ensemble" if data.get("ensemble") else "single": tables}
+    return {(kind == "ensemble", int(views)): float(t)
+            for kind, table in tables.items() for views, t in table.items()}
+
+
+def temperature_for(temperatures, num_views, ensembled=False):
+    """Temperature fitted for this model set at the largest view count <= num_views, or 1.0 if none was."""
+    fitted = [views for kind, views in temperatures if kind == ensembled and views <= num_views]
+    return temperatures[(ensembled, max(fitted))] if fitted else 1.0
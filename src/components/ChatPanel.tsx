@@ -27,26 +27,60 @@ export default function ChatPanel({
   setHasChatStarted(true);
 
   try {
-    console.log("Sending message to http://localhost:8080/chat");
+    console.log("Sending message to http://localhost:8080/chat/stream");
     
-    const res = await fetch("http://localhost:8080/chat", {
+    const res = await fetch("http://localhost:8080/chat/stream", {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: {
+        "Content-Type": "application/json",
+        ...(sessionStorage.getItem("lifelensSessionId")
+          ? { "X-Session-Id": sessionStorage.getItem("lifelensSessionId") as string }
+          : {}),
+      },
       body: JSON.stringify({ message: input }),
     });
 
     console.log("Response status:", res.status);
     
-    if (!res.ok) {
+    if (!res.ok || !res.body) {
       console.error("HTTP Error:", res.status, res.statusText);
       throw new Error(`HTTP ${res.status}`);
     }
 
-    const data = await res.json();
-    console.log("Bot response:", data);
-    
-    const botMsg = { text: data.reply, sender: "bot" };
-    setMessages((prev) => [...prev, botMsg]);
+    // Add an empty bot message and grow it as Server-Sent Events arrive
+    setMessages((prev) => [...prev, { text: "", sender: "bot" }]);
+    const updateBotMessage = (text: string) =>
+      setMessages((prev) => [...prev.slice(0, -1), { text, sender: "bot" }]);
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let reply = "";
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      const events = buffer.split("\n\n");
+      buffer = events.pop() ?? "";
+      for (const raw of events) {
+        const lines = raw.split("\n");
+        const event = lines.find((l) => l.startsWith("event: "))?.slice(7) ?? "message";
+        const dataLine = lines.find((l) => l.startsWith("data: "));
+        if (!dataLine) continue;
+        const data = JSON.parse(dataLine.slice(6));
+
+        if (event === "error") throw new Error(data.error);
+        if (event === "done") {
+          console.log("Bot response:", data);
+          reply = data.reply;
+        } else {
+          reply += data.token;
+        }
+        updateBotMessage(reply);
+      }
+    }
   } catch (err) {
     console.error("Full error:", err);
     setMessages((prev) => [
@@ -44,16 +44,24 @@ export default function UploadPanel({
     }
   };
 
+  // Backend session token (per-user results and chat history)
+  const sessionHeaders = (): Record<string, string> => {
+    const sessionId = sessionStorage.getItem("lifelensSessionId");
+    return sessionId ? { "X-Session-Id": sessionId } : {};
+  };
+
   const handleCancerTypeChange = async (newType: string) => {
     setCancerType(newType);
     
     // Send cancer type to backend so AI knows what to expect
     try {
-      await fetch("http://127.0.0.1:8000/set-cancer-type", {
+      const res = await fetch("http://127.0.0.1:8000/set-cancer-type", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: { "Content-Type": "application/json", ...sessionHeaders() },
         body: JSON.stringify({ cancerType: newType }),
       });
+      const data = await res.json();
+      if (data.sessionId) sessionStorage.setItem("lifelensSessionId", data.sessionId);
       console.log("Cancer type set on backend:", newType);
     } catch (error) {
       console.error("Error setting cancer type:", error);
@@ -93,11 +101,13 @@ export default function UploadPanel({
       // Step 1: Run prediction on backend
       const response = await fetch("http://127.0.0.1:8080/predict", {
         method: "POST",
+        headers: sessionHeaders(),
         body: formData,
       });
 
       const result = await response.json();
       console.log("Prediction response:", result);
+      if (result.sessionId) sessionStorage.setItem("lifelensSessionId", result.sessionId);
 
       // Update local state with results
       setPrediction(result.diagnosis);